@@ -0,0 +1,305 @@
+"""
+Offline benchmarks of the hashing and comparison paths of dhashpy.
+
+The images are synthetic and generated from fixed seeds, so two runs on the
+same machine measure the same work and no network access is needed.
+
+Image benchmarks, for every size, format and mode of the corpus:
+
+- decode : Image.open() and load() of the encoded bytes.
+- grayscale : convert("L") of the decoded image.
+- resize : LANCZOS resize of the grayscale image to (height + 1, height).
+- bits : Extraction of the hash bits from the resized image.
+- dhash, dhash_fast : DHash.from_bytes() end to end, normal and fast mode.
+
+Comparison benchmarks, for every height:
+
+- sub : DHash.__sub__ between two hashes.
+- hamming_distance : DHash.hamming_distance() of two binary strings.
+- hex2bin : DHash.hex2bin() of a hexadecimal hash.
+- one_to_many : One hash subtracted from a list of hashes, per pair.
+
+Startup benchmarks, each in a new python interpreter:
+
+- import : import dhashpy, it must not import Pillow.
+- import_pillow : import PIL.Image, for reference.
+
+Usage::
+
+    python benchmarks/bench.py -o results.json
+    python benchmarks/bench.py --quick --compare results.json
+
+The dhashpy package of the checkout holding this script is benchmarked. The
+results are written as JSON, with the versions of python, Pillow, NumPy and
+dhashpy, so that runs of different releases can be compared.
+"""
+
+import argparse
+from functools import partial
+import io
+import json
+import operator
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import PIL
+from PIL import Image
+
+# benchmark the dhashpy of this checkout
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from dhashpy import DHash, DHashRecord, vectorized  # noqa: E402
+from dhashpy.__version__ import __version__  # noqa: E402
+from tests.images import make_image  # noqa: E402
+
+SCHEMA_VERSION = 1
+
+SIZES = [(320, 240), (1024, 768), (2048, 1536)]
+QUICK_SIZES = [(160, 120)]
+
+# Modes each format can store, JPEG has neither alpha nor palette.
+FORMATS = {"JPEG": ("RGB",), "PNG": ("RGB", "RGBA", "P"), "WEBP": ("RGB", "RGBA")}
+
+HEIGHTS = [8, 16, 32]
+QUICK_HEIGHTS = [8]
+
+ONE_TO_MANY = 10000
+QUICK_ONE_TO_MANY = 100
+
+
+def encode(image: Any, format: str) -> bytes:
+    """
+    Encode an image with fixed settings.
+    """
+    buffer = io.BytesIO()
+    if format == "PNG":
+        image.save(buffer, format, compress_level=6)
+    else:
+        image.save(buffer, format, quality=90)
+    return buffer.getvalue()
+
+
+def measure(func: Callable[[], Any], repeat: int, min_time: float) -> Dict[str, Any]:
+    """
+    Time func, calling it enough times per repeat to last at least min_time.
+
+    :return: Dict with the min and median seconds per call over the repeats,
+             the number of calls per repeat and the number of repeats.
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2 if elapsed <= 0 else max(2, int(min_time / elapsed * 1.2))
+    timings = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number)
+    return {
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def _decode(data: bytes) -> None:
+    Image.open(io.BytesIO(data)).load()
+
+
+def image_benchmarks(
+    sizes: Sequence[Tuple[int, int]], heights: Sequence[int]
+) -> Iterator[Tuple[str, Dict[str, Any], Callable[[], Any]]]:
+    """
+    Generate the (name, parameters, function) of the image benchmarks.
+    """
+    for width, height in sizes:
+        for format, modes in FORMATS.items():
+            for mode in modes:
+                data = encode(make_image(width, height, mode=mode), format)
+                decoded = Image.open(io.BytesIO(data))
+                decoded.load()
+                params = {
+                    "size": [width, height],
+                    "format": format,
+                    "mode": mode,
+                    "decoded_mode": decoded.mode,
+                    "bytes": len(data),
+                }
+
+                yield "decode", params, partial(_decode, data)
+                yield "grayscale", params, partial(decoded.convert, "L")
+
+                gray = decoded.convert("L")
+                for hash_height in heights:
+                    size = (hash_height + 1, hash_height)
+                    resized = gray.resize(size, Image.LANCZOS)
+                    with_height = dict(params, height=hash_height)
+                    yield "resize", with_height, partial(
+                        gray.resize, size, Image.LANCZOS
+                    )
+                    yield "bits", with_height, partial(DHash._image_to_int, resized)
+                    yield "dhash", with_height, partial(
+                        DHash.from_bytes, data, hash_height
+                    )
+                    yield "dhash_fast", with_height, partial(
+                        DHash.from_bytes, data, hash_height, fast=True
+                    )
+
+
+def _one_to_many(query: DHashRecord, records: List[DHashRecord]) -> None:
+    for record in records:
+        query - record
+
+
+def comparison_benchmarks(
+    heights: Sequence[int], count: int
+) -> Iterator[Tuple[str, Dict[str, Any], Callable[[], Any]]]:
+    """
+    Generate the (name, parameters, function) of the comparison benchmarks.
+    """
+    rng = random.Random(0)
+    for height in heights:
+        bits = height * height
+        records = [DHashRecord(rng.getrandbits(bits), height) for _ in range(count)]
+        a, b = records[0], records[1]
+        params: Dict[str, Any] = {"height": height}
+        yield "sub", params, partial(operator.sub, a, b)
+        yield "hamming_distance", params, partial(
+            DHash.hamming_distance, a.hash, b.hash
+        )
+        yield "hex2bin", params, partial(DHash.hex2bin, a.hash_hex, bits)
+        yield "one_to_many", dict(params, count=count), partial(
+            _one_to_many, a, records
+        )
+
+
+def _import(module: str) -> None:
+    # python -c puts the working directory, the checkout, first in sys.path
+    subprocess.run([sys.executable, "-c", "import %s" % module], cwd=ROOT, check=True)
+
+
+def startup_benchmarks() -> Iterator[Tuple[str, Dict[str, Any], Callable[[], Any]]]:
+    """
+    Generate the (name, parameters, function) of the startup benchmarks.
+    """
+    yield "import", {}, partial(_import, "dhashpy")
+    yield "import_pillow", {}, partial(_import, "PIL.Image")
+
+
+def environment() -> Dict[str, Any]:
+    """
+    Versions and platform the benchmarks ran on.
+    """
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "dhashpy": __version__,
+        "pillow": PIL.__version__,
+        "numpy": getattr(vectorized.numpy, "__version__", None),
+    }
+
+
+def _key(result: Dict[str, Any]) -> str:
+    params = ", ".join(
+        "%s=%s" % (name, result[name])
+        for name in ("format", "mode", "size", "height", "count")
+        if name in result
+    )
+    return "%s/%s(%s)" % (result["group"], result["name"], params)
+
+
+def run(quick: bool = False, repeat: int = 5, min_time: float = 0.05) -> Dict[str, Any]:
+    """
+    Run all the benchmarks.
+
+    :param quick: Small corpus and a single height, for smoke testing.
+
+    :param repeat: Number of timed repeats of every benchmark.
+
+    :param min_time: Minimum duration of a repeat in seconds.
+
+    :return: The JSON serializable results.
+    """
+    sizes = QUICK_SIZES if quick else SIZES
+    heights = QUICK_HEIGHTS if quick else HEIGHTS
+    count = QUICK_ONE_TO_MANY if quick else ONE_TO_MANY
+    benchmarks = [
+        ("image", image_benchmarks(sizes, heights)),
+        ("compare", comparison_benchmarks(heights, count)),
+        ("startup", startup_benchmarks()),
+    ]
+    results = []
+    for group, generator in benchmarks:
+        for name, params, func in generator:
+            result = dict(params, group=group, name=name)
+            result.update(measure(func, repeat, min_time))
+            result["key"] = _key(result)
+            sys.stderr.write("%-70s %12.2f us\n" % (result["key"], result["min"] * 1e6))
+            results.append(result)
+    return {
+        "schema": SCHEMA_VERSION,
+        "environment": environment(),
+        "settings": {"quick": quick, "repeat": repeat, "min_time": min_time},
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """
+    Lines comparing the min timings of two runs, for the benchmarks in both.
+    """
+    before = {result["key"]: result["min"] for result in baseline["results"]}
+    lines = []
+    for result in current["results"]:
+        if result["key"] in before and before[result["key"]] > 0:
+            lines.append(
+                "%-70s %7.2fx" % (result["key"], result["min"] / before[result["key"]])
+            )
+    return lines
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("-o", "--output", help="JSON output file, stdout if unset.")
+    parser.add_argument("--quick", action="store_true", help="Small corpus only.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.05)
+    parser.add_argument(
+        "--compare", help="Previous JSON output, print the ratios of the timings."
+    )
+    args = parser.parse_args(argv)
+
+    results = run(args.quick, args.repeat, args.min_time)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        sys.stderr.write("\ncurrent / baseline min time:\n")
+        for line in compare(results, baseline):
+            sys.stderr.write(line + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
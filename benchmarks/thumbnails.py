@@ -0,0 +1,141 @@
+"""
+Agreement and speed of the EXIF thumbnail mode on a local corpus of images.
+
+Every image under the corpus directories is hashed twice, from the image
+and with DHash(path, thumbnail=True), and the script reports:
+
+- sources : How many images were hashed from their thumbnail, the others
+  have no usable thumbnail and were decoded in both modes.
+- agreement : For the images hashed from their thumbnail, the share whose
+  thumbnail hash is within 0, 2, 4 and --threshold bits of the image hash,
+  and the mean and max distances.
+- time : Total seconds spent in each mode, and the speedup of the
+  thumbnail mode on the images it hashed from their thumbnail.
+
+Usage::
+
+    python benchmarks/thumbnails.py ~/Pictures/camera -o thumbnails.json
+    python benchmarks/thumbnails.py uploads/ --height 16 --threshold 6
+
+The results are written as JSON, with the environment block of bench.py.
+The paths of the images whose hashes disagree by more than --threshold bits
+are listed, to inspect them.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+# benchmark the dhashpy of this checkout
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench import SCHEMA_VERSION, environment  # noqa: E402
+from dhashpy import DHash  # noqa: E402
+from dhashpy.scanner import iter_files  # noqa: E402
+
+PATTERNS = ("*.jpg", "*.jpeg", "*.tif", "*.tiff", "*.webp")
+
+WITHIN = (0, 2, 4)
+
+
+def _hash(path: str, height: int, thumbnail: bool) -> Any:
+    start = time.perf_counter()
+    dhash = DHash(path, height, thumbnail=thumbnail)
+    return dhash, time.perf_counter() - start
+
+
+def run(roots: Sequence[str], height: int = 8, threshold: int = 6) -> Dict[str, Any]:
+    """
+    Hash every image of the corpus in both modes.
+
+    :return: Dict of the results, see the module docstring.
+    """
+    counts = {"images": 0, "thumbnail": 0, "image": 0, "errors": 0}
+    distances: List[int] = []
+    disagree: List[Dict[str, Any]] = []
+    image_time = thumbnail_time = 0.0
+    # time of both modes on the images hashed from their thumbnail
+    hit_image_time = hit_thumbnail_time = 0.0
+    for root in roots:
+        for path in iter_files(root, PATTERNS):
+            counts["images"] += 1
+            try:
+                exact, exact_seconds = _hash(path, height, False)
+                fast, fast_seconds = _hash(path, height, True)
+            except Exception:
+                counts["errors"] += 1
+                continue
+            image_time += exact_seconds
+            thumbnail_time += fast_seconds
+            counts[fast.source] += 1
+            if fast.source != "thumbnail":
+                continue
+            hit_image_time += exact_seconds
+            hit_thumbnail_time += fast_seconds
+            distance = fast - exact
+            distances.append(distance)
+            if distance > threshold:
+                disagree.append({"path": path, "distance": distance})
+
+    agreement: Dict[str, Any] = {"compared": len(distances)}
+    for bits in sorted(set(WITHIN + (threshold,))):
+        agreement["within_%d" % bits] = (
+            sum(distance <= bits for distance in distances) / len(distances)
+            if distances
+            else None
+        )
+    agreement["mean"] = statistics.mean(distances) if distances else None
+    agreement["max"] = max(distances) if distances else None
+    return {
+        "schema": SCHEMA_VERSION,
+        "environment": environment(),
+        "height": height,
+        "threshold": threshold,
+        "sources": counts,
+        "agreement": agreement,
+        "time": {
+            "image": image_time,
+            "thumbnail": thumbnail_time,
+            "speedup": (
+                hit_image_time / hit_thumbnail_time if hit_thumbnail_time else None
+            ),
+        },
+        "disagree": disagree,
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("roots", nargs="+", help="Directories of the corpus.")
+    parser.add_argument("-o", "--output", help="JSON output file, stdout if unset.")
+    parser.add_argument("--height", type=int, default=8)
+    parser.add_argument(
+        "--threshold",
+        type=int,
+        default=6,
+        help="Distance above which the paths of an image is listed.",
+    )
+    args = parser.parse_args(argv)
+
+    results = run(args.roots, args.height, args.threshold)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
+    sources = results["sources"]
+    sys.stderr.write(
+        "%d images, %d hashed from their thumbnail, %d errors\n"
+        % (sources["images"], sources["thumbnail"], sources["errors"])
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
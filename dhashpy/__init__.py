@@ -1,4 +1,18 @@
-from .dHash import DHash
+import importlib
+import sys
+from typing import Any, List, TYPE_CHECKING
+
+from .dHash import DHash, DHashRecord
+from .hashes import bin2hex, hamming_distance, hex2bin
+from .instrument import HashEvent, HashStats, add_hook, remove_hook
+from .vectorized import hash_array, hash_array_batch
+from .index import DHashIndex
+from .compare import distances, pack_words, within
+from .serialize import pack_hashes, unpack_hashes
+from .cluster import ClusterResult, cluster
+from .store import HashStore, HashStoreWriter
+from .multiindex import MultiIndex, MultiIndexResult
+from .persistent import PersistentIndex
 
 from .__version__ import (
     __title__,
@@ -10,3 +24,50 @@ from .__version__ import (
     __license__,
     __copyright__,
 )
+
+# Imported on first access, they import worker pools, sqlite3, asyncio,
+# http.client or shared memory that most programs do not need.
+_LAZY = {
+    "HashResult": ".batch",
+    "hash_many": ".batch",
+    "Budget": ".budget",
+    "hash_variants": ".variants",
+    "FrameHash": ".frames",
+    "iter_frames": ".frames",
+    "sequence_signature": ".frames",
+    "HashCache": ".cache",
+    "SharedHashStore": ".shared",
+    "URLHasher": ".fetch",
+    "ahash": ".aio",
+    "ahash_stream": ".aio",
+    "scan": ".scanner",
+}
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .batch import HashResult, hash_many
+    from .budget import Budget
+    from .variants import hash_variants
+    from .frames import FrameHash, iter_frames, sequence_signature
+    from .cache import HashCache
+    from .shared import SharedHashStore
+    from .fetch import URLHasher
+    from .aio import ahash, ahash_stream
+    from .scanner import scan
+
+
+def __getattr__(name: str) -> Any:
+    if name not in _LAZY:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    value = getattr(importlib.import_module(_LAZY[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(_LAZY))
+
+
+if sys.version_info < (3, 7):  # pragma: no cover
+    # module __getattr__ is new in Python 3.7
+    for _name in _LAZY:
+        __getattr__(_name)
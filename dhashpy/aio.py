@@ -0,0 +1,125 @@
+"""
+asyncio interface, the images are decoded and hashed in an executor so the
+event loop is not blocked.
+"""
+
+import asyncio
+from concurrent.futures import Executor
+import functools
+from typing import Any, AsyncIterator, Dict, Iterable, Optional, Set, Union
+
+from .batch import HashResult, _hash_one
+from .cache import HashCache
+from .dHash import DHash
+
+
+async def ahash(
+    path: str,
+    height: int = 8,
+    fast: bool = False,
+    cache: Optional[HashCache] = None,
+    executor: Optional[Executor] = None,
+) -> DHash:
+    """
+    Hash an image in an executor and await the result.
+
+    :param path: Path of the image.
+
+    :param height: The height used for hashing, see DHash.__init__.
+
+    :param fast: Use the fast mode, see DHash.__init__.
+
+    :param cache: Optional HashCache.
+
+    :param executor: A ThreadPoolExecutor or ProcessPoolExecutor, None for the
+                     default executor of the event loop.
+
+    :return: The DHash of the image.
+
+    :rtype: DHash
+    """
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(
+        executor, functools.partial(DHash, path, height, fast, cache)
+    )
+
+
+async def _aiter(
+    source: Union[Iterable[str], AsyncIterator[str]],
+) -> AsyncIterator[str]:
+    if hasattr(source, "__aiter__"):
+        async for path in source:  # type: ignore[union-attr]
+            yield path
+    else:
+        for path in source:  # type: ignore[union-attr]
+            yield path
+
+
+def ahash_stream(
+    source: Union[Iterable[str], AsyncIterator[str]],
+    concurrency: int = 4,
+    height: int = 8,
+    fast: bool = False,
+    cache: Optional[HashCache] = None,
+    executor: Optional[Executor] = None,
+) -> AsyncIterator[HashResult]:
+    """
+    Hash the images of an iterable or async iterable of paths, with at most
+    concurrency images in the executor at once.
+
+    The source is only read when there is room for another image, so a slow
+    consumer holds back the source. Results are yielded as they complete and
+    failures are reported in HashResult.error. If the consumer stops early
+    or is cancelled, the images not yet started are cancelled.
+
+    :param source: Iterable or async iterable of image paths.
+
+    :param concurrency: Maximum number of images being hashed at once.
+
+    :param height: The height used for hashing, see DHash.__init__.
+
+    :param fast: Use the fast mode, see DHash.__init__.
+
+    :param cache: Optional HashCache.
+
+    :param executor: A ThreadPoolExecutor or ProcessPoolExecutor, None for the
+                     default executor of the event loop.
+
+    :return: Async iterator of HashResult, one per path.
+
+    :rtype: AsyncIterator[HashResult]
+
+    :raises ValueError: If concurrency is less than 1.
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1.")
+    options = {"height": height, "fast": fast, "cache": cache}
+    return _ahash_stream(source, concurrency, options, executor)
+
+
+async def _ahash_stream(
+    source: Union[Iterable[str], AsyncIterator[str]],
+    concurrency: int,
+    options: Dict[str, Any],
+    executor: Optional[Executor],
+) -> AsyncIterator[HashResult]:
+    loop = asyncio.get_event_loop()
+    pending: Set["asyncio.Future[HashResult]"] = set()
+    try:
+        async for path in _aiter(source):
+            pending.add(loop.run_in_executor(executor, _hash_one, path, options))
+            if len(pending) >= concurrency:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for future in done:
+                    yield future.result()
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for future in done:
+                yield future.result()
+    finally:
+        for future in pending:
+            future.cancel()
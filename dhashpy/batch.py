@@ -0,0 +1,187 @@
+"""
+Batch hashing of many images over a pool of worker processes.
+"""
+
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    as_completed,
+    wait,
+)
+import os
+from typing import (
+    Any,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    TYPE_CHECKING,
+)
+
+from .cache import HashCache
+from .dHash import DHash, DHashRecord
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .budget import Budget
+
+
+class HashResult(NamedTuple):
+    """
+    Outcome of hashing a single path in a batch.
+
+    - HashResult.path : The input path.
+
+    - HashResult.record : DHashRecord of the image, None if hashing failed.
+
+    - HashResult.error : The exception raised while hashing, None on success.
+    """
+
+    path: str
+    record: Optional[DHashRecord]
+    error: Optional[BaseException]
+
+    @property
+    def ok(self) -> bool:
+        """
+        True if the path was hashed without error.
+        """
+        return self.error is None
+
+
+def _hash_one(path: str, options: Dict[str, Any]) -> HashResult:
+    """
+    Hash a single path, any exception is returned in the result.
+    """
+    try:
+        return HashResult(path, DHash(path, **options).to_record(), None)
+    except Exception as e:
+        return HashResult(path, None, e)
+
+
+def _hash_chunk(paths: List[str], options: Dict[str, Any]) -> List[HashResult]:
+    """
+    Hash a chunk of paths in a worker process.
+    """
+    return [_hash_one(path, options) for path in paths]
+
+
+def _chunks(paths: Iterable[str], chunksize: int) -> Iterator[List[str]]:
+    chunk: List[str] = []
+    for path in paths:
+        chunk.append(path)
+        if len(chunk) >= chunksize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def hash_many(
+    paths: Iterable[str],
+    height: int = 8,
+    workers: Optional[int] = None,
+    chunksize: int = 16,
+    ordered: bool = True,
+    fast: bool = False,
+    cache: Optional[HashCache] = None,
+    budget: Optional["Budget"] = None,
+) -> Iterator[HashResult]:
+    """
+    Hash many images in parallel over a ProcessPoolExecutor.
+
+    Decoding, grayscaling, resizing and the hash calculation all run in the
+    worker processes, only the compact DHashRecord is sent back. The paths
+    are consumed lazily and at most a few chunks per worker are in flight,
+    so very long iterables can be hashed with bounded memory.
+
+    Failures are reported per path, an image that can not be hashed does not
+    stop the batch.
+
+    :param paths: Iterable of image paths.
+
+    :param height: The height used for hashing, same as for DHash.
+
+    :param workers: Number of worker processes, defaults to os.cpu_count().
+                    If 0 the images are hashed in the calling process.
+
+    :param chunksize: Number of paths sent to a worker at once.
+
+    :param ordered: If True the results are yielded in input order, else
+                    they are yielded as soon as their chunk completes.
+
+    :param fast: Use the fast decode mode of DHash, see DHash.__init__.
+
+    :param cache: Optional HashCache, unchanged files already in the cache
+                  are not hashed again. The worker processes read and
+                  update the cache themselves.
+
+    :param budget: Optional Budget limiting the resources of every image.
+                   An image over a limit fails, the others are hashed. With
+                   a timeout or max_memory, every worker process hashes one
+                   image at a time, chunksize is ignored, and a worker that
+                   runs out of time or memory or dies is replaced.
+
+    :return: Iterator of HashResult, one per input path.
+
+    :rtype: Iterator[HashResult]
+
+    :raises ValueError: If workers is negative or chunksize is less than 1,
+                        or budget has a timeout or max_memory and workers
+                        is 0.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers < 0:
+        raise ValueError("workers must be a non-negative integer.")
+    if chunksize < 1:
+        raise ValueError("chunksize must be at least 1.")
+    options = {"height": height, "fast": fast, "cache": cache, "budget": budget}
+    if budget is not None and budget.isolated:
+        from .budget import _check_budget, _hash_supervised
+
+        if workers == 0:
+            raise ValueError("The timeout and max_memory budgets need workers.")
+        _check_budget(budget)
+        return _hash_supervised(paths, options, workers, ordered)
+    return _hash_many(paths, options, workers, chunksize, ordered)
+
+
+def _hash_many(
+    paths: Iterable[str],
+    options: Dict[str, Any],
+    workers: int,
+    chunksize: int,
+    ordered: bool,
+) -> Iterator[HashResult]:
+    if workers == 0:
+        for path in paths:
+            yield _hash_one(path, options)
+        return
+
+    max_in_flight = workers * 4
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunks = _chunks(paths, chunksize)
+        if ordered:
+            queue: Deque[Future] = deque()
+            for chunk in chunks:
+                queue.append(executor.submit(_hash_chunk, chunk, options))
+                if len(queue) >= max_in_flight:
+                    yield from queue.popleft().result()
+            while queue:
+                yield from queue.popleft().result()
+        else:
+            pending: Set[Future] = set()
+            for chunk in chunks:
+                pending.add(executor.submit(_hash_chunk, chunk, options))
+                if len(pending) >= max_in_flight:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from future.result()
+            for future in as_completed(pending):
+                yield from future.result()
@@ -0,0 +1,329 @@
+"""
+Per-image resource budgets, and the supervised worker processes hash_many
+enforces the timeout and memory budgets in.
+"""
+
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+from multiprocessing.connection import Connection, wait
+import os
+import signal
+import time
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    TYPE_CHECKING,
+)
+
+from .batch import HashResult, _hash_one
+
+if TYPE_CHECKING:  # pragma: no cover
+    from PIL import Image
+
+try:
+    import resource
+except ImportError:  # pragma: no cover, Windows
+    resource = None  # type: ignore[assignment]
+
+
+def decoded_size(image: "Image.Image") -> int:
+    """
+    Bytes Pillow allocates for the decoded image, from its header only.
+
+    :param image: An opened image, loaded or not.
+
+    :return: Width times height times the bytes Pillow stores per pixel, 1
+             for the "1", "L" and "P" modes, 2 for 16 bits modes, else 4.
+
+    :rtype: int
+    """
+    if image.mode in ("1", "L", "P"):
+        pixel_size = 1
+    elif image.mode.startswith("I;16"):
+        pixel_size = 2
+    else:
+        pixel_size = 4
+    return image.width * image.height * pixel_size
+
+
+class Budget(NamedTuple):
+    """
+    Resource limits for hashing a single image, any of them may be None.
+
+    - Budget.max_pixels : Maximum width times height of the image.
+
+    - Budget.max_decoded_bytes : Maximum size of the decoded image, see
+      decoded_size(). Both limits are checked from the image header,
+      before decoding, and raise PIL.Image.DecompressionBombError.
+
+    - Budget.timeout : Seconds a worker process may spend on one image,
+      the worker is killed and replaced past it and the image fails with
+      TimeoutError.
+
+    - Budget.max_memory : Bytes of address space a worker process may grow
+      by, set with resource.setrlimit(RLIMIT_AS). An image going over it
+      fails with MemoryError, and the worker is replaced. Linux only.
+
+    The timeout and max_memory budgets need the worker processes of
+    hash_many, DHash only checks max_pixels and max_decoded_bytes.
+    """
+
+    max_pixels: Optional[int] = None
+    max_decoded_bytes: Optional[int] = None
+    timeout: Optional[float] = None
+    max_memory: Optional[int] = None
+
+    @property
+    def isolated(self) -> bool:
+        """
+        True if the budget needs supervised worker processes.
+        """
+        return self.timeout is not None or self.max_memory is not None
+
+    def check(self, image: "Image.Image") -> None:
+        """
+        Check an opened image against max_pixels and max_decoded_bytes.
+
+        :param image: The opened image, it is not decoded.
+
+        :return: None
+
+        :rtype: NoneType
+
+        :raises PIL.Image.DecompressionBombError: If a limit is exceeded.
+        """
+        from PIL import Image
+
+        pixels = image.width * image.height
+        if self.max_pixels is not None and pixels > self.max_pixels:
+            raise Image.DecompressionBombError(
+                "Image of %dx%d pixels is over the budget of %d pixels."
+                % (image.width, image.height, self.max_pixels)
+            )
+        if self.max_decoded_bytes is not None:
+            size = decoded_size(image)
+            if size > self.max_decoded_bytes:
+                raise Image.DecompressionBombError(
+                    "Decoding the %dx%d %s image takes %d bytes, over the budget "
+                    "of %d bytes."
+                    % (
+                        image.width,
+                        image.height,
+                        image.mode,
+                        size,
+                        self.max_decoded_bytes,
+                    )
+                )
+
+
+def _address_space() -> int:
+    """
+    Current virtual memory size of this process, 0 if it is unknown.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _limit_memory(max_memory: int) -> None:
+    """
+    Limit the address space of this process to its current size plus
+    max_memory.
+    """
+    from PIL import Image
+
+    # load the image plugins before measuring, they stay loaded
+    Image.init()
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    limit = _address_space() + max_memory
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def _worker(connection: Connection, options: Dict[str, Any]) -> None:
+    """
+    Hash the paths received on connection until it is closed, send back a
+    (position, HashResult) for each. Exit after a MemoryError, the memory
+    of the process may be fragmented.
+    """
+    budget = options["budget"]
+    if budget.max_memory is not None:
+        _limit_memory(budget.max_memory)
+    while True:
+        try:
+            task = connection.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        position, path = task
+        result = _hash_one(path, options)
+        try:
+            connection.send((position, result))
+        except Exception as e:
+            # the exception of the result could not be pickled
+            connection.send((position, HashResult(path, None, RuntimeError(repr(e)))))
+        if isinstance(result.error, MemoryError):
+            return
+
+
+class _Worker(object):
+    """
+    A worker process and the path it is hashing.
+    """
+
+    def __init__(self, context: Any, options: Dict[str, Any]) -> None:
+        self.connection, child = context.Pipe()
+        self.process = context.Process(
+            target=_worker, args=(child, options), daemon=True
+        )
+        self.process.start()
+        child.close()
+        self.task: Optional[Tuple[int, str]] = None
+        self.started = 0.0
+
+    def send(self, position: int, path: str) -> None:
+        self.task = position, path
+        self.started = time.monotonic()
+        self.connection.send(self.task)
+
+    def stop(self, kill: bool = False) -> None:
+        if kill:
+            # Process.kill() is new in Python 3.7, terminate() kills on Windows
+            if hasattr(signal, "SIGKILL"):
+                try:
+                    os.kill(self.process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+            else:
+                self.process.terminate()
+        else:
+            try:
+                self.connection.send(None)
+            except OSError:
+                pass
+        self.process.join()
+        self.connection.close()
+
+
+def _check_budget(budget: Budget) -> None:
+    if budget.max_memory is not None and resource is None:
+        raise ValueError("max_memory needs the resource module, not on Windows.")
+
+
+def _hash_supervised(
+    paths: Iterable[str],
+    options: Dict[str, Any],
+    workers: int,
+    ordered: bool,
+) -> Iterator[HashResult]:
+    """
+    Hash paths one at a time in worker processes, replacing a worker that
+    runs out of time or memory or dies, see Budget.
+    """
+    budget: Budget = options["budget"]
+    context = multiprocessing.get_context()
+    pool = [_Worker(context, options) for _ in range(workers)]
+    max_in_flight = workers * 4
+    source = iter(paths)
+    exhausted = False
+    submitted = 0
+    next_position = 0
+    done: Dict[int, HashResult] = {}
+
+    def replace(worker: _Worker, kill: bool) -> None:
+        worker.stop(kill)
+        pool[pool.index(worker)] = _Worker(context, options)
+
+    try:
+        while True:
+            for worker in pool:
+                if worker.task is not None or exhausted:
+                    continue
+                if submitted - next_position >= max_in_flight:
+                    break
+                try:
+                    path = next(source)
+                except StopIteration:
+                    exhausted = True
+                    break
+                worker.send(submitted, path)
+                submitted += 1
+
+            busy = [worker for worker in pool if worker.task is not None]
+            if not busy:
+                break
+
+            timeout = None
+            if budget.timeout is not None:
+                deadline = min(worker.started for worker in busy) + budget.timeout
+                timeout = max(0.0, deadline - time.monotonic())
+            ready = wait(
+                [worker.connection for worker in busy]
+                + [worker.process.sentinel for worker in busy],
+                timeout,
+            )
+
+            finished: List[HashResult] = []
+            for worker in busy:
+                assert worker.task is not None
+                position, path = worker.task
+                result: Optional[HashResult] = None
+                if worker.connection in ready or worker.process.sentinel in ready:
+                    try:
+                        position, result = worker.connection.recv()
+                    except (EOFError, OSError):
+                        worker.process.join(1)
+                        result = HashResult(
+                            path,
+                            None,
+                            BrokenProcessPool(
+                                "Worker exited with code %s while hashing '%s'."
+                                % (worker.process.exitcode, path)
+                            ),
+                        )
+                    worker.task = None
+                    if not worker.process.is_alive() or isinstance(
+                        result.error, (MemoryError, BrokenProcessPool)
+                    ):
+                        replace(worker, kill=False)
+                elif (
+                    budget.timeout is not None
+                    and time.monotonic() - worker.started > budget.timeout
+                ):
+                    result = HashResult(
+                        path,
+                        None,
+                        TimeoutError(
+                            "Hashing '%s' took longer than %s seconds."
+                            % (path, budget.timeout)
+                        ),
+                    )
+                    worker.task = None
+                    replace(worker, kill=True)
+                if result is not None:
+                    if ordered:
+                        done[position] = result
+                    else:
+                        finished.append(result)
+
+            if ordered:
+                while next_position in done:
+                    yield done.pop(next_position)
+                    next_position += 1
+            else:
+                for result in finished:
+                    next_position += 1
+                    yield result
+    finally:
+        for worker in pool:
+            worker.stop(kill=worker.task is not None)
@@ -0,0 +1,293 @@
+"""
+Persistent on-disk cache of computed hashes, keyed by file identity.
+"""
+
+import os
+import sqlite3
+import threading
+from typing import Any, Optional, Tuple
+
+# Bump when a change to the algorithm changes the hash of an image, so the
+# hashes cached by older versions are not used.
+ALGORITHM_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS hashes (
+    realpath TEXT NOT NULL,
+    height INTEGER NOT NULL,
+    algorithm TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash BLOB NOT NULL,
+    accessed INTEGER NOT NULL,
+    PRIMARY KEY (realpath, height, algorithm)
+);
+CREATE INDEX IF NOT EXISTS hashes_accessed ON hashes (accessed);
+"""
+
+
+def _algorithm(fast: bool) -> str:
+    return "row-v%d%s" % (ALGORITHM_VERSION, "-fast" if fast else "")
+
+
+class HashCache(object):
+    """
+    HashCache class
+    ================
+    A SQLite backed cache of computed hashes. An entry is keyed by the real
+    path of the image, its size and modification time in nanoseconds, the
+    height and the algorithm version. A changed file is a cache miss and its
+    stale entry is replaced the next time it is hashed.
+
+    Pass the cache to DHash or DHash.hash_many to skip hashing unchanged
+    files. The cache can be shared by several processes and threads, each
+    thread of each process opens its own connection to the database file.
+
+    - HashCache.get(image_path, height, fast) : Cached hash or None.
+
+    - HashCache.put(image_path, hash_int, height, fast) : Store a hash.
+
+    - HashCache.invalidate(image_path) : Remove the entries of an image.
+
+    - HashCache.evict() : Evict the least recently used entries.
+
+    - HashCache.clear() : Remove all the entries.
+    """
+
+    def __init__(self, path: str, max_entries: Optional[int] = None) -> None:
+        """
+
+        :param path: Path of the SQLite database file, created if missing.
+
+        :param max_entries: Maximum number of cached hashes. When exceeded the
+                            least recently used entries are evicted, see
+                            HashCache.evict(). None for no limit.
+
+        :return: None
+
+        :rtype: NoneType
+
+        :raises ValueError: If max_entries is less than 1.
+        """
+        if max_entries is not None and max_entries < 1:
+            raise ValueError("max_entries must be at least 1.")
+        self.path = path
+        self.max_entries = max_entries
+        # the connection of every thread, with the pid that opened it
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._clock = 0
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        # Connections can not be shared with other processes, a worker process
+        # opens its own connection to the same file.
+        return (HashCache, (self.path, self.max_entries))
+
+    def __len__(self) -> int:
+        """
+        Number of cached hashes.
+        """
+        return self._db().execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
+
+    def _db(self) -> sqlite3.Connection:
+        local = self._local
+        # a forked process inherits the connection of the forking thread
+        if getattr(local, "pid", None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(_SCHEMA)
+            clock = connection.execute(
+                "SELECT COALESCE(MAX(accessed), 0) FROM hashes"
+            ).fetchone()[0]
+            with self._lock:
+                self._clock = max(self._clock, clock)
+            local.connection = connection
+            local.pid = os.getpid()
+        return local.connection
+
+    def _tick(self) -> int:
+        with self._lock:
+            self._clock += 1
+            return self._clock
+
+    def close(self) -> None:
+        """
+        Close the database connection of the calling thread. The cache can
+        still be used, the connection is opened again when needed. The
+        connections of other threads are closed when their thread ends.
+        """
+        local = self._local
+        if getattr(local, "pid", None) == os.getpid():
+            local.connection.close()
+        local.connection = local.pid = None
+
+    def __enter__(self) -> "HashCache":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    @staticmethod
+    def file_key(image_path: str) -> Tuple[str, int, int]:
+        """
+        Identity of the file at image_path.
+
+        :param image_path: Path of the image.
+
+        :return: Tuple of the real path, the size and the modification time
+                 in nanoseconds.
+
+        :rtype: tuple
+
+        :raises FileNotFoundError: If there is no file at image_path.
+        """
+        stat = os.stat(image_path)
+        return os.path.realpath(image_path), stat.st_size, stat.st_mtime_ns
+
+    def get(
+        self,
+        image_path: str,
+        height: int = 8,
+        fast: bool = False,
+        file_key: Optional[Tuple[str, int, int]] = None,
+    ) -> Optional[int]:
+        """
+        Look up the cached hash of an image.
+
+        :param image_path: Path of the image.
+
+        :param height: The height used for hashing.
+
+        :param fast: True for hashes computed in the fast mode.
+
+        :param file_key: The HashCache.file_key() of image_path, if the caller
+                         already has it.
+
+        :return: The cached hash as an integer, None on a miss or if the file
+                 changed since it was cached.
+
+        :rtype: int or None
+        """
+        realpath, size, mtime_ns = file_key or HashCache.file_key(image_path)
+        db = self._db()
+        row = db.execute(
+            "SELECT size, mtime_ns, hash FROM hashes"
+            " WHERE realpath = ? AND height = ? AND algorithm = ?",
+            (realpath, height, _algorithm(fast)),
+        ).fetchone()
+        if row is None or row[0] != size or row[1] != mtime_ns:
+            return None
+        with db:
+            db.execute(
+                "UPDATE hashes SET accessed = ?"
+                " WHERE realpath = ? AND height = ? AND algorithm = ?",
+                (self._tick(), realpath, height, _algorithm(fast)),
+            )
+        return int.from_bytes(row[2], "big")
+
+    def put(
+        self,
+        image_path: str,
+        hash_int: int,
+        height: int = 8,
+        fast: bool = False,
+        file_key: Optional[Tuple[str, int, int]] = None,
+    ) -> None:
+        """
+        Store the hash of an image, replacing any older entry.
+
+        :param image_path: Path of the image.
+
+        :param hash_int: The hash as an integer.
+
+        :param height: The height used for hashing.
+
+        :param fast: True for hashes computed in the fast mode.
+
+        :param file_key: The HashCache.file_key() of image_path taken before
+                         the image was read. Pass it so that a file modified
+                         while it was hashed is not cached with the new
+                         modification time.
+
+        :return: None
+
+        :rtype: NoneType
+        """
+        realpath, size, mtime_ns = file_key or HashCache.file_key(image_path)
+        hash_bytes = hash_int.to_bytes((height * height + 7) // 8, "big")
+        db = self._db()
+        with db:
+            cursor = db.execute(
+                "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    realpath,
+                    height,
+                    _algorithm(fast),
+                    size,
+                    mtime_ns,
+                    hash_bytes,
+                    self._tick(),
+                ),
+            )
+        if self.max_entries is not None:
+            # a new row gets the largest rowid plus one, so this holds for one
+            # row in every step inserted by any process or thread, however
+            # short lived the HashCache objects of the workers are
+            step = max(1, min(1000, self.max_entries // 100))
+            if cursor.lastrowid is not None and cursor.lastrowid % step == 0:
+                self.evict()
+
+    def evict(self) -> int:
+        """
+        Evict the least recently used entries above max_entries.
+
+        put() calls this every max_entries / 100 (at most 1000) rows
+        inserted in the database, by all the processes and threads using
+        it, so the cache can exceed max_entries by about that many entries
+        in between.
+
+        :return: Number of evicted entries.
+
+        :rtype: int
+        """
+        if self.max_entries is None:
+            return 0
+        db = self._db()
+        with db:
+            count = db.execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
+            if count <= self.max_entries:
+                return 0
+            db.execute(
+                "DELETE FROM hashes WHERE rowid IN ("
+                " SELECT rowid FROM hashes ORDER BY accessed LIMIT ?)",
+                (count - self.max_entries,),
+            )
+        return count - self.max_entries
+
+    def invalidate(self, image_path: str) -> int:
+        """
+        Remove all the cached hashes of an image, for all heights and modes.
+        The file does not need to exist anymore.
+
+        :param image_path: Path of the image.
+
+        :return: Number of removed entries.
+
+        :rtype: int
+        """
+        db = self._db()
+        with db:
+            cursor = db.execute(
+                "DELETE FROM hashes WHERE realpath = ?",
+                (os.path.realpath(image_path),),
+            )
+        return cursor.rowcount
+
+    def clear(self) -> None:
+        """
+        Remove all the cached hashes.
+        """
+        db = self._db()
+        with db:
+            db.execute("DELETE FROM hashes")
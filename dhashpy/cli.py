@@ -0,0 +1,339 @@
+"""
+The dhashpy command-line tool.
+
+- dhashpy hash PATH... -o OUTPUT : Hash files and directory trees in
+  parallel, to JSONL, CSV or a binary HashStore file. JSONL and CSV
+  outputs can be resumed.
+
+- dhashpy query HASH STORED : Look up a hash, or the hash of an image,
+  in a stored set of hashes.
+
+- dhashpy dupes STORED : Print the clusters of hashes within a threshold.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from typing import IO, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+from .batch import HashResult, hash_many
+from .budget import Budget
+from .cluster import cluster
+from .dHash import DHash, DHashRecord
+from .index import DHashIndex
+from .scanner import IMAGE_PATTERNS, iter_files
+from .store import HashStore, HashStoreWriter
+from .utils import parse_hash_string
+
+FORMATS = ("jsonl", "csv", "binary")
+_EXTENSIONS = {".jsonl": "jsonl", ".json": "jsonl", ".csv": "csv", ".dhst": "binary"}
+
+
+def _guess_format(path: str, format: Optional[str]) -> str:
+    if format is not None:
+        return format
+    return _EXTENSIONS.get(os.path.splitext(path)[1].lower(), "jsonl")
+
+
+def _expand_paths(
+    inputs: Sequence[str], skip: Set[str], errors: List[HashResult]
+) -> Iterator[str]:
+    for path in inputs:
+        if os.path.isdir(path):
+            files: Iterator[str] = iter_files(path, IMAGE_PATTERNS, errors.append)
+        else:
+            files = iter([path])
+        for file_path in files:
+            if file_path not in skip:
+                yield file_path
+
+
+def _read_text(path: str, format: str) -> Iterator[Tuple[str, DHashRecord]]:
+    with open(path, newline="") as f:
+        if format == "csv":
+            for row in csv.reader(f):
+                if row and row[0] != "path":
+                    hash_int = parse_hash_string(row[1])[0]
+                    yield row[0], DHashRecord(hash_int, int(row[2]), row[0])
+            return
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                if line.endswith("\n"):
+                    raise
+                # unfinished last line of a run killed while writing
+                return
+            if "hash" in entry:
+                hash_int = parse_hash_string(entry["hash"])[0]
+                record = DHashRecord(hash_int, entry["height"], entry["path"])
+                yield entry["path"], record
+
+
+def _drop_torn_line(path: str) -> None:
+    """
+    Truncate the last line of a text output if it does not end with a
+    newline, it was cut by a run killed while writing it.
+    """
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(0, position - 65536)
+            f.seek(start)
+            newline = f.read(position - start).rfind(b"\n")
+            if newline != -1:
+                position = start + newline + 1
+                break
+            position = start
+        if position != end:
+            f.truncate(position)
+
+
+def load_hashes(
+    path: str, format: Optional[str] = None
+) -> List[Tuple[str, DHashRecord]]:
+    """
+    Read the (path, DHashRecord) pairs of a file written by 'dhashpy hash'.
+
+    :param path: The JSONL, CSV or binary file.
+
+    :param format: One of FORMATS, guessed from the extension if None.
+
+    :return: List of (path, DHashRecord) tuples.
+
+    :rtype: list
+    """
+    format = _guess_format(path, format)
+    if format != "binary":
+        return list(_read_text(path, format))
+    with HashStore(path) as store:
+        height = int(round(store.bits_in_hash**0.5))
+        return [
+            (str(store.id(i)), DHashRecord(store.hash_int(i), height, str(store.id(i))))
+            for i in range(len(store))
+        ]
+
+
+class _Progress(object):
+    def __init__(self, stream: IO[str], enabled: bool) -> None:
+        self.stream = stream
+        self.enabled = enabled
+        self.start = self.last = time.monotonic()
+        self.done = 0
+        self.errors = 0
+
+    def update(self, ok: bool) -> None:
+        self.done += 1
+        if not ok:
+            self.errors += 1
+        now = time.monotonic()
+        if self.enabled and now - self.last >= 1:
+            self.last = now
+            self.stream.write("\r%s" % self.line(now))
+            self.stream.flush()
+
+    def line(self, now: float) -> str:
+        elapsed = max(now - self.start, 1e-9)
+        return "%d files, %d errors, %.1fs, %.1f files/s" % (
+            self.done,
+            self.errors,
+            elapsed,
+            self.done / elapsed,
+        )
+
+    def summary(self) -> None:
+        prefix = "\r" if self.enabled else ""
+        self.stream.write("%s%s\n" % (prefix, self.line(time.monotonic())))
+
+
+def _command_hash(args: argparse.Namespace) -> int:
+    format = _guess_format(args.output, args.format)
+    if args.resume and format == "binary":
+        sys.stderr.write("--resume is only supported for jsonl and csv output.\n")
+        return 2
+
+    done: Set[str] = set()
+    if args.resume and os.path.exists(args.output):
+        _drop_torn_line(args.output)
+        done = {path for path, _ in _read_text(args.output, format)}
+
+    errors: List[HashResult] = []
+    paths = _expand_paths(args.paths, done, errors)
+    budget = Budget(args.max_pixels, None, args.timeout, args.max_memory)
+    results = hash_many(
+        paths,
+        height=args.height,
+        workers=args.workers,
+        chunksize=args.chunksize,
+        ordered=False,
+        fast=args.fast,
+        budget=budget if any(value is not None for value in budget) else None,
+    )
+    progress = _Progress(sys.stderr, args.progress)
+
+    writer: Optional[HashStoreWriter] = None
+    if format == "binary":
+        writer = HashStoreWriter(args.output, args.height * args.height, with_ids=True)
+        output: Optional[IO[str]] = None
+    else:
+        exists = os.path.exists(args.output) and os.path.getsize(args.output) > 0
+        output = open(args.output, "a" if args.resume else "w", newline="")
+        if format == "csv" and not (args.resume and exists):
+            csv.writer(output).writerow(["path", "hash", "height"])
+
+    try:
+        for result in results:
+            progress.update(result.ok)
+            if result.record is None:
+                errors.append(result)
+            elif writer is not None:
+                writer.add(result.record, result.path)
+            elif format == "csv":
+                csv.writer(output).writerow(  # type: ignore[arg-type]
+                    [result.path, result.record.hash_hex, args.height]
+                )
+            else:
+                entry = {
+                    "path": result.path,
+                    "hash": result.record.hash_hex,
+                    "height": args.height,
+                }
+                output.write(json.dumps(entry) + "\n")  # type: ignore[union-attr]
+    finally:
+        if writer is not None:
+            writer.close()
+        if output is not None:
+            output.close()
+
+    for error in errors:
+        sys.stderr.write("error: %s: %s\n" % (error.path, error.error))
+    progress.errors = len(errors)
+    progress.summary()
+    return 1 if errors else 0
+
+
+def _query_hash(value: str, height: int, fast: bool) -> DHashRecord:
+    if value[:2].lower() in ("0x", "0b") and not os.path.exists(value):
+        return DHashRecord(parse_hash_string(value)[0], height)
+    return DHash(value, height, fast).to_record()
+
+
+def _command_query(args: argparse.Namespace) -> int:
+    index: Union[DHashIndex, HashStore]
+    if _guess_format(args.stored, args.format) == "binary":
+        # scanned in place, without loading the hashes
+        index = HashStore(args.stored)
+        height = int(round(index.bits_in_hash**0.5))
+    else:
+        stored = load_hashes(args.stored, args.format)
+        height = stored[0][1].height if stored else args.height
+        index = DHashIndex(bits_in_hash=height * height)
+        for path, record in stored:
+            index.add(record, path)
+    query = _query_hash(args.hash, height, args.fast)
+    if args.nearest:
+        matches = index.nearest(query, args.nearest)
+    else:
+        matches = index.query(query, args.max_distance)
+    for distance, match in matches:
+        sys.stdout.write("%d\t%s\n" % (distance, match))
+    if isinstance(index, HashStore):
+        index.close()
+    return 0 if matches else 1
+
+
+def _command_dupes(args: argparse.Namespace) -> int:
+    stored = load_hashes(args.stored, args.format)
+    bits_in_hash = stored[0][1].bits_in_hash if stored else None
+    result = cluster(
+        [record for _, record in stored], args.threshold, bits_in_hash, args.workers
+    )
+    for members in result.clusters:
+        paths = [stored[i][0] for i in members]
+        sys.stdout.write(json.dumps({"size": len(paths), "paths": paths}) + "\n")
+    return 0
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="dhashpy", description="Row-wise gradient dHash of images."
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    hash_parser = subparsers.add_parser(
+        "hash", help="Hash image files and directory trees."
+    )
+    hash_parser.add_argument("paths", nargs="+", help="Image files or directories.")
+    hash_parser.add_argument("-o", "--output", required=True, help="Output file.")
+    hash_parser.add_argument(
+        "--format", choices=FORMATS, help="Output format, guessed from the extension."
+    )
+    hash_parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Append to the output, skipping the paths it already has.",
+    )
+    hash_parser.add_argument("--workers", type=int, help="Worker processes.")
+    hash_parser.add_argument("--chunksize", type=int, default=16)
+    hash_parser.add_argument("--height", type=int, default=8)
+    hash_parser.add_argument("--fast", action="store_true", help="Fast decode mode.")
+    hash_parser.add_argument(
+        "--max-pixels", type=int, help="Fail images of more pixels, before decoding."
+    )
+    hash_parser.add_argument(
+        "--timeout", type=float, help="Seconds per image, slower images fail."
+    )
+    hash_parser.add_argument(
+        "--max-memory",
+        type=int,
+        help="Bytes a worker may allocate for one image, larger images fail.",
+    )
+    hash_parser.add_argument(
+        "--progress", action="store_true", help="Show the progress on stderr."
+    )
+    hash_parser.set_defaults(func=_command_hash)
+
+    query_parser = subparsers.add_parser(
+        "query", help="Look up a hash or an image in stored hashes."
+    )
+    query_parser.add_argument("hash", help="A 0x/0b hash or an image path.")
+    query_parser.add_argument("stored", help="File written by 'dhashpy hash'.")
+    query_parser.add_argument("--format", choices=FORMATS)
+    query_parser.add_argument("-d", "--max-distance", type=int, default=0)
+    query_parser.add_argument(
+        "-k", "--nearest", type=int, help="Print the k nearest hashes instead."
+    )
+    query_parser.add_argument("--height", type=int, default=8)
+    query_parser.add_argument("--fast", action="store_true")
+    query_parser.set_defaults(func=_command_query)
+
+    dupes_parser = subparsers.add_parser(
+        "dupes", help="Print clusters of near duplicates as JSONL."
+    )
+    dupes_parser.add_argument("stored", help="File written by 'dhashpy hash'.")
+    dupes_parser.add_argument("--format", choices=FORMATS)
+    dupes_parser.add_argument("-t", "--threshold", type=int, default=0)
+    dupes_parser.add_argument("--workers", type=int, help="Worker processes.")
+    dupes_parser.set_defaults(func=_command_dupes)
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """
+    Entry point of the dhashpy command.
+
+    :param argv: Command line arguments, sys.argv[1:] if None.
+
+    :return: Exit status.
+
+    :rtype: int
+    """
+    args = _parser().parse_args(argv)
+    return args.func(args)
@@ -0,0 +1,186 @@
+"""
+Clustering of near-duplicate hashes into connected components.
+"""
+
+import os
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from .index import coerce_hash
+from .utils import popcount
+
+
+class ClusterResult(NamedTuple):
+    """
+    Result of cluster().
+
+    - ClusterResult.clusters : List of clusters, each a sorted list of
+                               indices into the input hashes.
+
+    - ClusterResult.candidates : Number of candidate pairs that shared a band.
+
+    - ClusterResult.comparisons : Number of candidate pairs whose hamming
+                                  distance was computed. Pairs already known
+                                  to be in the same cluster are skipped.
+    """
+
+    clusters: List[List[int]]
+    candidates: int
+    comparisons: int
+
+
+class _UnionFind(object):
+    def __init__(self, size: int) -> None:
+        self.parent = list(range(size))
+
+    def find(self, i: int) -> int:
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, i: int, j: int) -> bool:
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i == root_j:
+            return False
+        if root_i > root_j:
+            root_i, root_j = root_j, root_i
+        self.parent[root_j] = root_i
+        return True
+
+
+def _band_edges(
+    band_values: List[int], hashes: List[int], max_distance: int
+) -> Tuple[List[Tuple[int, int]], int, int]:
+    """
+    Bucket the hashes by the value of one band and compare the pairs of each
+    bucket. Only the edges that join two components are returned, so at
+    most len(hashes) - 1 edges are sent back to the parent process.
+    """
+    buckets: Dict[int, List[int]] = {}
+    for i, value in enumerate(band_values):
+        buckets.setdefault(value, []).append(i)
+
+    union_find = _UnionFind(len(hashes))
+    edges: List[Tuple[int, int]] = []
+    candidates = comparisons = 0
+    for members in buckets.values():
+        for position, i in enumerate(members):
+            hash_i = hashes[i]
+            for j in members[position + 1 :]:
+                candidates += 1
+                if union_find.find(i) == union_find.find(j):
+                    continue
+                comparisons += 1
+                if popcount(hash_i ^ hashes[j]) <= max_distance:
+                    union_find.union(i, j)
+                    edges.append((i, j))
+    return edges, candidates, comparisons
+
+
+def _bands(bits_in_hash: int, count: int) -> List[Tuple[int, int]]:
+    """
+    Split bits_in_hash bits in count disjoint bands of (shift, mask).
+    """
+    bands = []
+    for k in range(count):
+        start = k * bits_in_hash // count
+        end = (k + 1) * bits_in_hash // count
+        bands.append((bits_in_hash - end, (1 << (end - start)) - 1))
+    return bands
+
+
+def cluster(
+    hashes: Sequence[object],
+    max_distance: int,
+    bits_in_hash: Optional[int] = None,
+    workers: Optional[int] = None,
+    min_size: int = 2,
+) -> ClusterResult:
+    """
+    Group hashes into clusters of near duplicates, the connected components
+    of the graph joining every pair within max_distance.
+
+    With max_distance 0 the hashes are bucketed by value and no pair is
+    compared. Otherwise the hashes are split into max_distance + 1 disjoint
+    bands. Two hashes within max_distance must have at least one band in
+    common (the pigeonhole principle), so only the pairs that share a band
+    value are compared.
+
+    :param hashes: Sequence of DHash, DHashRecord, "0x"/"0b" strings or
+                   integers, all with the same number of bits.
+
+    :param max_distance: Maximum hamming distance of a pair in a cluster.
+
+    :param bits_in_hash: Number of bits of the hashes, required if they are
+                         all hexadecimal strings or integers.
+
+    :param workers: Number of processes comparing the bands in parallel,
+                    defaults to os.cpu_count(). If 0 or 1 the bands are
+                    compared in the calling process.
+
+    :param min_size: Smallest cluster size returned, 1 includes the hashes
+                     without any near duplicate.
+
+    :return: ClusterResult with the clusters and the pair counts.
+
+    :rtype: ClusterResult
+
+    :raises ValueError: If the hashes have different numbers of bits, the
+                        number of bits is unknown or max_distance is negative.
+    """
+    values: List[int] = []
+    for hash_value in hashes:
+        hash_int, bits_in_hash = coerce_hash(hash_value, bits_in_hash)
+        values.append(hash_int)
+    if bits_in_hash is None:
+        if values:
+            raise ValueError("bits_in_hash is required for integer and hex hashes.")
+        bits_in_hash = 0
+    if max_distance < 0:
+        raise ValueError("max_distance must not be negative.")
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    union_find = _UnionFind(len(values))
+    candidates = comparisons = 0
+    if max_distance >= bits_in_hash:
+        # every pair is within max_distance
+        for i in range(1, len(values)):
+            union_find.union(0, i)
+    elif max_distance == 0:
+        first: Dict[int, int] = {}
+        for i, value in enumerate(values):
+            union_find.union(first.setdefault(value, i), i)
+    else:
+        band_values = [
+            [(value >> shift) & mask for value in values]
+            for shift, mask in _bands(bits_in_hash, max_distance + 1)
+        ]
+        results: Iterable[Tuple[List[Tuple[int, int]], int, int]]
+        if workers > 1 and len(values) > 1:
+            # imported here, it is not needed to import dhashpy
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(min(workers, len(band_values))) as executor:
+                results = list(
+                    executor.map(
+                        _band_edges,
+                        band_values,
+                        [values] * len(band_values),
+                        [max_distance] * len(band_values),
+                    )
+                )
+        else:
+            results = (_band_edges(band, values, max_distance) for band in band_values)
+        for edges, band_candidates, band_comparisons in results:
+            candidates += band_candidates
+            comparisons += band_comparisons
+            for i, j in edges:
+                union_find.union(i, j)
+
+    components: Dict[int, List[int]] = {}
+    for i in range(len(values)):
+        components.setdefault(union_find.find(i), []).append(i)
+    clusters = [members for members in components.values() if len(members) >= min_size]
+    return ClusterResult(clusters, candidates, comparisons)
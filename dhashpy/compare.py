@@ -0,0 +1,147 @@
+"""
+One-to-many comparison of a query hash against many candidate hashes.
+"""
+
+import array
+from typing import Any, Iterable, Iterator, Optional
+
+from . import vectorized
+from .hashes import _BaseHash, parse_hash
+from .index import coerce_hash
+from .store import _split_words, word_distances
+from .utils import popcount
+
+
+def _candidate_ints(
+    candidates: Iterable[Any], bits_in_hash: Optional[int]
+) -> Iterator[int]:
+    for candidate in candidates:
+        if isinstance(candidate, int):
+            value = candidate
+        elif isinstance(candidate, str) and candidate[:2] in ("0x", "0X"):
+            value = int(candidate, 16)
+        elif isinstance(candidate, _BaseHash):
+            value = candidate.hash_int
+        else:
+            value = parse_hash(candidate)[0]
+        if value < 0 or (bits_in_hash is not None and value >> bits_in_hash):
+            raise ValueError(
+                "Candidate %r is not a %s bits hash." % (candidate, bits_in_hash)
+            )
+        yield value
+
+
+def pack_words(candidates: Iterable[Any], bits_in_hash: int) -> Any:
+    """
+    Parse candidate hashes once into a NumPy array of uint64 words, the
+    pre-parsed form distances() and within() compare fastest.
+
+    :param candidates: Iterable of DHash, DHashRecord, "0x"/"0b" strings or
+                       integers.
+
+    :param bits_in_hash: Number of bits of the hashes.
+
+    :return: NumPy array of uint64 of shape (count,) for hashes of up to 64
+             bits, else (count, words) with the least significant word
+             first.
+
+    :raises ImportError: If NumPy is not installed.
+
+    :raises ValueError: If a candidate has more than bits_in_hash bits.
+    """
+    numpy = vectorized.numpy
+    if numpy is None:
+        raise ImportError("pack_words requires NumPy, pip install numpy.")
+    values = _candidate_ints(candidates, bits_in_hash)
+    if bits_in_hash <= 64:
+        return numpy.fromiter(values, dtype=numpy.uint64)
+    words = (bits_in_hash + 63) // 64
+    flat = numpy.fromiter(
+        (word for value in values for word in _split_words(value, words)),
+        dtype=numpy.uint64,
+    )
+    return flat.reshape(-1, words)
+
+
+def distances(
+    query: object, candidates: Iterable[Any], bits_in_hash: Optional[int] = None
+) -> Any:
+    """
+    Hamming distance from a query hash to every candidate.
+
+    The query is parsed once. The candidates can be a NumPy array from
+    pack_words(), a NumPy or array.array of unsigned integers, or any
+    iterable of integers, "0x"/"0b" strings such as DHash.hash_hex values,
+    DHash or DHashRecord objects. Hexadecimal strings are parsed with a
+    single int() call each, without building binary strings.
+
+    :param query: Instance of DHash or DHashRecord, a string starting with
+                  "0x" or "0b", or an integer.
+
+    :param candidates: The hashes to compare the query against.
+
+    :param bits_in_hash: Number of bits of the hashes, required if the query
+                         is a hexadecimal string or an integer.
+
+    :return: NumPy array of uint16 distances in candidate order, or an
+             array.array("H") if NumPy is not installed.
+
+    :raises ValueError: If a candidate has more bits than the query.
+    """
+    hash_int, bits = coerce_hash(query, bits_in_hash)
+    numpy = vectorized.numpy
+    if numpy is None:
+        return array.array(
+            "H",
+            (popcount(hash_int ^ value) for value in _candidate_ints(candidates, bits)),
+        )
+
+    if isinstance(candidates, numpy.ndarray):
+        words = candidates
+    elif isinstance(candidates, array.array):
+        words = numpy.frombuffer(candidates, dtype=candidates.typecode)
+    elif bits is not None:
+        words = pack_words(candidates, bits)
+    else:
+        words = numpy.array(list(_candidate_ints(candidates, None)), dtype=numpy.uint64)
+    if words.ndim == 1:
+        words = words.astype(numpy.uint64, copy=False).reshape(-1, 1)
+    if max(bits or 0, hash_int.bit_length()) > 64 * words.shape[1]:
+        raise ValueError(
+            "The query has more bits than the %d bits candidates."
+            % (64 * words.shape[1])
+        )
+    return word_distances(words, hash_int)
+
+
+def within(
+    query: object,
+    candidates: Iterable[Any],
+    max_distance: int,
+    bits_in_hash: Optional[int] = None,
+) -> Any:
+    """
+    Positions of the candidates within max_distance of the query.
+
+    See distances() for the accepted query and candidates.
+
+    :param query: The query hash.
+
+    :param candidates: The hashes to compare the query against.
+
+    :param max_distance: Maximum hamming distance, inclusive.
+
+    :param bits_in_hash: Number of bits of the hashes, required if the query
+                         is a hexadecimal string or an integer.
+
+    :return: NumPy array of int64 positions, in candidate order, or an
+             array.array("q") if NumPy is not installed.
+    """
+    result = distances(query, candidates, bits_in_hash)
+    if vectorized.numpy is None:
+        return array.array(
+            "q", (i for i, distance in enumerate(result) if distance <= max_distance)
+        )
+    return vectorized.numpy.flatnonzero(result <= max_distance).astype(
+        vectorized.numpy.int64
+    )
@@ -125,11 +125,104 @@
 
 """
 
-from PIL import Image
+import io
 import os.path
+from typing import (
+    Any,
+    AsyncIterator,
+    BinaryIO,
+    Dict,
+    Iterable,
+    Iterator,
+    Optional,
+    Tuple,
+    Type,
+    TYPE_CHECKING,
+    Union,
+)
+
+from . import hashes, instrument, vectorized
+from .hashes import DHashRecord, _BaseHash, parse_hash  # noqa: F401
+
+if TYPE_CHECKING:  # pragma: no cover
+    from concurrent.futures import Executor
+    from PIL import Image
+    from .batch import HashResult
+    from .budget import Budget
+    from .cache import HashCache
+
+# In fast mode the image is only shrunk down to FAST_SCALE times the final
+# hash image size before the final LANCZOS resize.
+FAST_SCALE = 32
+
+# Modes supported by Image.reduce(), other modes are converted to L first.
+_REDUCE_MODES = ("L", "LA", "I", "F", "RGB", "RGBA", "CMYK", "YCbCr")
+
+
+class _MemoryReader(io.RawIOBase):
+    """
+    Read only, seekable raw file over a buffer, without copying the buffer.
+    """
+
+    def __init__(self, data: Union[bytes, bytearray, memoryview]) -> None:
+        self._view = memoryview(data).cast("B")
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        chunk = self._view[self._position : self._position + len(buffer)]
+        buffer[: len(chunk)] = chunk
+        self._position += len(chunk)
+        return len(chunk)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._position = max(0, offset)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
 
 
-class DHash(object):
+def _bytes_file(data: Union[bytes, bytearray, memoryview]) -> BinaryIO:
+    """
+    Binary file object over an encoded image in memory, without a copy.
+    """
+    if isinstance(data, bytes):
+        return io.BytesIO(data)
+    return io.BufferedReader(_MemoryReader(data))  # type: ignore
+
+
+def _restore(
+    cls: Type["DHash"],
+    hash_int: int,
+    height: int,
+    path: Optional[str],
+    fast: bool,
+    source: str = "image",
+) -> "DHash":
+    """
+    Rebuild an unpickled DHash without running __init__, see DHash.__reduce__.
+    """
+    dhash = cls.__new__(cls)
+    dhash.path = path
+    dhash.height = height
+    dhash.fast = fast
+    dhash.source = source
+    dhash.hash_int = hash_int
+    dhash.image = None
+    return dhash
+
+
+class DHash(_BaseHash):
     """
     DHash class
     =============
@@ -158,21 +251,42 @@ class DHash(object):
                               the output hexadecimal value should be prefixed
                               with "0b" and "0x" respectively.
 
+    - DHash.to_record() : Returns a DHashRecord of the hash, without the image.
+
+    - DHash.to_bytes() : The hash bits as big-endian bytes, read back with
+      DHashRecord.from_bytes(). Not to be confused with DHash.from_bytes(),
+      which hashes an encoded image.
+
+    - DHash.from_bytes(data), DHash.from_file(fileobj), DHash.from_image(image)
+      and DHash.from_array(array) : Hash an image that is not in a file.
+
+    - DHash.hash_variants(source, heights, directions) : Hashes of several
+      heights and gradient directions from a single decode.
+
 
     DHash objects have the following attributes:
 
-    - DHash.path : The path of the input image.
+    - DHash.path : The path of the input image, None if the image was not
+                   read from a path.
 
     - DHash.image : Instance of PIL.Image.Image class with the input as the
-                    input image.
+                    input image. None if the hash was read from a HashCache
+                    or the DHash was unpickled.
+
+    - DHash.hash_int : The hash as an integer, this is what is compared.
 
     - DHash.hash : A binary string prefixed with "0b" is the hash of the input
-                   image.
+                   image. Built from hash_int when accessed.
 
     - DHash.hash_hex : Hexadecimal representation of the binary string hash.
+                       Built from hash_int when accessed.
 
     - DHash.height : The resized height of the input image. Units are pixels.
 
+    - DHash.source : "image" if the input image was decoded, "thumbnail" if
+                     its EXIF thumbnail was hashed instead, "cache" if the
+                     hash was read from a HashCache.
+
     - DHash.width : The resized width of the input image. Units are pixels
 
     - DHash.bits_in_hash : Total number of bits in the hash. Equal n^2, where n
@@ -182,12 +296,27 @@ class DHash(object):
 
     """
 
-    def __init__(self, path: str, height: int = 8) -> None:
+    image: Optional["Image.Image"]
+    source: str
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        height: int = 8,
+        fast: bool = False,
+        cache: Optional["HashCache"] = None,
+        image: Union["Image.Image", BinaryIO, None] = None,
+        hook: Optional[instrument.Hook] = None,
+        budget: Optional["Budget"] = None,
+        thumbnail: bool = False,
+    ) -> None:
         """
 
-        Check if path exists.
+        Check if path exists, unless an already opened image is supplied.
 
-        :param path: absolute path of the image that needs to be hashed.
+        :param path: absolute path of the image that needs to be hashed. If
+                     image is supplied path is only kept as metadata and may
+                     be None.
 
         :param height: height must be an integer, it's the height of the scaled
                        image. Units are pixels.
@@ -199,135 +328,447 @@ class DHash(object):
                        will have a length of 66(64 hash + 2 for 0b), a 16 bits
                        hash will have a length of 18(16 bit hash and 2 for 0b prefix).
 
+        :param fast: If True the image is shrunk cheaply while decoding, JPEG
+                     images are decoded at a reduced scale with Image.draft()
+                     and other images are reduced with Image.reduce() before
+                     the grayscale conversion and the final resize. Much
+                     faster for large JPEG photos, but the hash may differ
+                     from the exact mode by a few bits. On the synthetic
+                     test corpus (JPEG and PNG, height 8) the difference is
+                     at most 2 bits out of 64 and usually 0. The bound is
+                     checked by test_fast_mode in tests/test_dhashpy.py.
+                     The default is False, the exact mode.
+
+        :param cache: Optional HashCache. If the file is unchanged since its
+                      hash was cached, the cached hash is used and the image
+                      is not opened, DHash.image is None then. Otherwise the
+                      computed hash is stored in the cache. Only used when
+                      hashing from path.
+
+        :param image: Optional instance of PIL.Image.Image, or binary file
+                      object of an encoded image, to hash instead of opening
+                      path. See also the from_bytes, from_file, from_image
+                      and from_array constructors.
+
+        :param hook: Optional callable called with a HashEvent once the image
+                     is hashed, in addition to the hooks registered with
+                     dhashpy.add_hook(). See dhashpy.instrument.
+
+        :param budget: Optional Budget, the max_pixels and max_decoded_bytes
+                       limits are checked once the image header is read,
+                       before it is decoded. Its timeout and max_memory are
+                       only enforced by hash_many.
+
+        :param thumbnail: If True and the image carries an EXIF thumbnail of
+                          the same aspect ratio, large enough for the height,
+                          the thumbnail is hashed and the image itself is not
+                          decoded. Much faster for camera JPEGs, the hash may
+                          differ from the hash of the image by a few bits.
+                          DHash.source tells which one was hashed, see
+                          dhashpy.exif.open_thumbnail. Hashes of thumbnails
+                          are not stored in the cache. The default is False.
+
         :return: None
 
         :rtype: NoneType
+
+        :raises FileNotFoundError: If image is None and there is no file at path.
+
+        :raises PIL.Image.DecompressionBombError: If the image is over a
+                                                  limit of budget.
         """
         self.path = path
         self.height = height
-        self.bits_in_hash = self.height * self.height
-        self.width = self.height + 1
+        self.fast = fast
+        self.source = "image"
+
+        recorder = instrument.recorder(hook, path, height, fast)
+        if recorder is None:
+            self._hash(cache, image, None, budget, thumbnail)
+            return
+        try:
+            self._hash(cache, image, recorder, budget, thumbnail)
+        except Exception as e:
+            recorder.finish(e)
+            raise
+        recorder.finish()
+
+    def _hash(
+        self,
+        cache: Optional["HashCache"],
+        image: Union["Image.Image", BinaryIO, None],
+        recorder: Optional[instrument.Recorder],
+        budget: Optional["Budget"] = None,
+        thumbnail: bool = False,
+    ) -> None:
+        """
+        Compute the hash, or read it from the cache, see DHash.__init__.
+        """
+        if image is not None:
+            self._calc_hash(image, recorder, budget, thumbnail)
+            return
 
-        if not os.path.isfile(self.path):
+        if self.path is None or not os.path.isfile(self.path):
             raise FileNotFoundError("No image file found at '%s'." % self.path)
 
-        self._calc_hash()
+        if cache is None:
+            self._calc_hash(None, recorder, budget, thumbnail)
+            return
+
+        file_key = cache.file_key(self.path)
+        hash_int = cache.get(self.path, self.height, self.fast, file_key)
+        if hash_int is not None:
+            self.hash_int = hash_int
+            self.image = None
+            self.source = "cache"
+            if recorder is not None:
+                recorder.event.cached = True
+            return
+        self._calc_hash(None, recorder, budget, thumbnail)
+        if self.source == "image":
+            cache.put(self.path, self.hash_int, self.height, self.fast, file_key)
+
+    @classmethod
+    def from_image(
+        cls,
+        image: "Image.Image",
+        height: int = 8,
+        fast: bool = False,
+        path: Optional[str] = None,
+        hook: Optional[instrument.Hook] = None,
+    ) -> "DHash":
+        """
+        Hash an instance of PIL.Image.Image. The image is not modified.
+
+        :param image: The image to hash, in any mode.
+
+        :param height: The height used for hashing, see DHash.__init__.
+
+        :param fast: Use the fast mode, see DHash.__init__. Only has an effect
+                     on images that are not loaded yet.
+
+        :param path: Optional path or name kept as metadata.
+
+        :param hook: Optional instrumentation hook, see DHash.__init__.
 
-    def __str__(self) -> str:
+        :return: The DHash of the image.
+
+        :rtype: DHash
+        """
+        return cls(path, height, fast, image=image, hook=hook)
+
+    @classmethod
+    def from_file(
+        cls,
+        fileobj: BinaryIO,
+        height: int = 8,
+        fast: bool = False,
+        path: Optional[str] = None,
+        hook: Optional[instrument.Hook] = None,
+        budget: Optional["Budget"] = None,
+        thumbnail: bool = False,
+    ) -> "DHash":
         """
-        String representation of the instance of DHash class and is same as DHash.hash
+        Hash an image read from a binary file object, without a path.
 
-        :return: Binary hash value for the image, prefixed with "0b".
+        :param fileobj: Readable and seekable binary file object, positioned at
+                        the start of the image.
 
-        :rtype: str
+        :param height: The height used for hashing, see DHash.__init__.
+
+        :param fast: Use the fast mode, see DHash.__init__.
+
+        :param path: Optional path or name kept as metadata, defaults to the
+                     name attribute of fileobj if it is a string.
+
+        :param hook: Optional instrumentation hook, see DHash.__init__.
+
+        :param budget: Optional Budget, see DHash.__init__.
+
+        :param thumbnail: Hash the EXIF thumbnail if it is usable, see
+                          DHash.__init__.
+
+        :return: The DHash of the image.
+
+        :rtype: DHash
         """
-        return self.hash
+        if path is None and isinstance(getattr(fileobj, "name", None), str):
+            path = fileobj.name
+        return cls(
+            path,
+            height,
+            fast,
+            image=fileobj,
+            hook=hook,
+            budget=budget,
+            thumbnail=thumbnail,
+        )
 
-    def __len__(self) -> int:
+    @classmethod
+    def from_bytes(
+        cls,
+        data: Union[bytes, bytearray, memoryview],
+        height: int = 8,
+        fast: bool = False,
+        path: Optional[str] = None,
+        hook: Optional[instrument.Hook] = None,
+        budget: Optional["Budget"] = None,
+        thumbnail: bool = False,
+    ) -> "DHash":
         """
-        length of the hash, including the prefix 0b. len = bits_in_hash + 2
+        Hash an encoded image held in memory, for example an object store
+        blob, without writing it to a file.
 
-        :return: Length of the binary hash value for the image.
+        bytes are wrapped in io.BytesIO, which shares the buffer. bytearray
+        and memoryview input is read through a memoryview, Pillow then only
+        copies the chunks it reads.
 
-        :rtype: int
+        :param data: The encoded image, JPEG, PNG or any format Pillow reads.
+
+        :param height: The height used for hashing, see DHash.__init__.
+
+        :param fast: Use the fast mode, see DHash.__init__.
+
+        :param path: Optional path or name kept as metadata.
+
+        :param hook: Optional instrumentation hook, see DHash.__init__.
+
+        :param budget: Optional Budget, see DHash.__init__.
+
+        :param thumbnail: Hash the EXIF thumbnail if it is usable, see
+                          DHash.__init__.
+
+        :return: The DHash of the image.
+
+        :rtype: DHash
         """
-        return len(self.hash)
+        return cls(
+            path,
+            height,
+            fast,
+            image=_bytes_file(data),
+            hook=hook,
+            budget=budget,
+            thumbnail=thumbnail,
+        )
 
-    def __repr__(self) -> str:
+    @classmethod
+    def from_array(
+        cls,
+        array: Any,
+        height: int = 8,
+        fast: bool = False,
+        path: Optional[str] = None,
+        hook: Optional[instrument.Hook] = None,
+    ) -> "DHash":
         """
-        Representation of the instance of DHash class.
+        Hash a decoded image held in a NumPy array, for example an in-process
+        thumbnail.
 
-        :return: String representation of the object of DHash class.
+        :param array: Array like accepted by PIL.Image.fromarray, a (h, w)
+                      grayscale or a (h, w, 3) RGB or (h, w, 4) RGBA array of
+                      uint8.
 
-        :rtype: str
+        :param height: The height used for hashing, see DHash.__init__.
+
+        :param fast: Use the fast mode, see DHash.__init__.
+
+        :param path: Optional path or name kept as metadata.
+
+        :param hook: Optional instrumentation hook, see DHash.__init__.
+
+        :return: The DHash of the image.
+
+        :rtype: DHash
+        """
+        from PIL import Image
+
+        return cls(path, height, fast, image=Image.fromarray(array), hook=hook)
+
+    def to_record(self) -> DHashRecord:
+        """
+        Compact record of this hash, without the resized image.
+
+        :return: DHashRecord with the same hash_int, height and path.
+
+        :rtype: DHashRecord
+        """
+        return DHashRecord(self.hash_int, self.height, self.path)
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        """
+        Pickle only the hash, the height, the path, the fast flag and the
+        source, not the resized image. DHash.image is None in the unpickled copy, as for a
+        hash read from a HashCache.
         """
-        return "DHash(hash=%s, hash_hex=%s, path=%s)" % (
-            self.hash,
-            self.hash_hex,
+        return _restore, (
+            type(self),
+            self.hash_int,
+            self.height,
             self.path,
+            self.fast,
+            self.source,
         )
 
-    def __ne__(self, other: object) -> bool:
+    @staticmethod
+    def hash_many(
+        paths: Iterable[str],
+        height: int = 8,
+        workers: Optional[int] = None,
+        chunksize: int = 16,
+        ordered: bool = True,
+        fast: bool = False,
+        cache: Optional["HashCache"] = None,
+        budget: Optional["Budget"] = None,
+    ) -> Iterator["HashResult"]:
         """
-        Implement '!=' on the instance of DHash class.
+        Hash many images in parallel over a pool of worker processes.
+
+        See dhashpy.batch.hash_many for the details.
+
+        :param paths: Iterable of image paths.
+
+        :param height: The height used for hashing.
 
-        :param other: Can be instance of DHash class or a string starting
-                      with "0x" or "0b", representing hexadecimal or binary
-                      value.
+        :param workers: Number of worker processes, defaults to os.cpu_count().
+                        If 0 the images are hashed in the calling process.
 
-        :return: Return True if not equal else return False.
+        :param chunksize: Number of paths sent to a worker at once.
 
-        :rtype: bool
+        :param ordered: If True the results are yielded in input order, else
+                        as they complete.
+
+        :param fast: Use the fast decode mode, see DHash.__init__.
+
+        :param cache: Optional HashCache, unchanged files are not hashed again.
+
+        :param budget: Optional Budget limiting the resources of every image.
+
+        :return: Iterator of HashResult, one per input path. Failures are
+                 reported in HashResult.error instead of being raised.
+
+        :rtype: Iterator[HashResult]
         """
-        if self.__eq__(other):
-            return False
-        return True
+        from .batch import hash_many
+
+        return hash_many(
+            paths, height, workers, chunksize, ordered, fast, cache, budget
+        )
 
-    def __eq__(self, other: object) -> bool:
+    @staticmethod
+    def hash_variants(
+        source: Union[str, bytes, BinaryIO, "Image.Image"],
+        heights: Iterable[int] = (8,),
+        directions: Iterable[str] = ("row",),
+        fast: bool = False,
+        path: Optional[str] = None,
+    ) -> Dict[Tuple[str, int], DHashRecord]:
         """
-        Implement '==' on the instance of DHash class.
+        Hash an image at several heights, row-wise and column-wise, from a
+        single decode.
 
-        :param other: Can be instance of DHash class or a string starting
-                      with "0x" or "0b", representing hexadecimal or binary
-                      value.
+        See dhashpy.variants.hash_variants for the details.
 
-        :return: Return True if equal else return False.
+        :param source: Path, encoded bytes, file object or PIL.Image.Image.
 
-        :rtype: bool
+        :param heights: The heights to hash at.
+
+        :param directions: Any of "row" and "column".
+
+        :param fast: Use the fast decode mode, see DHash.__init__.
+
+        :param path: Path kept in the records, defaults to source if it is a
+                     path.
+
+        :return: Dict mapping (direction, height) to a DHashRecord.
+
+        :rtype: dict
         """
+        from .variants import hash_variants
 
-        if self.__sub__(other) == 0:
-            return True
-        return False
+        return hash_variants(source, heights, directions, fast, path)
 
-    def __sub__(self, other: object) -> int:
+    @staticmethod
+    async def ahash(
+        path: str,
+        height: int = 8,
+        fast: bool = False,
+        cache: Optional["HashCache"] = None,
+        executor: Optional["Executor"] = None,
+    ) -> "DHash":
         """
-        Implement the usage of '-' on instance of DHash class and
-        Also compatibile with hexadecimal and binary strings
+        Hash an image in an executor without blocking the event loop.
 
-        :param other: Can be instance of DHash class or a string starting
-                      with "0x" or "0b", representing hexadecimal or binary
-                      value. If binary string is supplied hash must of the same
-                      bits as this instance.
+        See dhashpy.aio.ahash for the details.
 
-        :return: Hamming distance of the two objects/binary string/hexadecimal
-                 string being compared.
+        :param path: Path of the image.
 
-        :rtype: int
+        :param height: The height used for hashing.
+
+        :param fast: Use the fast decode mode, see DHash.__init__.
+
+        :param cache: Optional HashCache.
+
+        :param executor: Thread or process pool executor, None for the default
+                         executor of the event loop.
+
+        :return: The DHash of the image.
+
+        :rtype: DHash
         """
-        if other is None:
-            raise TypeError("Other hash is None. And it must not be None.")
-
-        if isinstance(other, str):
-            if other.lower().startswith("0x"):
-                return DHash.hamming_distance(
-                    self.hash, DHash.hex2bin(other.lower(), self.bits_in_hash)
-                )
-            elif other.lower().startswith("0b"):
-                if len(other) != len(self.hash):
-                    raise ValueError(
-                        "Can not compare different bits hashes. You must supply a %d bits hash."
-                        % self.bits_in_hash
-                    )
-                return DHash.hamming_distance(self.hash, other.lower())
-            else:
-                raise TypeError(
-                    "Hash string must start with either '0x' for hexadecimal or '0b' for binary."
-                )
-
-        if isinstance(other, DHash):
-            return DHash.hamming_distance(self.hash, other.hash)
-
-        raise TypeError(
-            "To calculate difference both of the hashes must be either hexadecimal/binary strings or instance of DHash"
-        )
+        from .aio import ahash
+
+        return await ahash(path, height, fast, cache, executor)
+
+    @staticmethod
+    def ahash_stream(
+        source: Union[Iterable[str], AsyncIterator[str]],
+        concurrency: int = 4,
+        height: int = 8,
+        fast: bool = False,
+        cache: Optional["HashCache"] = None,
+        executor: Optional["Executor"] = None,
+    ) -> AsyncIterator["HashResult"]:
+        """
+        Hash the images of an iterable or async iterable of paths in an
+        executor, with at most concurrency images in flight.
+
+        See dhashpy.aio.ahash_stream for the details.
+
+        :param source: Iterable or async iterable of image paths.
+
+        :param concurrency: Maximum number of images being hashed at once.
+
+        :param height: The height used for hashing.
+
+        :param fast: Use the fast decode mode, see DHash.__init__.
+
+        :param cache: Optional HashCache.
+
+        :param executor: Thread or process pool executor, None for the default
+                         executor of the event loop.
+
+        :return: Async iterator of HashResult, yielded as they complete.
+
+        :rtype: AsyncIterator[HashResult]
+        """
+        from .aio import ahash_stream
 
-    def _calc_hash(self) -> None:
+        return ahash_stream(source, concurrency, height, fast, cache, executor)
+
+    def _calc_hash(
+        self,
+        image: Union["Image.Image", BinaryIO, None] = None,
+        recorder: Optional[instrument.Recorder] = None,
+        budget: Optional["Budget"] = None,
+        thumbnail: bool = False,
+    ) -> None:
         """
-        Open the input image using the pillow package.
+        Open the input image using the pillow package, unless it is supplied.
         Converts the image to greyscale.
         Resize the image to a smaller pixel value.
-        Calculate the binary hash value with the DHash algorithm.
+        Calculate the binary hash value with the DHash algorithm, vectorized
+        with NumPy if it is installed.
 
 
         dHash algorithm as defined at :
@@ -335,23 +776,143 @@ class DHash(object):
         `Kind of Like That  - The Hacker Factor Blog
         <https://www.hackerfactor.com/blog/index.php?/archives/529-Kind-of-Like-That.html>`_
 
+        :param image: Optional image, or file object of an encoded image, to
+                      hash instead of the file at DHash.path.
+
+        :param recorder: Optional instrument.Recorder timing the stages.
+
+        :param budget: Optional Budget checked before decoding.
+
+        :param thumbnail: Hash the EXIF thumbnail instead of the image if it
+                          is usable, see DHash.__init__.
+
         :return: None
 
         :rtype: NoneType
         """
-        self.image = Image.open(self.path)
-        self.image = self.image.convert("L")
-        self.image = self.image.resize((self.width, self.height), Image.ANTIALIAS)
-        lpixels = list(self.image.getdata())
-        self.hash = "0b"
-        for i, pixel in enumerate(lpixels):
-            if (i + 1) % self.width == 0 and i != 0:
-                continue
-            if pixel < lpixels[i + 1]:
-                self.hash += "1"
-                continue
-            self.hash += "0"
-        self.hash_hex = DHash.bin2hex(self.hash)
+        # Pillow is only imported when an image is hashed
+        from PIL import Image
+
+        from . import exif
+
+        opened = not isinstance(image, Image.Image)
+        if image is None:
+            image = Image.open(self.path)  # type: ignore[arg-type]
+        elif not isinstance(image, Image.Image):
+            image = Image.open(image)
+        if budget is not None:
+            try:
+                budget.check(image)
+            except Exception:
+                if opened:
+                    image.close()
+                raise
+        if thumbnail:
+            small = exif.open_thumbnail(image, self.width, self.height)
+            if small is not None:
+                if opened:
+                    image.close()
+                image = small
+                opened = True
+                self.source = "thumbnail"
+        if recorder is not None:
+            recorder.opened(image)
+        if self.fast:
+            image = DHash._fast_reduce(image, self.width, self.height, opened)
+        if recorder is not None:
+            # decode now, not inside convert(), to time it on its own
+            image.load()
+            recorder.mark("decode")
+        image = image.convert("L")
+        if recorder is not None:
+            recorder.mark("grayscale")
+        image = image.resize((self.width, self.height), Image.LANCZOS)
+        if recorder is not None:
+            recorder.mark("resize")
+        self.image = image
+        self.hash_int = DHash._image_to_int(image)
+        if recorder is not None:
+            recorder.mark("bits")
+
+    @staticmethod
+    def _fast_reduce(
+        image: "Image.Image", width: int, height: int, draft: bool = True
+    ) -> "Image.Image":
+        """
+        Cheaply shrink a freshly opened image before the grayscale conversion
+        and the final resize, used by the fast mode.
+
+        For JPEG images Image.draft() makes libjpeg decode directly to
+        grayscale and scale down in the DCT domain, by up to 1/8. Any image
+        that is still larger than FAST_SCALE times the target size is then
+        shrunk with Image.reduce(), a box filter over integer factors.
+
+        :param image: The opened, not yet loaded, input image.
+
+        :param width: Width of the final resized image.
+
+        :param height: Height of the final resized image.
+
+        :param draft: Use Image.draft(), which changes the mode and size of
+                      the image in place. Only for images opened by dhashpy,
+                      images of the caller are only reduced into new images.
+
+        :return: The reduced image, at least FAST_SCALE times the target size
+                 in both dimensions, unless the input was smaller.
+
+        :rtype: PIL.Image.Image
+        """
+        target_width, target_height = width * FAST_SCALE, height * FAST_SCALE
+        if draft:
+            image.draft("L", (target_width, target_height))
+        factor_x = max(1, image.width // target_width)
+        factor_y = max(1, image.height // target_height)
+        if factor_x == 1 and factor_y == 1:
+            return image
+        if image.mode not in _REDUCE_MODES:
+            image = image.convert("L")
+        return image.reduce((factor_x, factor_y))
+
+    @staticmethod
+    def _image_to_int(image: "Image.Image") -> int:
+        """
+        Compute the hash of the resized L mode image, vectorized with NumPy if
+        it is installed.
+
+        :param image: The resized grayscale image, height + 1 pixels wide.
+
+        :return: The hash as an integer.
+
+        :rtype: int
+        """
+        if vectorized.numpy is not None:
+            return vectorized.hash_array(vectorized.numpy.asarray(image))
+        return DHash._pixels_to_int(image.tobytes(), image.width, image.height)
+
+    @staticmethod
+    def _pixels_to_int(pixels: bytes, width: int, height: int) -> int:
+        """
+        Compute the hash bits from the grayscale pixels of the resized image.
+
+        The bit is 1 where the pixel on the right is brighter than the current
+        pixel. The bits are joined left to right and top to bottom, the first
+        bit being the most significant one.
+
+        :param pixels: The L mode pixel values, row by row.
+
+        :param width: Width of the resized image, height + 1.
+
+        :param height: Height of the resized image.
+
+        :return: The hash as an integer.
+
+        :rtype: int
+        """
+        value = 0
+        for row_start in range(0, width * height, width):
+            for i in range(row_start, row_start + width - 1):
+                value = (value << 1) | (pixels[i] < pixels[i + 1])
+        return value
 
     @staticmethod
     def hamming_distance(string_a: str, string_b: str) -> int:
@@ -362,6 +923,9 @@ class DHash(object):
         The two input strings must be of equal length as the Hamming distance is
         undefined when strings are of unequal length.
 
+        Binary strings prefixed with "0b" are compared as integers, with
+        XOR and popcount, other strings are compared character by character.
+
         :param string_a: A python string representing a binary number, prefixed with "0b"
 
         :param string_b: A python string representing a binary number, prefixed with "0b"
@@ -372,11 +936,7 @@ class DHash(object):
 
         :raises ValueError: When both the strings are not of equal length.
         """
-        if len(string_a) != len(string_b):
-            raise ValueError(
-                "Strings are of unequal length can not compute hamming distance. Hamming distance is undefined."
-            )
-        return sum(char_1 != char_2 for char_1, char_2 in zip(string_a, string_b))
+        return hashes.hamming_distance(string_a, string_b)
 
     @staticmethod
     def hex2bin(hexstr: str, padding: int) -> str:
@@ -397,9 +957,7 @@ class DHash(object):
 
         :raises ValueError: If hexadecimal input string is not prefixed with "0x".
         """
-        if not hexstr.lower().startswith("0x"):
-            raise ValueError("Input hexadecimal string must have '0x' as the prefix.")
-        return "0b" + str(bin(int(hexstr.lower(), 0))).replace("0b", "").zfill(padding)
+        return hashes.hex2bin(hexstr, padding)
 
     @staticmethod
     def bin2hex(binstr: str) -> str:
@@ -416,6 +974,4 @@ class DHash(object):
 
         :raises ValueError: If binary input string is not prefixed with "0b".
         """
-        if not binstr.lower().startswith("0b"):
-            raise ValueError("Binary string must be prefixed with '0b'.")
-        return str(hex(int(binstr, 2)))
+        return hashes.bin2hex(binstr)
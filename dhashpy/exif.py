@@ -0,0 +1,109 @@
+"""
+Reading of the thumbnail embedded in the EXIF data of camera images.
+"""
+
+import io
+import struct
+from typing import Dict, Optional
+
+from PIL import Image
+
+# The thumbnail must be at least MIN_SCALE times the hash image size in both
+# dimensions to be hashed instead of the image.
+MIN_SCALE = 4
+
+# Largest relative difference between the aspect ratios of the thumbnail and
+# of the image. Thumbnails of another aspect ratio are letterboxed.
+ASPECT_TOLERANCE = 0.02
+
+_COMPRESSION = 0x0103
+_JPEG_OFFSET = 0x0201
+_JPEG_LENGTH = 0x0202
+
+# Type of the TIFF tags holding a SHORT, the value is in the first 2 bytes.
+_SHORT = 3
+
+
+def exif_thumbnail(image: Image.Image) -> Optional[bytes]:
+    """
+    The JPEG thumbnail of the EXIF data of an image, from its second IFD.
+    Only the header of the image is read, it is not decoded.
+
+    :param image: An opened image, usually a JPEG from a camera.
+
+    :return: The encoded thumbnail, None if the image has no EXIF data or
+             no JPEG thumbnail.
+
+    :rtype: bytes or NoneType
+    """
+    data = image.info.get("exif")
+    if not data:
+        return None
+    if data[:6] == b"Exif\x00\x00":
+        data = data[6:]
+    try:
+        order = {b"II": "<", b"MM": ">"}[data[:2]]
+        (ifd0,) = struct.unpack_from(order + "I", data, 4)
+        (count,) = struct.unpack_from(order + "H", data, ifd0)
+        (ifd1,) = struct.unpack_from(order + "I", data, ifd0 + 2 + 12 * count)
+        if not ifd1:
+            return None
+        (count,) = struct.unpack_from(order + "H", data, ifd1)
+        tags: Dict[int, int] = {}
+        for i in range(count):
+            entry = ifd1 + 2 + 12 * i
+            tag, type, _, value = struct.unpack_from(order + "HHII", data, entry)
+            if type == _SHORT:
+                (value,) = struct.unpack_from(order + "H", data, entry + 8)
+            tags[tag] = value
+    except (KeyError, struct.error):
+        return None
+
+    offset = tags.get(_JPEG_OFFSET)
+    length = tags.get(_JPEG_LENGTH)
+    if tags.get(_COMPRESSION, 6) != 6 or not offset or not length:
+        return None
+    thumbnail = data[offset : offset + length]
+    if len(thumbnail) != length or thumbnail[:2] != b"\xff\xd8":
+        return None
+    return bytes(thumbnail)
+
+
+def open_thumbnail(
+    image: Image.Image, width: int, height: int
+) -> Optional[Image.Image]:
+    """
+    The decoded EXIF thumbnail of an image, if it can stand in for the image
+    when hashing at a size of width x height.
+
+    The thumbnail is used if it is at least MIN_SCALE times the hash size
+    and its aspect ratio is within ASPECT_TOLERANCE of the aspect ratio of
+    the image, so letterboxed thumbnails are not used.
+
+    :param image: An opened image, it is not decoded.
+
+    :param width: Width of the resized hash image.
+
+    :param height: Height of the resized hash image.
+
+    :return: The loaded thumbnail, None if there is no usable thumbnail.
+
+    :rtype: PIL.Image.Image or NoneType
+    """
+    data = exif_thumbnail(image)
+    if data is None:
+        return None
+    try:
+        thumbnail = Image.open(io.BytesIO(data))
+        thumbnail_width, thumbnail_height = thumbnail.size
+        if (
+            thumbnail_width < MIN_SCALE * width
+            or thumbnail_height < MIN_SCALE * height
+            or abs(thumbnail_width * image.height - thumbnail_height * image.width)
+            > ASPECT_TOLERANCE * thumbnail_height * image.width
+        ):
+            return None
+        thumbnail.load()
+    except (OSError, SyntaxError, ValueError):
+        return None
+    return thumbnail
@@ -0,0 +1,630 @@
+"""
+Hashing of images served over HTTP, with pooled keep-alive connections and
+the response body streamed into the decoder.
+"""
+
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+import http.client
+import io
+import ssl
+import threading
+import time
+from typing import (
+    Any,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+from urllib.error import HTTPError
+from urllib.parse import urljoin, urlsplit
+
+from . import instrument
+from .__version__ import __version__
+from .batch import HashResult
+from .dHash import DHash
+
+# Statuses worth another attempt, the server may succeed later.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+# Bytes read from the socket at once.
+_CHUNK_SIZE = 64 * 1024
+
+# Unread bytes drained from a response to keep its connection, the
+# connection is closed instead if more is left.
+_DRAIN_LIMIT = 64 * 1024
+
+# Progressive JPEG start of frame markers.
+_PROGRESSIVE_SOF = (0xC2, 0xC6, 0xCA, 0xCE)
+
+_EOI = b"\xff\xd9"
+
+_Key = Tuple[str, str, int]
+
+
+class _NetworkError(Exception):
+    """
+    Wraps a connection or read failure, which is worth another attempt.
+    """
+
+
+class _JpegScans(object):
+    """
+    Incremental JPEG marker walker, finds where the first scans of a
+    progressive JPEG end while the body is still arriving.
+    """
+
+    def __init__(self, scans: int, min_width: int, min_height: int) -> None:
+        self.scans = scans
+        self.min_width = min_width
+        self.min_height = min_height
+        self._position = 0
+        self._in_scan = False
+        self._seen = 0
+        self._progressive = False
+        self._done = False
+
+    def feed(self, data: bytearray) -> Optional[int]:
+        """
+        Walk the markers of the bytes received so far.
+
+        :return: The offset the body can be cut at, None to read on.
+        """
+        if self._done:
+            return None
+        if self._position == 0:
+            if len(data) < 2:
+                return None
+            if data[:2] != b"\xff\xd8":
+                self._done = True
+                return None
+            self._position = 2
+        position = self._position
+        while True:
+            if self._in_scan:
+                # entropy coded data, 0xFF is followed by 0x00 or a restart
+                # marker unless a marker ends the scan
+                end = data.find(b"\xff", position)
+                if end == -1 or end + 1 >= len(data):
+                    self._position = len(data) - 1 if end != -1 else len(data)
+                    return None
+                marker = data[end + 1]
+                if marker == 0 or 0xD0 <= marker <= 0xD7 or marker == 0xFF:
+                    position = end + 1 if marker == 0xFF else end + 2
+                    continue
+                self._in_scan = False
+                self._seen += 1
+                position = end
+                if self._progressive and self._seen >= self.scans:
+                    self._done = True
+                    return end
+                continue
+
+            if len(data) < position + 2:
+                break
+            if data[position] != 0xFF:
+                self._done = True
+                return None
+            marker = data[position + 1]
+            if marker == 0xFF:
+                position += 1
+                continue
+            if marker == 0xD9:
+                self._done = True
+                return None
+            if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+                position += 2
+                continue
+            if len(data) < position + 4:
+                break
+            length = data[position + 2] << 8 | data[position + 3]
+            if len(data) < position + 2 + length:
+                break
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height = data[position + 5] << 8 | data[position + 6]
+                width = data[position + 7] << 8 | data[position + 8]
+                self._progressive = marker in _PROGRESSIVE_SOF
+                if (
+                    not self._progressive
+                    or width < self.min_width
+                    or height < self.min_height
+                ):
+                    # baseline, or too small for the first scans to be enough
+                    self._done = True
+                    return None
+            elif marker == 0xDA:
+                self._in_scan = True
+            position += 2 + length
+        self._position = position
+        return None
+
+
+class _BodyReader(io.RawIOBase):
+    """
+    Seekable raw file over a response body, read from the socket as the
+    decoder asks for it. The bytes read are kept so the decoder can seek
+    back.
+    """
+
+    def __init__(
+        self,
+        response: http.client.HTTPResponse,
+        max_bytes: Optional[int],
+        deadline: Optional[float],
+        scans: Optional[_JpegScans],
+    ) -> None:
+        self._response = response
+        self._max_bytes = max_bytes
+        self._deadline = deadline
+        self._scans = scans
+        self._buffer = bytearray()
+        self._position = 0
+        self._eof = False
+        self.cut = False
+
+    @property
+    def bytes_read(self) -> int:
+        """
+        Bytes of the body received, without the marker added by a cut.
+        """
+        return len(self._buffer) - (2 if self.cut else 0)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def _fill(self, size: Optional[int]) -> None:
+        while not self._eof and (size is None or len(self._buffer) < size):
+            if self._deadline is not None and time.monotonic() > self._deadline:
+                raise _NetworkError("Reading the body timed out.") from TimeoutError(
+                    "Reading the body took longer than the total timeout."
+                )
+            try:
+                chunk = self._response.read1(_CHUNK_SIZE)
+            except (OSError, http.client.HTTPException) as e:
+                raise _NetworkError("Reading the body failed.") from e
+            if not chunk:
+                self._eof = True
+                return
+            self._buffer += chunk
+            if self._max_bytes is not None and len(self._buffer) > self._max_bytes:
+                raise ValueError(
+                    "The response body is larger than %d bytes." % self._max_bytes
+                )
+            if self._scans is not None:
+                end = self._scans.feed(self._buffer)
+                if end is not None:
+                    # the decoder sees the first scans of a complete file
+                    del self._buffer[end:]
+                    self._buffer += _EOI
+                    self._eof = True
+                    self.cut = True
+
+    def readinto(self, buffer: Any) -> int:
+        self._fill(self._position + len(buffer))
+        data = self._buffer[self._position : self._position + len(buffer)]
+        buffer[: len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            self._fill(None)
+            offset += len(self._buffer)
+        self._position = max(0, offset)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+
+class _ConnectionPool(object):
+    """
+    Keep-alive connections per (scheme, host, port), at most per_host of
+    them open or in use for a host at once.
+    """
+
+    def __init__(
+        self,
+        per_host: int,
+        timeout: Optional[float],
+        context: Optional[ssl.SSLContext],
+    ) -> None:
+        self.per_host = per_host
+        self.timeout = timeout
+        self.context = context
+        self.opened = 0
+        self._lock = threading.Lock()
+        self._idle: Dict[_Key, List[http.client.HTTPConnection]] = {}
+        self._slots: Dict[_Key, threading.BoundedSemaphore] = {}
+
+    def get(self, key: _Key) -> Tuple[http.client.HTTPConnection, bool]:
+        """
+        An idle connection to the host, or a new one once a slot is free.
+
+        :return: The connection, and True if it was used before.
+        """
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._slots[key] = threading.BoundedSemaphore(self.per_host)
+        slot.acquire()
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+            self.opened += 1
+        scheme, host, port = key
+        connection: http.client.HTTPConnection
+        if scheme == "https":
+            connection = http.client.HTTPSConnection(
+                host, port, timeout=self.timeout, context=self.context
+            )
+        else:
+            connection = http.client.HTTPConnection(host, port, timeout=self.timeout)
+        return connection, False
+
+    def put(self, key: _Key, connection: http.client.HTTPConnection) -> None:
+        """
+        Give back a connection that can send another request.
+        """
+        with self._lock:
+            self._idle.setdefault(key, []).append(connection)
+        self._slots[key].release()
+
+    def discard(self, key: _Key, connection: http.client.HTTPConnection) -> None:
+        """
+        Close a connection that can not be reused.
+        """
+        connection.close()
+        self._slots[key].release()
+
+    def close(self) -> None:
+        """
+        Close the idle connections.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+
+class URLHasher(object):
+    """
+    URLHasher class
+    ================
+    Hash images served over HTTP or HTTPS without writing them to a file.
+
+    Connections are kept alive and reused across URLs of the same host, and
+    the response body is read from the socket while Pillow decodes it. With
+    progressive_scans set, a large progressive JPEG is only read up to the
+    end of its first scans.
+
+    - URLHasher.hash(url) : Download and hash one image, returns a DHash.
+
+    - URLHasher.hash_many(urls, ordered) : Hash many URLs over
+      concurrency threads, yields a HashResult per URL.
+
+    - URLHasher.close() : Close the idle connections. URLHasher is also a
+      context manager.
+
+    URLHasher objects count their work in the requests, bytes_read,
+    partial_reads and retried attributes, and in the connections property.
+    """
+
+    def __init__(
+        self,
+        height: int = 8,
+        fast: bool = False,
+        concurrency: int = 8,
+        per_host: Optional[int] = None,
+        timeout: Optional[float] = 10.0,
+        total_timeout: Optional[float] = None,
+        retries: int = 2,
+        backoff: float = 0.5,
+        max_redirects: int = 5,
+        max_bytes: Optional[int] = None,
+        progressive_scans: Optional[int] = None,
+        headers: Optional[Dict[str, str]] = None,
+        context: Optional[ssl.SSLContext] = None,
+        hook: Optional[instrument.Hook] = None,
+    ) -> None:
+        """
+
+        :param height: The height used for hashing, see DHash.__init__.
+
+        :param fast: Use the fast mode, see DHash.__init__.
+
+        :param concurrency: Number of URLs hash_many() fetches at once.
+
+        :param per_host: Maximum number of connections to a single host,
+                         defaults to concurrency. Requests beyond it wait
+                         for a connection to be free.
+
+        :param timeout: Timeout in seconds of connecting and of every read
+                        from the socket, None to wait forever.
+
+        :param total_timeout: Optional limit in seconds on reading a whole
+                              response, checked between reads.
+
+        :param retries: Number of further attempts after a connection
+                        error, a timeout or a status in RETRY_STATUSES.
+                        Other errors are not retried.
+
+        :param backoff: Seconds waited before the first retry, doubled for
+                        every following retry.
+
+        :param max_redirects: Maximum number of redirects followed per URL.
+
+        :param max_bytes: Optional limit on the size of a response body, a
+                          larger body raises ValueError.
+
+        :param progressive_scans: If set, stop reading a progressive JPEG
+                                  after this many scans and hash the image
+                                  the scans received make up. The first scan
+                                  usually holds the 1/8 scale image, enough
+                                  for hashing images at least 8 times the
+                                  hash size, smaller images are read in full.
+                                  The hash may differ from the hash of the
+                                  whole file by a few bits, as in fast mode.
+                                  The connection is closed after a cut body.
+
+        :param headers: Extra request headers.
+
+        :param context: SSLContext for HTTPS, the default context if None.
+
+        :param hook: Optional instrumentation hook, see DHash.__init__.
+
+        :return: None
+
+        :rtype: NoneType
+
+        :raises ValueError: If concurrency, per_host or progressive_scans is
+                            less than 1, or retries is negative.
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1.")
+        if per_host is not None and per_host < 1:
+            raise ValueError("per_host must be at least 1.")
+        if retries < 0:
+            raise ValueError("retries must be a non-negative integer.")
+        if progressive_scans is not None and progressive_scans < 1:
+            raise ValueError("progressive_scans must be at least 1.")
+        self.height = height
+        self.fast = fast
+        self.concurrency = concurrency
+        self.total_timeout = total_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_redirects = max_redirects
+        self.max_bytes = max_bytes
+        self.progressive_scans = progressive_scans
+        self.hook = hook
+        self.headers = {"User-Agent": "dhashpy/%s" % __version__}
+        if headers:
+            self.headers.update(headers)
+        self.requests = 0
+        self.bytes_read = 0
+        self.partial_reads = 0
+        self.retried = 0
+        self._lock = threading.Lock()
+        self._pool = _ConnectionPool(
+            per_host or concurrency,
+            timeout,
+            context if context is not None else ssl.create_default_context(),
+        )
+
+    @property
+    def connections(self) -> int:
+        """
+        Number of connections opened so far.
+        """
+        return self._pool.opened
+
+    def __enter__(self) -> "URLHasher":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Close the idle connections. The hasher can still be used, it opens
+        new connections then.
+        """
+        self._pool.close()
+
+    def hash(self, url: str) -> DHash:
+        """
+        Download and hash the image at url.
+
+        :param url: http:// or https:// URL of the image.
+
+        :return: The DHash of the image, with the url as path.
+
+        :rtype: DHash
+
+        :raises urllib.error.HTTPError: If the server answers with an error
+                                        status, after the retries.
+
+        :raises OSError: If the connection fails or times out, after the
+                         retries, or the image can not be decoded.
+
+        :raises ValueError: If url is not an http or https URL.
+        """
+        attempt = 0
+        while True:
+            try:
+                return self._hash_once(url)
+            except HTTPError as e:
+                if e.code not in RETRY_STATUSES or attempt >= self.retries:
+                    raise
+            except _NetworkError as e:
+                if attempt >= self.retries:
+                    raise e.__cause__ or e
+            with self._lock:
+                self.retried += 1
+            time.sleep(self.backoff * 2**attempt)
+            attempt += 1
+
+    def _hash_once(self, url: str) -> DHash:
+        deadline = None
+        if self.total_timeout is not None:
+            deadline = time.monotonic() + self.total_timeout
+        target = url
+        for _ in range(self.max_redirects + 1):
+            key, connection, response = self._request(target)
+            location = response.getheader("Location")
+            if response.status in _REDIRECT_STATUSES and location:
+                self._release(key, connection, response)
+                target = urljoin(target, location)
+                continue
+            if not 200 <= response.status < 300:
+                self._release(key, connection, response)
+                raise HTTPError(
+                    target, response.status, response.reason, response.headers, None
+                )
+            break
+        else:
+            raise HTTPError(
+                target, response.status, "Too many redirects", response.headers, None
+            )
+
+        scans = None
+        if self.progressive_scans is not None:
+            # the first scans hold the 1/8 scale image
+            scans = _JpegScans(
+                self.progressive_scans, 64 * (self.height + 1), 64 * self.height
+            )
+        reader = _BodyReader(response, self.max_bytes, deadline, scans)
+        try:
+            dhash = DHash(
+                url,
+                self.height,
+                self.fast,
+                image=reader,  # type: ignore[arg-type]
+                hook=self.hook,
+            )
+        except BaseException:
+            response.close()
+            self._pool.discard(key, connection)
+            raise
+        finally:
+            with self._lock:
+                self.bytes_read += reader.bytes_read
+        if reader.cut:
+            with self._lock:
+                self.partial_reads += 1
+            response.close()
+            self._pool.discard(key, connection)
+        else:
+            self._release(key, connection, response)
+        return dhash
+
+    def _request(
+        self, url: str
+    ) -> Tuple[_Key, http.client.HTTPConnection, http.client.HTTPResponse]:
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError("Only http and https URLs are supported, got '%s'." % url)
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        key = (parts.scheme, parts.hostname, port)
+        target = parts.path or "/"
+        if parts.query:
+            target += "?" + parts.query
+        while True:
+            connection, reused = self._pool.get(key)
+            try:
+                connection.request("GET", target, headers=self.headers)
+                response = connection.getresponse()
+            except (OSError, http.client.HTTPException) as e:
+                self._pool.discard(key, connection)
+                if reused and isinstance(
+                    e, (http.client.RemoteDisconnected, ConnectionError)
+                ):
+                    # the server closed the idle connection, not a failure
+                    continue
+                raise _NetworkError("Request to '%s' failed." % url) from e
+            with self._lock:
+                self.requests += 1
+            return key, connection, response
+
+    def _release(
+        self,
+        key: _Key,
+        connection: http.client.HTTPConnection,
+        response: http.client.HTTPResponse,
+    ) -> None:
+        """
+        Drain what is left of a small response and pool its connection.
+        """
+        try:
+            response.read(_DRAIN_LIMIT)
+        except (OSError, http.client.HTTPException):
+            pass
+        if response.isclosed() and not response.will_close:
+            self._pool.put(key, connection)
+        else:
+            response.close()
+            self._pool.discard(key, connection)
+
+    def _hash_result(self, url: str) -> HashResult:
+        try:
+            return HashResult(url, self.hash(url).to_record(), None)
+        except Exception as e:
+            return HashResult(url, None, e)
+
+    def hash_many(
+        self, urls: Iterable[str], ordered: bool = True
+    ) -> Iterator[HashResult]:
+        """
+        Hash many URLs, at most concurrency at once. The URLs are consumed
+        lazily. Failures are reported per URL in HashResult.error.
+
+        :param urls: Iterable of http:// or https:// URLs.
+
+        :param ordered: If True the results are yielded in input order, else
+                        as soon as they complete.
+
+        :return: Iterator of HashResult, one per URL, with the URL as path.
+
+        :rtype: Iterator[HashResult]
+        """
+        max_in_flight = self.concurrency * 2
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            if ordered:
+                queue: Deque[Future] = deque()
+                for url in urls:
+                    queue.append(executor.submit(self._hash_result, url))
+                    if len(queue) >= max_in_flight:
+                        yield queue.popleft().result()
+                while queue:
+                    yield queue.popleft().result()
+            else:
+                pending: Set[Future] = set()
+                for url in urls:
+                    pending.add(executor.submit(self._hash_result, url))
+                    if len(pending) >= max_in_flight:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            yield future.result()
+                for future in as_completed(pending):
+                    yield future.result()
@@ -0,0 +1,158 @@
+"""
+Hashing of the frames of animated GIF, WebP and PNG images and of the pages
+of multi-page TIFF files.
+"""
+
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Union
+
+from .dHash import DHash, DHashRecord, _BaseHash
+from .utils import popcount
+from .variants import Source, _opened
+
+
+class FrameHash(NamedTuple):
+    """
+    Hash of one frame of an image sequence.
+
+    - FrameHash.position : Position of the frame in the sequence, from 0.
+
+    - FrameHash.record : DHashRecord of the frame.
+    """
+
+    position: int
+    record: DHashRecord
+
+
+def iter_frames(
+    source: Source,
+    height: int = 8,
+    every: int = 1,
+    max_frames: Optional[int] = None,
+    skip_distance: Optional[int] = None,
+    path: Optional[str] = None,
+) -> Iterator[FrameHash]:
+    """
+    Hash the frames of an animated image or the pages of a multi-page TIFF,
+    lazily. Single frame images yield one frame.
+
+    The frames are read one at a time with PIL.ImageSequence and only the
+    resized grayscale frame is kept while it is hashed, so memory does not
+    grow with the number of frames. The hash of every frame is the hash
+    DHash.from_image would compute for it.
+
+    A path, bytes or file object is opened when the first frame is read and
+    closed once the frames are exhausted or the iterator is closed, to stop
+    early close it, for example with contextlib.closing(). An image of the
+    caller is left open.
+
+    :param source: Path of the image, encoded image as bytes, bytearray or
+                   memoryview, binary file object or PIL.Image.Image.
+
+    :param height: The height used for hashing, see DHash.__init__.
+
+    :param every: Only hash every Nth frame, starting with the first one.
+
+    :param max_frames: Stop after yielding this many frames, None for all.
+
+    :param skip_distance: If not None, a frame within skip_distance of the
+                          last yielded frame is not yielded, so runs of near
+                          identical consecutive frames yield their first
+                          frame only. 0 skips exact repeats.
+
+    :param path: Path kept in the records, defaults to source if it is a
+                 path.
+
+    :return: Iterator of FrameHash, in sequence order.
+
+    :rtype: Iterator[FrameHash]
+
+    :raises ValueError: If every or max_frames is less than 1.
+    """
+    if every < 1:
+        raise ValueError("every must be at least 1.")
+    if max_frames is not None and max_frames < 1:
+        raise ValueError("max_frames must be at least 1.")
+    if path is None and isinstance(source, str):
+        path = source
+    return _iter_frames(source, height, every, max_frames, skip_distance, path)
+
+
+def _iter_frames(
+    source: Source,
+    height: int,
+    every: int,
+    max_frames: Optional[int],
+    skip_distance: Optional[int],
+    path: Optional[str],
+) -> Iterator[FrameHash]:
+    from PIL import Image, ImageSequence
+
+    yielded = 0
+    last: Optional[int] = None
+    # closed when the frames are exhausted or the iterator is closed
+    with _opened(source) as image:
+        for index, frame in enumerate(ImageSequence.Iterator(image)):
+            if index % every:
+                continue
+            resized = frame.convert("L").resize((height + 1, height), Image.LANCZOS)
+            hash_int = DHash._image_to_int(resized)
+            if (
+                skip_distance is not None
+                and last is not None
+                and popcount(hash_int ^ last) <= skip_distance
+            ):
+                continue
+            last = hash_int
+            yield FrameHash(index, DHashRecord(hash_int, height, path))
+            yielded += 1
+            if yielded == max_frames:
+                return
+
+
+def sequence_signature(
+    frames: Iterable[Union[FrameHash, _BaseHash]],
+) -> DHashRecord:
+    """
+    Compact signature of a whole sequence, the bitwise majority of the
+    frame hashes. Every bit is set if it is set in more than half of the
+    frames. The signature is a hash like any other, sequences are matched
+    by the hamming distance of their signatures.
+
+    Pass the frames of iter_frames with a skip_distance to weight every
+    scene of the sequence the same however long it lasts.
+
+    :param frames: Iterable of FrameHash, DHash or DHashRecord, all of the
+                   same height.
+
+    :return: DHashRecord of the signature, with the path of the first frame.
+
+    :rtype: DHashRecord
+
+    :raises ValueError: If there are no frames or they have different heights.
+    """
+    counts: List[int] = []
+    total = 0
+    first: Optional[_BaseHash] = None
+    for frame in frames:
+        record = frame.record if isinstance(frame, FrameHash) else frame
+        if first is None:
+            first = record
+            counts = [0] * record.bits_in_hash
+        elif record.height != first.height:
+            raise ValueError(
+                "Can not mix frames of height %d and %d."
+                % (first.height, record.height)
+            )
+        hash_int = record.hash_int
+        for bit in range(len(counts)):
+            if hash_int >> bit & 1:
+                counts[bit] += 1
+        total += 1
+    if first is None:
+        raise ValueError("A signature needs at least one frame.")
+
+    signature = 0
+    for bit, count in enumerate(counts):
+        if 2 * count > total:
+            signature |= 1 << bit
+    return DHashRecord(signature, first.height, first.path)
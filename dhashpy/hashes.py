@@ -0,0 +1,375 @@
+"""
+Hash values, their comparison and their string conversions.
+
+Nothing in this module needs Pillow, services that only compare stored
+hashes can use DHashRecord and the functions below without importing it.
+DHash adds the image hashing on top of _BaseHash.
+"""
+
+from typing import Any, Optional, Tuple, Union
+
+from .utils import hamming_distance_int, int2bin, int2hex, parse_hash_string
+
+
+class _BaseHash(object):
+    """
+    Comparison and formatting shared by DHash and DHashRecord.
+
+    The hash is stored as an integer in hash_int, the binary and hexadecimal
+    strings are only built when they are requested.
+    """
+
+    __slots__ = ()
+
+    hash_int: int
+    height: int
+    path: Optional[str]
+
+    @property
+    def width(self) -> int:
+        """
+        The resized width of the input image, height + 1. Units are pixels.
+        """
+        return self.height + 1
+
+    @property
+    def bits_in_hash(self) -> int:
+        """
+        Total number of bits in the hash. Equal n^2, where n is the height.
+        """
+        return self.height * self.height
+
+    @property
+    def hash(self) -> str:
+        """
+        A binary string prefixed with "0b", the hash of the input image.
+        """
+        return int2bin(self.hash_int, self.bits_in_hash)
+
+    @property
+    def hash_hex(self) -> str:
+        """
+        Hexadecimal representation of the binary string hash.
+        """
+        return int2hex(self.hash_int)
+
+    def to_bytes(self) -> bytes:
+        """
+        The hash as (bits_in_hash + 7) // 8 big-endian bytes, 8 bytes for the
+        default height. The first bit of the hash is the most significant bit
+        of the first byte. Read back with DHashRecord.from_bytes().
+
+        :return: The hash bits.
+
+        :rtype: bytes
+        """
+        return self.hash_int.to_bytes((self.bits_in_hash + 7) // 8, "big")
+
+    def __str__(self) -> str:
+        """
+        String representation of the instance and is same as the hash attribute.
+
+        :return: Binary hash value for the image, prefixed with "0b".
+
+        :rtype: str
+        """
+        return self.hash
+
+    def __len__(self) -> int:
+        """
+        length of the hash, including the prefix 0b. len = bits_in_hash + 2
+
+        :return: Length of the binary hash value for the image.
+
+        :rtype: int
+        """
+        return self.bits_in_hash + 2
+
+    def __repr__(self) -> str:
+        """
+        Representation of the instance.
+
+        :return: String representation of the object.
+
+        :rtype: str
+        """
+        return "%s(hash=%s, hash_hex=%s, path=%s)" % (
+            type(self).__name__,
+            self.hash,
+            self.hash_hex,
+            self.path,
+        )
+
+    def __ne__(self, other: object) -> bool:
+        """
+        Implement '!=' on the instance.
+
+        :param other: Can be instance of DHash or DHashRecord class or a string
+                      starting with "0x" or "0b", representing hexadecimal or
+                      binary value.
+
+        :return: Return True if not equal else return False.
+
+        :rtype: bool
+        """
+        if self.__eq__(other):
+            return False
+        return True
+
+    def __eq__(self, other: object) -> bool:
+        """
+        Implement '==' on the instance.
+
+        :param other: Can be instance of DHash or DHashRecord class or a string
+                      starting with "0x" or "0b", representing hexadecimal or
+                      binary value.
+
+        :return: Return True if equal else return False.
+
+        :rtype: bool
+        """
+
+        if self.__sub__(other) == 0:
+            return True
+        return False
+
+    def __sub__(self, other: object) -> int:
+        """
+        Implement the usage of '-' on the instance and
+        Also compatibile with hexadecimal and binary strings
+
+        :param other: Can be instance of DHash or DHashRecord class or a string
+                      starting with "0x" or "0b", representing hexadecimal or
+                      binary value. If binary string is supplied hash must of
+                      the same bits as this instance.
+
+        :return: Hamming distance of the two objects/binary string/hexadecimal
+                 string being compared.
+
+        :rtype: int
+        """
+        if other is None:
+            raise TypeError("Other hash is None. And it must not be None.")
+
+        if isinstance(other, str):
+            other_int, other_bits = parse_hash_string(other)
+            if other_bits is not None and other_bits != self.bits_in_hash:
+                raise ValueError(
+                    "Can not compare different bits hashes. "
+                    "You must supply a %d bits hash." % self.bits_in_hash
+                )
+            if other_int.bit_length() > self.bits_in_hash:
+                raise ValueError(
+                    "Hash value has more than %d bits, "
+                    "can not compute hamming distance." % self.bits_in_hash
+                )
+            return hamming_distance_int(self.hash_int, other_int)
+
+        if isinstance(other, _BaseHash):
+            if other.bits_in_hash != self.bits_in_hash:
+                raise ValueError(
+                    "Can not compare different bits hashes. %d bits and %d bits."
+                    % (self.bits_in_hash, other.bits_in_hash)
+                )
+            return hamming_distance_int(self.hash_int, other.hash_int)
+
+        raise TypeError(
+            "To calculate difference both of the hashes must be either "
+            "hexadecimal/binary strings or instance of DHash"
+        )
+
+
+def parse_hash(value: object) -> Tuple[int, Optional[int]]:
+    """
+    Convert any of the accepted hash inputs to an integer.
+
+    :param value: Instance of DHash or DHashRecord, a string starting with
+                  "0x" or "0b", or a non-negative integer.
+
+    :return: A tuple of the integer hash value and the number of bits in the
+             hash. The number of bits is None for hexadecimal strings and
+             integers, as it can not be known from the value.
+
+    :rtype: tuple
+
+    :raises TypeError: If the value is not one of the accepted types.
+
+    :raises ValueError: If the value is a negative integer or an invalid string.
+    """
+    if isinstance(value, _BaseHash):
+        return value.hash_int, value.bits_in_hash
+    if isinstance(value, str):
+        return parse_hash_string(value)
+    if isinstance(value, int) and not isinstance(value, bool):
+        if value < 0:
+            raise ValueError("Integer hash value must not be negative.")
+        return value, None
+    raise TypeError(
+        "Hash must be an instance of DHash, DHashRecord, a hexadecimal/binary "
+        "string or an integer."
+    )
+
+
+class DHashRecord(_BaseHash):
+    """
+    DHashRecord class
+    ==================
+    DHashRecord is a compact record of an already computed dhash value. It
+    supports the same comparisons as DHash but uses __slots__ and only stores
+    the integer hash, the height and the path. It does not keep the resized
+    image, so it is suited for keeping millions of hashes in memory.
+
+    DHashRecord objects have the following attributes:
+
+    - DHashRecord.hash_int : The hash as an integer.
+
+    - DHashRecord.height : The height used when computing the hash.
+
+    - DHashRecord.path : The path of the input image, may be None.
+
+    And the read only hash, hash_hex, width and bits_in_hash properties,
+    same as for DHash objects.
+    """
+
+    __slots__ = ("hash_int", "height", "path")
+
+    def __init__(
+        self, hash_int: int, height: int = 8, path: Optional[str] = None
+    ) -> None:
+        """
+
+        :param hash_int: The hash value as a non-negative integer.
+
+        :param height: The height used when computing the hash. The hash must
+                       not have more than height^2 bits.
+
+        :param path: The path of the hashed image, optional.
+
+        :return: None
+
+        :rtype: NoneType
+
+        :raises ValueError: If hash_int is negative or has more than height^2
+                            bits.
+        """
+        if hash_int < 0 or hash_int.bit_length() > height * height:
+            raise ValueError(
+                "hash_int must be a non-negative integer of at most %d bits."
+                % (height * height)
+            )
+        self.hash_int = hash_int
+        self.height = height
+        self.path = path
+
+    @classmethod
+    def from_bytes(
+        cls,
+        data: Union[bytes, bytearray, memoryview],
+        height: int = 8,
+        path: Optional[str] = None,
+    ) -> "DHashRecord":
+        """
+        Read a hash written by to_bytes().
+
+        :param data: The (height^2 + 7) // 8 big-endian bytes of the hash.
+
+        :param height: The height used when computing the hash.
+
+        :param path: The path of the hashed image, optional.
+
+        :return: The record of the hash.
+
+        :rtype: DHashRecord
+
+        :raises ValueError: If data is not of the size of a height^2 bits hash.
+        """
+        size = (height * height + 7) // 8
+        if len(data) != size:
+            raise ValueError(
+                "A %d bits hash is %d bytes, got %d bytes."
+                % (height * height, size, len(data))
+            )
+        return cls(int.from_bytes(data, "big"), height, path)
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        """
+        Pickle only the hash, the height and the path.
+        """
+        return type(self), (self.hash_int, self.height, self.path)
+
+
+def hamming_distance(string_a: str, string_b: str) -> int:
+    """
+    Computes and returns the hamming distance between the
+    two input strings.
+
+    The two input strings must be of equal length as the Hamming distance is
+    undefined when strings are of unequal length.
+
+    Binary strings prefixed with "0b" are compared as integers, with
+    XOR and popcount, other strings are compared character by character.
+
+    :param string_a: A python string representing a binary number, prefixed with "0b"
+
+    :param string_b: A python string representing a binary number, prefixed with "0b"
+
+    :return: Hamming distance between the two input strings.
+
+    :rtype: int
+
+    :raises ValueError: When both the strings are not of equal length.
+    """
+    if len(string_a) != len(string_b):
+        raise ValueError(
+            "Strings are of unequal length can not compute hamming distance. "
+            "Hamming distance is undefined."
+        )
+    if (
+        string_a[:2] == "0b"
+        and string_b[:2] == "0b"
+        and not set(string_a[2:]).union(string_b[2:]).difference("01")
+    ):
+        return hamming_distance_int(int(string_a, 2), int(string_b, 2))
+    return sum(char_1 != char_2 for char_1, char_2 in zip(string_a, string_b))
+
+
+def hex2bin(hexstr: str, padding: int) -> str:
+    """
+    Convert the input string from hexadecimal to binary representation.
+
+
+    :param hexstr: hexadecimal string and must be prefixed with "0x".
+
+    :param padding: integer indicating the required padding for the string.
+                    padding is useful if hamming distance of the output
+                    binary string is to be computed. Hamming distance is not
+                    defined for strings of unequal length.
+
+    :return: Binary representation of the input hexadecimal string.
+
+    :rtype: str
+
+    :raises ValueError: If hexadecimal input string is not prefixed with "0x".
+    """
+    if not hexstr.lower().startswith("0x"):
+        raise ValueError("Input hexadecimal string must have '0x' as the prefix.")
+    return "0b" + str(bin(int(hexstr.lower(), 0))).replace("0b", "").zfill(padding)
+
+
+def bin2hex(binstr: str) -> str:
+    """
+    Converts input string from Binary to hexadecimal representation.
+
+    :param binstr: Binary string and must be prefixed with "0b".
+
+    :return: Hexadecimal representation of the input
+             binary string prefixed with "0x" indicating that it's
+             hexadecimal string.
+
+    :rtype: str
+
+    :raises ValueError: If binary input string is not prefixed with "0b".
+    """
+    if not binstr.lower().startswith("0b"):
+        raise ValueError("Binary string must be prefixed with '0b'.")
+    return str(hex(int(binstr, 2)))
@@ -0,0 +1,295 @@
+"""
+BK-tree index for near-duplicate range queries over dhash values.
+"""
+
+import heapq
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .hashes import parse_hash
+from .utils import popcount
+
+
+def coerce_hash(
+    value: object, bits_in_hash: Optional[int]
+) -> Tuple[int, Optional[int]]:
+    """
+    Convert a hash input to an integer and check it against the number of
+    bits of a collection of hashes.
+
+    :param value: Instance of DHash or DHashRecord, a string starting with
+                  "0x" or "0b", or a non-negative integer.
+
+    :param bits_in_hash: Number of bits of the collection, None if unknown.
+
+    :return: A tuple of the integer hash value and the number of bits, which
+             is bits_in_hash if the value does not tell its number of bits.
+
+    :rtype: tuple
+
+    :raises ValueError: If the number of bits of value does not match
+                        bits_in_hash or the value has too many bits.
+
+    :raises TypeError: If the value is not one of the accepted types.
+    """
+    hash_int, bits = parse_hash(value)
+    if bits is not None and bits_in_hash is not None and bits != bits_in_hash:
+        raise ValueError(
+            "Can not mix different bits hashes. Expected a %d bits hash, got %d bits."
+            % (bits_in_hash, bits)
+        )
+    if bits is None:
+        bits = bits_in_hash
+    if bits is not None and hash_int.bit_length() > bits:
+        raise ValueError(
+            "Hash value has more than %d bits. Hash values must be of the same bits."
+            % bits
+        )
+    return hash_int, bits
+
+
+class _Node(object):
+    __slots__ = ("hash_int", "values", "children")
+
+    def __init__(self, hash_int: int) -> None:
+        self.hash_int = hash_int
+        self.values: List[Any] = []
+        self.children: Dict[int, "_Node"] = {}
+
+
+class DHashIndex(object):
+    """
+    DHashIndex class
+    =================
+    A BK-tree over integer hash values, for finding every hash within a
+    hamming distance of a query without comparing against all the hashes.
+
+    Hashes can be instances of DHash or DHashRecord, strings starting with
+    "0x" or "0b" or integers, the same inputs DHash.__sub__ accepts plus
+    integers. All the hashes of an index must have the same number of bits.
+
+    Each hash is stored with a value, by default the hash input itself, and
+    the queries return (distance, value) tuples. The same hash can be added
+    more than once with different values.
+
+    - DHashIndex.add(hash, value) : Add a hash to the index.
+
+    - DHashIndex.remove(hash, value) : Remove a hash from the index.
+
+    - DHashIndex.query(hash, max_distance) : All values within max_distance.
+
+    - DHashIndex.nearest(hash, k) : The k values closest to the hash.
+    """
+
+    def __init__(
+        self, hashes: Iterable[object] = (), bits_in_hash: Optional[int] = None
+    ) -> None:
+        """
+
+        :param hashes: Optional iterable of hashes to add, with the hash as value.
+
+        :param bits_in_hash: Number of bits of the hashes in the index. If None
+                             it is taken from the first DHash, DHashRecord or
+                             binary string added.
+
+        :return: None
+
+        :rtype: NoneType
+        """
+        self._root: Optional[_Node] = None
+        self._bits_in_hash = bits_in_hash
+        self._max_bit_length = 0
+        self._len = 0
+        for hash_value in hashes:
+            self.add(hash_value)
+
+    @property
+    def bits_in_hash(self) -> Optional[int]:
+        """
+        Number of bits of the hashes in the index, None if not yet known.
+        """
+        return self._bits_in_hash
+
+    def __len__(self) -> int:
+        """
+        Number of values in the index.
+        """
+        return self._len
+
+    def __contains__(self, hash_value: object) -> bool:
+        """
+        True if the hash is in the index, with any value.
+        """
+        node = self._find(self._to_int(hash_value))
+        return node is not None and bool(node.values)
+
+    def __iter__(self) -> Iterator[Tuple[int, Any]]:
+        """
+        Iterate over the (hash_int, value) pairs of the index.
+        """
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            for value in node.values:
+                yield node.hash_int, value
+            stack.extend(node.children.values())
+
+    def _to_int(self, hash_value: object, learn: bool = False) -> int:
+        """
+        The hash as an integer, checked against bits_in_hash. Only add()
+        passes learn, to take bits_in_hash from the first hash telling it,
+        so that queries never fix the number of bits of the index.
+        """
+        hash_int, bits = coerce_hash(hash_value, self._bits_in_hash)
+        if learn and bits is not None and self._bits_in_hash is None:
+            if self._max_bit_length > bits:
+                raise ValueError("Index has hash values of more than %d bits." % bits)
+            self._bits_in_hash = bits
+        return hash_int
+
+    def _find(self, hash_int: int) -> Optional[_Node]:
+        node = self._root
+        while node is not None:
+            distance = popcount(node.hash_int ^ hash_int)
+            if distance == 0:
+                return node
+            node = node.children.get(distance)
+        return None
+
+    def add(self, hash_value: object, value: Any = None) -> None:
+        """
+        Add a hash to the index.
+
+        :param hash_value: Instance of DHash or DHashRecord, a string starting
+                           with "0x" or "0b", or an integer.
+
+        :param value: The value returned by the queries for this hash. If None
+                      the hash_value itself is used.
+
+        :return: None
+
+        :rtype: NoneType
+
+        :raises ValueError: If the hash does not have the same number of bits
+                            as the index.
+        """
+        hash_int = self._to_int(hash_value, learn=True)
+        if value is None:
+            value = hash_value
+        self._max_bit_length = max(self._max_bit_length, hash_int.bit_length())
+        self._len += 1
+
+        if self._root is None:
+            self._root = _Node(hash_int)
+            self._root.values.append(value)
+            return
+
+        node = self._root
+        while True:
+            distance = popcount(node.hash_int ^ hash_int)
+            if distance == 0:
+                node.values.append(value)
+                return
+            child = node.children.get(distance)
+            if child is None:
+                child = node.children[distance] = _Node(hash_int)
+                child.values.append(value)
+                return
+            node = child
+
+    def remove(self, hash_value: object, value: Any = None) -> None:
+        """
+        Remove a hash from the index.
+
+        The node of the hash is kept in the tree for routing the queries,
+        only the values are removed.
+
+        :param hash_value: The hash to remove.
+
+        :param value: If None all the values of the hash are removed, else
+                      only the first value equal to it.
+
+        :return: None
+
+        :rtype: NoneType
+
+        :raises KeyError: If the hash, or the value, is not in the index.
+        """
+        node = self._find(self._to_int(hash_value))
+        if node is None or not node.values:
+            raise KeyError(hash_value)
+        if value is None:
+            self._len -= len(node.values)
+            node.values = []
+            return
+        try:
+            node.values.remove(value)
+        except ValueError:
+            raise KeyError(value) from None
+        self._len -= 1
+
+    def query(self, hash_value: object, max_distance: int) -> List[Tuple[int, Any]]:
+        """
+        Find all the values whose hash is within max_distance of hash_value.
+
+        :param hash_value: The query hash.
+
+        :param max_distance: Maximum hamming distance, inclusive.
+
+        :return: List of (distance, value) tuples sorted by distance.
+
+        :rtype: list
+        """
+        hash_int = self._to_int(hash_value)
+        results: List[Tuple[int, Any]] = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = popcount(node.hash_int ^ hash_int)
+            if distance <= max_distance:
+                results.extend((distance, value) for value in node.values)
+            low, high = distance - max_distance, distance + max_distance
+            for child_distance, child in node.children.items():
+                if low <= child_distance <= high:
+                    stack.append(child)
+        results.sort(key=lambda result: result[0])
+        return results
+
+    def nearest(self, hash_value: object, k: int = 1) -> List[Tuple[int, Any]]:
+        """
+        Find the k values whose hashes are closest to hash_value.
+
+        :param hash_value: The query hash.
+
+        :param k: Number of values to return.
+
+        :return: List of at most k (distance, value) tuples sorted by distance.
+
+        :rtype: list
+        """
+        hash_int = self._to_int(hash_value)
+        if k < 1:
+            return []
+        # max heap of the best k so far, as (-distance, counter, value)
+        best: List[Tuple[int, int, Any]] = []
+        counter = 0
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = popcount(node.hash_int ^ hash_int)
+            for value in node.values:
+                if len(best) < k:
+                    heapq.heappush(best, (-distance, counter, value))
+                elif distance < -best[0][0]:
+                    heapq.heapreplace(best, (-distance, counter, value))
+                counter += 1
+            radius = -best[0][0] if len(best) == k else None
+            children = [
+                (abs(child_distance - distance), child)
+                for child_distance, child in node.children.items()
+                if radius is None or abs(child_distance - distance) < radius
+            ]
+            # visit the most promising child first, it is pushed last
+            children.sort(key=lambda child: child[0], reverse=True)
+            stack.extend(child for _, child in children)
+        best.sort(key=lambda item: (-item[0], item[1]))
+        return [(-distance, value) for distance, _, value in best]
@@ -0,0 +1,326 @@
+"""
+Opt-in instrumentation of the hashing pipeline.
+
+Hooks are callables taking a HashEvent. They are called once per hashed
+image, after the hash is computed or the hashing failed, in the thread and
+process that hashed the image. Hooks are registered globally with add_hook()
+or passed to a single DHash with its hook argument. When no hook is
+registered nothing is timed or measured.
+"""
+
+import collections
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# The stages of DHash._calc_hash, in order.
+STAGES = ("open", "decode", "grayscale", "resize", "bits")
+
+Hook = Callable[["HashEvent"], None]
+
+_hooks: List[Hook] = []
+
+
+def add_hook(hook: Hook) -> None:
+    """
+    Register a hook called with a HashEvent for every image hashed.
+
+    Hooks are per process, images hashed in the worker processes of
+    hash_many() and scan() do not reach the hooks of the parent process.
+
+    :param hook: Callable taking a HashEvent. Exceptions raised by the hook
+                 propagate to the caller of DHash.
+
+    :return: None
+
+    :rtype: NoneType
+    """
+    _hooks.append(hook)
+
+
+def remove_hook(hook: Hook) -> None:
+    """
+    Unregister a hook added with add_hook().
+
+    :param hook: The hook to remove.
+
+    :return: None
+
+    :rtype: NoneType
+
+    :raises ValueError: If the hook is not registered.
+    """
+    _hooks.remove(hook)
+
+
+class HashEvent(object):
+    """
+    HashEvent class
+    ================
+    What happened while hashing one image.
+
+    - HashEvent.path : The path of the image, None if unknown.
+
+    - HashEvent.height, HashEvent.fast : The hashing parameters.
+
+    - HashEvent.format : The format detected by Pillow, "JPEG", "PNG", ...
+                         None for decoded images.
+
+    - HashEvent.mode : The mode of the source image, before the grayscale
+                       conversion.
+
+    - HashEvent.size : (width, height) of the source image, in pixels.
+
+    - HashEvent.bytes : Size of the encoded image, None if unknown.
+
+    - HashEvent.stages : Dict of the seconds spent in each of STAGES that
+                         ran. "decode" includes the fast mode reduction.
+
+    - HashEvent.cached : True if the hash was read from a HashCache.
+
+    - HashEvent.error : The exception raised, None on success.
+    """
+
+    __slots__ = (
+        "path",
+        "height",
+        "fast",
+        "format",
+        "mode",
+        "size",
+        "bytes",
+        "stages",
+        "cached",
+        "error",
+    )
+
+    def __init__(self, path: Optional[str], height: int, fast: bool) -> None:
+        self.path = path
+        self.height = height
+        self.fast = fast
+        self.format: Optional[str] = None
+        self.mode: Optional[str] = None
+        self.size: Optional[Tuple[int, int]] = None
+        self.bytes: Optional[int] = None
+        self.stages: Dict[str, float] = {}
+        self.cached = False
+        self.error: Optional[BaseException] = None
+
+    @property
+    def total(self) -> float:
+        """
+        Seconds spent in all the stages.
+        """
+        return sum(self.stages.values())
+
+    @property
+    def pixels(self) -> Optional[int]:
+        """
+        Number of pixels of the source image, None if unknown.
+        """
+        return None if self.size is None else self.size[0] * self.size[1]
+
+    def __repr__(self) -> str:
+        return (
+            "HashEvent(path=%r, format=%r, mode=%r, size=%r, total=%.6f, error=%r)"
+            % (
+                self.path,
+                self.format,
+                self.mode,
+                self.size,
+                self.total,
+                self.error,
+            )
+        )
+
+
+def _encoded_size(image: Any) -> Optional[int]:
+    fp = getattr(image, "fp", None)
+    try:
+        position = fp.tell()  # type: ignore[union-attr]
+        size = fp.seek(0, 2)  # type: ignore[union-attr]
+        fp.seek(position)  # type: ignore[union-attr]
+        return size
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+class Recorder(object):
+    """
+    Times the stages of one hashing and calls the hooks with the HashEvent.
+    Created by recorder(), only when there is a hook to call.
+    """
+
+    __slots__ = ("event", "hooks", "_last")
+
+    def __init__(self, event: HashEvent, hooks: List[Hook]) -> None:
+        self.event = event
+        self.hooks = hooks
+        self._last = time.perf_counter()
+
+    def mark(self, stage: str) -> None:
+        """
+        End a stage, started at the end of the previous one.
+        """
+        now = time.perf_counter()
+        self.event.stages[stage] = now - self._last
+        self._last = now
+
+    def opened(self, image: Any) -> None:
+        """
+        End the "open" stage and record what is known of the source image.
+        """
+        self.mark("open")
+        event = self.event
+        event.format = image.format
+        event.mode = image.mode
+        event.size = image.size
+        event.bytes = _encoded_size(image)
+        self._last = time.perf_counter()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        """
+        Call the hooks with the completed event.
+        """
+        self.event.error = error
+        for hook in self.hooks:
+            hook(self.event)
+
+
+def recorder(
+    hook: Optional[Hook], path: Optional[str], height: int, fast: bool
+) -> Optional[Recorder]:
+    """
+    A Recorder calling hook and the global hooks, None if there are none.
+    """
+    if hook is None and not _hooks:
+        return None
+    hooks = list(_hooks)
+    if hook is not None:
+        hooks.append(hook)
+    return Recorder(HashEvent(path, height, fast), hooks)
+
+
+class HashStats(object):
+    """
+    HashStats class
+    ================
+    A hook aggregating HashEvents into counters, for exporting to a metrics
+    system. Register it with add_hook(stats) or pass it as the hook of a
+    DHash. It can be shared by several threads.
+
+    Images with more than flag_pixels pixels or that took more than
+    flag_seconds to hash are flagged, the first max_flagged of them are kept
+    in HashStats.flagged as (path, reason) tuples.
+
+    - HashStats.count, HashStats.errors, HashStats.cached : Number of images
+      hashed, failed and read from a cache.
+
+    - HashStats.stage_seconds : Total seconds per stage.
+
+    - HashStats.formats, HashStats.modes, HashStats.error_types : Counters.
+
+    - HashStats.bytes_read, HashStats.pixels : Totals over the images.
+
+    - HashStats.max_pixels : Largest source image seen, in pixels.
+
+    - HashStats.as_dict() : All the above as a JSON serializable dict.
+    """
+
+    def __init__(
+        self,
+        flag_pixels: Optional[int] = 50_000_000,
+        flag_seconds: Optional[float] = 1.0,
+        max_flagged: int = 100,
+    ) -> None:
+        """
+
+        :param flag_pixels: Flag source images larger than this, None to never
+                            flag on size.
+
+        :param flag_seconds: Flag images slower to hash than this, None to
+                             never flag on time.
+
+        :param max_flagged: Maximum number of flagged images kept.
+
+        :return: None
+
+        :rtype: NoneType
+        """
+        self.flag_pixels = flag_pixels
+        self.flag_seconds = flag_seconds
+        self.max_flagged = max_flagged
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Zero all the counters.
+        """
+        self.count = 0
+        self.errors = 0
+        self.cached = 0
+        self.stage_seconds: Dict[str, float] = dict.fromkeys(STAGES, 0.0)
+        self.formats: collections.Counter = collections.Counter()
+        self.modes: collections.Counter = collections.Counter()
+        self.error_types: collections.Counter = collections.Counter()
+        self.bytes_read = 0
+        self.pixels = 0
+        self.max_pixels = 0
+        self.flagged: List[Tuple[Optional[str], str]] = []
+
+    def __call__(self, event: HashEvent) -> None:
+        """
+        Add a HashEvent to the counters.
+        """
+        reasons = []
+        pixels = event.pixels
+        total = event.total
+        if self.flag_pixels is not None and pixels and pixels > self.flag_pixels:
+            reasons.append("%d pixels" % pixels)
+        if self.flag_seconds is not None and total > self.flag_seconds:
+            reasons.append("%.3f seconds" % total)
+
+        with self._lock:
+            self.count += 1
+            if event.error is not None:
+                self.errors += 1
+                self.error_types[type(event.error).__name__] += 1
+            if event.cached:
+                self.cached += 1
+            for stage, seconds in event.stages.items():
+                self.stage_seconds[stage] += seconds
+            if event.format is not None:
+                self.formats[event.format] += 1
+            if event.mode is not None:
+                self.modes[event.mode] += 1
+            if event.bytes is not None:
+                self.bytes_read += event.bytes
+            if pixels:
+                self.pixels += pixels
+                self.max_pixels = max(self.max_pixels, pixels)
+            if reasons and len(self.flagged) < self.max_flagged:
+                self.flagged.append((event.path, ", ".join(reasons)))
+
+    def as_dict(self) -> Dict[str, Any]:
+        """
+        The counters as a JSON serializable dict.
+
+        :return: Dict of the counters.
+
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                "count": self.count,
+                "errors": self.errors,
+                "cached": self.cached,
+                "stage_seconds": dict(self.stage_seconds),
+                "formats": dict(self.formats),
+                "modes": dict(self.modes),
+                "error_types": dict(self.error_types),
+                "bytes_read": self.bytes_read,
+                "pixels": self.pixels,
+                "max_pixels": self.max_pixels,
+                "flagged": [list(flag) for flag in self.flagged],
+            }
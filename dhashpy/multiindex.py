@@ -0,0 +1,411 @@
+"""
+Multi-index hashing, sub-linear range queries over very large sets of hashes.
+
+Every hash is split into m disjoint substrings and every substring has its
+own sorted lookup table. Two hashes within r bits of each other differ by
+at most r // m bits in one of their substrings (the pigeonhole principle),
+so a query only looks up the substring values within that radius in each
+table, and verifies the hashes found with a popcount of the full hash.
+
+See "Fast Exact Search in Hamming Space with Multi-Index Hashing", Norouzi,
+Punjani and Fleet, 2014.
+"""
+
+from functools import lru_cache
+from itertools import combinations
+import math
+from typing import Any, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from . import vectorized
+from .index import coerce_hash
+from .serialize import Buffer, hash_size, unpack_ints
+from .store import word_distances
+from .compare import pack_words
+
+
+class MultiIndexResult(NamedTuple):
+    """
+    Result of MultiIndex.search().
+
+    - MultiIndexResult.positions : NumPy array of int64 positions of the
+                                   hashes within max_distance, sorted by
+                                   distance then position.
+
+    - MultiIndexResult.distances : NumPy array of uint16 distances, same
+                                   order as positions.
+
+    - MultiIndexResult.probes : Number of substring values looked up in the
+                                tables, 0 if the query scanned every hash.
+
+    - MultiIndexResult.candidates : Number of table entries found. A hash
+                                    found in several tables is counted once
+                                    per table.
+
+    - MultiIndexResult.verified : Number of distinct hashes whose distance
+                                  to the query was computed.
+    """
+
+    positions: Any
+    distances: Any
+    probes: int
+    candidates: int
+    verified: int
+
+
+def default_substrings(bits_in_hash: int, count: int) -> int:
+    """
+    Number of substrings for count hashes of bits_in_hash bits.
+
+    About bits_in_hash / log2(count) substrings, so that each substring
+    value is shared by a few hashes, and substrings of at most 64 bits.
+
+    :param bits_in_hash: Number of bits of the hashes.
+
+    :param count: Number of hashes in the index.
+
+    :return: The number of substrings, between 1 and bits_in_hash.
+
+    :rtype: int
+    """
+    substrings = round(bits_in_hash / math.log2(max(count, 2)))
+    substrings = max(substrings, (bits_in_hash + 63) // 64, 1)
+    return min(substrings, max(bits_in_hash, 1))
+
+
+@lru_cache(maxsize=64)
+def _flip_masks(length: int, radius: int) -> Any:
+    """
+    Every value of length bits with at most radius bits set, as uint64.
+    """
+    masks = [
+        sum(1 << bit for bit in bits)
+        for flipped in range(radius + 1)
+        for bits in combinations(range(length), flipped)
+    ]
+    return vectorized.numpy.array(masks, dtype=vectorized.numpy.uint64)
+
+
+def _probe_count(length: int, radius: int) -> int:
+    """
+    Number of values of length bits with at most radius bits set.
+    """
+    count = total = 1
+    for flipped in range(1, min(radius, length) + 1):
+        count = count * (length - flipped + 1) // flipped
+        total += count
+    return total if radius >= 0 else 0
+
+
+def _key_dtype(length: int) -> str:
+    for size in (8, 16, 32):
+        if length <= size:
+            return "u%d" % (size // 8)
+    return "u8"
+
+
+class MultiIndex(object):
+    """
+    MultiIndex class
+    =================
+    Read only multi-index hashing table over NumPy arrays, for range queries
+    over 100M+ hashes without scanning them all.
+
+    The hashes are split into substrings of about log2(count) bits. A query
+    within r bits looks up the substring values within about r / m bits in
+    the sorted table of each substring, so it stays fast while r / m is
+    small, up to 4 or 5 bits. Queries that would look up more substring
+    values than there are hashes scan every hash instead.
+
+    The index keeps the hashes as uint64 words, and for every substring a
+    sorted array of the substring values and the positions of their hashes,
+    8 + m * 8 bytes per 64 bits hash for less than 2^32 hashes.
+
+    - MultiIndex(hashes, bits_in_hash, ids, substrings) : Build the index.
+
+    - MultiIndex.from_packed(data, height, ids, substrings) : Build the
+      index from the buffer of pack_hashes().
+
+    - MultiIndex.search(hash, max_distance) : Positions, distances and
+      lookup counts of the hashes within max_distance.
+
+    - MultiIndex.query(hash, max_distance) : All ids within max_distance.
+
+    - MultiIndex.hash_int(i), MultiIndex.id(i) : The i-th hash and id.
+    """
+
+    def __init__(
+        self,
+        hashes: Iterable[Any],
+        bits_in_hash: Optional[int] = None,
+        ids: Optional[Sequence[str]] = None,
+        substrings: Optional[int] = None,
+    ) -> None:
+        """
+
+        :param hashes: NumPy array of uint64 words as returned by
+                       pack_words(), the fastest to build from, or an
+                       iterable of DHash, DHashRecord, "0x"/"0b" strings or
+                       integers.
+
+        :param bits_in_hash: Number of bits of the hashes, required for
+                             arrays, integers and hexadecimal strings.
+
+        :param ids: Optional ids or paths of the hashes, in the same order.
+                    The queries return positions if there are no ids.
+
+        :param substrings: Number of substrings m, see default_substrings().
+
+        :return: None
+
+        :rtype: NoneType
+
+        :raises ImportError: If NumPy is not installed.
+
+        :raises ValueError: If the number of bits is unknown, the hashes have
+                            different numbers of bits, the substrings are
+                            longer than 64 bits or there are not as many ids
+                            as hashes.
+        """
+        numpy = vectorized.numpy
+        if numpy is None:
+            raise ImportError("MultiIndex requires NumPy, pip install numpy.")
+        if not isinstance(hashes, numpy.ndarray):
+            values: List[int] = []
+            for hash_value in hashes:
+                hash_int, bits_in_hash = coerce_hash(hash_value, bits_in_hash)
+                values.append(hash_int)
+            if bits_in_hash is None:
+                raise ValueError(
+                    "bits_in_hash is unknown, pass it or add a DHash, "
+                    "DHashRecord or binary string first."
+                )
+            hashes = pack_words(values, bits_in_hash)
+        elif bits_in_hash is None:
+            raise ValueError("bits_in_hash is required for arrays of words.")
+
+        words = (bits_in_hash + 63) // 64
+        self._words: Any = numpy.ascontiguousarray(hashes, dtype=numpy.uint64)
+        self._words = self._words.reshape(-1, words)
+        self.bits_in_hash: int = bits_in_hash
+        self.count: int = len(self._words)
+        if ids is not None and len(ids) != self.count:
+            raise ValueError("Got %d ids for %d hashes." % (len(ids), self.count))
+        self._ids = ids
+
+        if substrings is None:
+            substrings = default_substrings(bits_in_hash, self.count)
+        if not 1 <= substrings <= max(bits_in_hash, 1):
+            raise ValueError(
+                "substrings must be between 1 and %d, got %d."
+                % (bits_in_hash, substrings)
+            )
+        # (start, length) of every substring, from the least significant bit
+        self.substrings: List[Tuple[int, int]] = []
+        for k in range(substrings):
+            start = k * bits_in_hash // substrings
+            end = (k + 1) * bits_in_hash // substrings
+            if end - start > 64:
+                raise ValueError(
+                    "Substrings of %d bits hashes are longer than 64 bits, use at "
+                    "least %d substrings." % (bits_in_hash, (bits_in_hash + 63) // 64)
+                )
+            self.substrings.append((start, end - start))
+
+        position_dtype = numpy.uint32 if self.count < 1 << 32 else numpy.int64
+        self._tables: List[Tuple[Any, Any]] = []
+        for start, length in self.substrings:
+            keys = self._substring(start, length).astype(_key_dtype(length))
+            order = numpy.argsort(keys, kind="stable").astype(position_dtype)
+            self._tables.append((keys[order], order))
+
+    @staticmethod
+    def from_packed(
+        data: Buffer,
+        height: int = 8,
+        ids: Optional[Sequence[str]] = None,
+        substrings: Optional[int] = None,
+    ) -> "MultiIndex":
+        """
+        Build an index from the hashes packed by pack_hashes().
+
+        :param data: The packed hashes.
+
+        :param height: The height used when computing the hashes.
+
+        :param ids: Optional ids or paths of the hashes, in the same order.
+
+        :param substrings: Number of substrings, see default_substrings().
+
+        :return: The index.
+
+        :rtype: MultiIndex
+
+        :raises ValueError: If the size of data is not a multiple of the size
+                            of one hash.
+        """
+        numpy = vectorized.numpy
+        bits_in_hash = height * height
+        size = hash_size(height)
+        if numpy is not None and size in (1, 2, 4, 8):
+            length = len(memoryview(data).cast("B"))
+            if length % size:
+                raise ValueError(
+                    "%d bytes is not a whole number of %d bytes hashes."
+                    % (length, size)
+                )
+            words = numpy.frombuffer(data, dtype=">u%d" % size)
+            if bits_in_hash % 8 and (words >> bits_in_hash).any():
+                raise ValueError("A hash has more than %d bits." % bits_in_hash)
+            return MultiIndex(words.astype(numpy.uint64), bits_in_hash, ids, substrings)
+        return MultiIndex(unpack_ints(data, height), bits_in_hash, ids, substrings)
+
+    def _substring(self, start: int, length: int) -> Any:
+        """
+        The length bits of every hash from bit start, as uint64.
+        """
+        numpy = vectorized.numpy
+        word, offset = divmod(start, 64)
+        values = self._words[:, word] >> numpy.uint64(offset)
+        if offset + length > 64:
+            values |= self._words[:, word + 1] << numpy.uint64(64 - offset)
+        if length < 64:
+            values &= numpy.uint64((1 << length) - 1)
+        return values
+
+    def __len__(self) -> int:
+        """
+        Number of hashes in the index.
+        """
+        return self.count
+
+    def hash_int(self, i: int) -> int:
+        """
+        The i-th hash as an integer.
+        """
+        if not 0 <= i < self.count:
+            raise IndexError("MultiIndex index out of range.")
+        return sum(int(word) << (64 * k) for k, word in enumerate(self._words[i]))
+
+    def id(self, i: int) -> Union[str, int]:
+        """
+        The id of the i-th hash, or i if the index has no ids.
+        """
+        if not 0 <= i < self.count:
+            raise IndexError("MultiIndex index out of range.")
+        if self._ids is None:
+            return i
+        return self._ids[i]
+
+    def _radii(self, max_distance: int) -> List[int]:
+        """
+        Search radius of every substring for max_distance. With
+        max_distance = m * q + a, a hash within max_distance is within q bits
+        in one of the first a + 1 substrings, or within q - 1 bits in one of
+        the others. A radius of -1 skips the substring.
+        """
+        q, a = divmod(max_distance, len(self.substrings))
+        return [q if k <= a else q - 1 for k in range(len(self.substrings))]
+
+    def search(self, hash_value: object, max_distance: int) -> MultiIndexResult:
+        """
+        Find the positions of the hashes within max_distance of hash_value.
+
+        :param hash_value: Instance of DHash or DHashRecord, a string starting
+                           with "0x" or "0b", or an integer.
+
+        :param max_distance: Maximum hamming distance, inclusive.
+
+        :return: The positions and distances of the hashes found, and the
+                 lookup counts.
+
+        :rtype: MultiIndexResult
+
+        :raises ValueError: If the hash does not have bits_in_hash bits or
+                            max_distance is negative.
+        """
+        numpy = vectorized.numpy
+        hash_int = coerce_hash(hash_value, self.bits_in_hash)[0]
+        if max_distance < 0:
+            raise ValueError("max_distance must not be negative.")
+        radii = self._radii(max_distance)
+        probes = sum(
+            _probe_count(length, radius)
+            for (_, length), radius in zip(self.substrings, radii)
+        )
+
+        if probes >= self.count:
+            # looking up the neighbours costs more than scanning every hash
+            distances = word_distances(self._words, hash_int)
+            positions = numpy.flatnonzero(distances <= max_distance)
+            return self._result(
+                positions, distances[positions], 0, self.count, self.count
+            )
+
+        found = []
+        for (start, length), radius, (keys, order) in zip(
+            self.substrings, radii, self._tables
+        ):
+            if radius < 0:
+                continue
+            key = (hash_int >> start) & ((1 << length) - 1)
+            neighbours = (_flip_masks(length, radius) ^ numpy.uint64(key)).astype(
+                keys.dtype
+            )
+            low = numpy.searchsorted(keys, neighbours, "left")
+            high = numpy.searchsorted(keys, neighbours, "right")
+            hit = high > low
+            low, sizes = low[hit], (high - low)[hit]
+            # concatenation of the ranges order[low:high] of every neighbour
+            total = int(sizes.sum())
+            ends = numpy.cumsum(sizes)
+            index = numpy.arange(total) + numpy.repeat(low - (ends - sizes), sizes)
+            found.append(order[index])
+
+        candidates = sum(len(positions) for positions in found)
+        if not candidates:
+            empty = numpy.empty(0, dtype=numpy.int64)
+            return self._result(empty, numpy.empty(0, dtype=numpy.uint16), probes, 0, 0)
+        positions = numpy.unique(numpy.concatenate(found)).astype(numpy.int64)
+        distances = word_distances(self._words[positions], hash_int)
+        within = distances <= max_distance
+        return self._result(
+            positions[within], distances[within], probes, candidates, len(positions)
+        )
+
+    def _result(
+        self,
+        positions: Any,
+        distances: Any,
+        probes: int,
+        candidates: int,
+        verified: int,
+    ) -> MultiIndexResult:
+        numpy = vectorized.numpy
+        positions = positions.astype(numpy.int64, copy=False)
+        order = numpy.lexsort((positions, distances))
+        return MultiIndexResult(
+            positions[order], distances[order], probes, candidates, verified
+        )
+
+    def query(
+        self, hash_value: object, max_distance: int
+    ) -> List[Tuple[int, Union[str, int]]]:
+        """
+        Find all the hashes within max_distance of hash_value.
+
+        :param hash_value: The query hash.
+
+        :param max_distance: Maximum hamming distance, inclusive.
+
+        :return: List of (distance, id) tuples sorted by distance. The id is
+                 the position of the hash if the index has no ids.
+
+        :rtype: list
+        """
+        result = self.search(hash_value, max_distance)
+        return [
+            (distance, self.id(position))
+            for distance, position in zip(
+                result.distances.tolist(), result.positions.tolist()
+            )
+        ]
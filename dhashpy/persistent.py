@@ -0,0 +1,474 @@
+"""
+Persistent index taking inserts and deletes through an append-only log,
+compacted into a HashStore base segment.
+
+Directory layout, for the current generation G:
+
+- CURRENT : The generation number G, replaced atomically by compactions.
+
+- base-G.dhst : HashStore file of the hashes as of the last compaction,
+  with the ids.
+
+- log-G.log : Changes since base-G.dhst. A header of magic b"DHLG", the
+  format version (uint16) and bits_in_hash (uint32), then the records: a
+  CRC32 of the rest of the record (uint32), the operation (uint8, 1 add,
+  2 delete), the length of the id (uint32), the hash as a little-endian
+  integer of HashStore record size, and the UTF-8 encoded id. A record cut
+  short by a crash fails its CRC and is truncated when the index is opened.
+
+Files of other generations are leftovers of an interrupted compaction, and
+are deleted when the index is opened.
+"""
+
+import heapq
+import os
+import re
+import struct
+import threading
+import zlib
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Set, Tuple
+
+from . import vectorized
+from .compare import pack_words
+from .index import DHashIndex, coerce_hash
+from .store import HashStore, HashStoreWriter, record_size
+
+LOG_MAGIC = b"DHLG"
+LOG_FORMAT_VERSION = 1
+_LOG_HEADER = struct.Struct("<4sHI")
+_RECORD = struct.Struct("<IBI")
+_ADD = 1
+_DELETE = 2
+
+_CURRENT = "CURRENT"
+_GENERATION_FILE = re.compile(r"^(base|log)-(\d+)\.(dhst|log)(\..+)?$")
+
+
+def _fsync_directory(directory: str) -> None:
+    if os.name != "posix":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+    _fsync_directory(os.path.dirname(os.path.abspath(path)))
+
+
+class _State(object):
+    """
+    What the queries read: the base segment and the changes of the log.
+    """
+
+    __slots__ = ("base", "added", "added_index", "dead")
+
+    def __init__(self, base: HashStore, bits_in_hash: int) -> None:
+        self.base = base
+        # id -> hash of the ids added or replaced since the base
+        self.added: Dict[str, int] = {}
+        self.added_index = DHashIndex(bits_in_hash=bits_in_hash)
+        # ids whose base entry is deleted or replaced
+        self.dead: Set[str] = set()
+
+    def apply(self, op: int, hash_int: int, id: str) -> None:
+        self.dead.add(id)
+        previous = self.added.pop(id, None)
+        if previous is not None:
+            self.added_index.remove(previous, id)
+        if op == _ADD:
+            self.added[id] = hash_int
+            self.added_index.add(hash_int, id)
+
+
+class PersistentIndex(object):
+    """
+    PersistentIndex class
+    ======================
+    A persistent, updatable index of hashes keyed by id, for collections that
+    change a little at a time.
+
+    add() and delete() append a record to the log, at a constant cost. The
+    queries merge a vectorized scan of the HashStore base segment with the
+    changes of the log. compact() folds the log into a new base segment,
+    the queries and writes keep running on the current generation while the
+    new base is written, and the switch is a single atomic os.replace().
+
+    One process writes to an index directory at a time.
+
+    - PersistentIndex.add(hash, id) : Add or replace the hash of an id.
+
+    - PersistentIndex.delete(id) : Delete an id, no-op if it is not there.
+
+    - PersistentIndex.query(hash, max_distance) : All ids within max_distance.
+
+    - PersistentIndex.nearest(hash, k) : The k ids closest to the hash.
+
+    - PersistentIndex.compact(background) : Fold the log into the base.
+    """
+
+    def __init__(
+        self, directory: str, bits_in_hash: Optional[int] = None, sync: bool = False
+    ) -> None:
+        """
+
+        :param directory: Directory of the index, created if it does not
+                          exist.
+
+        :param bits_in_hash: Number of bits of the hashes, required to create
+                             a new index. Checked against an existing index.
+
+        :param sync: If True every add() and delete() is fsync-ed before
+                     returning. Otherwise the log is flushed to the
+                     operating system only, and a crash of the machine may
+                     lose the last writes but never corrupts the index.
+
+        :return: None
+
+        :rtype: NoneType
+
+        :raises ValueError: If bits_in_hash is missing for a new index or does
+                            not match the existing one.
+        """
+        self.directory = directory
+        self.sync = sync
+        self._lock = threading.RLock()
+        self._compacting = False
+        self._log: Optional[BinaryIO] = None
+        os.makedirs(directory, exist_ok=True)
+
+        current = os.path.join(directory, _CURRENT)
+        if os.path.exists(current):
+            with open(current) as f:
+                generation = int(f.read().strip())
+        else:
+            if bits_in_hash is None:
+                raise ValueError("bits_in_hash is required to create an index.")
+            generation = 0
+            HashStore.build(self._path("base", 0), [], [], bits_in_hash).close()
+            self._create_log(0, bits_in_hash, b"")
+            _write_atomic(current, b"0")
+        self._remove_stale(generation)
+        self._open(generation)
+        if bits_in_hash is not None and bits_in_hash != self.bits_in_hash:
+            self.close()
+            raise ValueError(
+                "Index has %d bits hashes, not %d." % (self.bits_in_hash, bits_in_hash)
+            )
+
+    def _path(self, kind: str, generation: int) -> str:
+        extension = "dhst" if kind == "base" else "log"
+        return os.path.join(
+            self.directory, "%s-%08d.%s" % (kind, generation, extension)
+        )
+
+    def _remove_stale(self, generation: int) -> None:
+        for name in os.listdir(self.directory):
+            match = _GENERATION_FILE.match(name)
+            if match and (match.group(4) or int(match.group(2)) != generation):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def _create_log(self, generation: int, bits_in_hash: int, records: bytes) -> None:
+        path = self._path("log", generation)
+        with open(path + ".tmp", "wb") as f:
+            f.write(_LOG_HEADER.pack(LOG_MAGIC, LOG_FORMAT_VERSION, bits_in_hash))
+            f.write(records)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def _open(self, generation: int) -> None:
+        """
+        Open the base and the log of a generation and replay the log.
+        """
+        base = HashStore(self._path("base", generation))
+        state = _State(base, base.bits_in_hash)
+        log = open(self._path("log", generation), "r+b")
+        header = log.read(_LOG_HEADER.size)
+        magic, version, bits = _LOG_HEADER.unpack(header)
+        if magic != LOG_MAGIC or version != LOG_FORMAT_VERSION:
+            raise ValueError("'%s' is not a supported log file." % log.name)
+        if bits != base.bits_in_hash:
+            raise ValueError("Log and base of '%s' differ." % self.directory)
+
+        size = record_size(bits)
+        valid_end = log.tell()
+        records = 0
+        for op, hash_int, id, record_end in self._read_records(log, size):
+            state.apply(op, hash_int, id)
+            valid_end = record_end
+            records += 1
+        # drop a record cut short by a crash
+        log.seek(valid_end)
+        log.truncate()
+
+        old_log = self._log
+        self.generation = generation
+        self.bits_in_hash: int = bits
+        self._record_size = size
+        self._state = state
+        self._log = log
+        self._log_records = records
+        if old_log is not None:
+            old_log.close()
+
+    @staticmethod
+    def _read_records(log: BinaryIO, size: int) -> Iterator[Tuple[int, int, str, int]]:
+        """
+        Yield (op, hash_int, id, end offset) of the valid records of a log.
+        """
+        while True:
+            head = log.read(_RECORD.size)
+            if len(head) < _RECORD.size:
+                return
+            crc, op, id_length = _RECORD.unpack(head)
+            body = log.read(size + id_length)
+            if len(body) < size + id_length:
+                return
+            if zlib.crc32(head[4:] + body) != crc or op not in (_ADD, _DELETE):
+                return
+            hash_int = int.from_bytes(body[:size], "little")
+            yield op, hash_int, body[size:].decode("utf-8"), log.tell()
+
+    def _append(self, op: int, hash_int: int, id: str) -> None:
+        encoded = id.encode("utf-8")
+        body = (
+            _RECORD.pack(0, op, len(encoded))[4:]
+            + hash_int.to_bytes(self._record_size, "little")
+            + encoded
+        )
+        record = struct.pack("<I", zlib.crc32(body)) + body
+        with self._lock:
+            log = self._log
+            if log is None:
+                raise ValueError("PersistentIndex is closed.")
+            log.write(record)
+            log.flush()
+            if self.sync:
+                os.fsync(log.fileno())
+            self._state.apply(op, hash_int, id)
+            self._log_records += 1
+
+    def add(self, hash_value: object, id: str) -> None:
+        """
+        Add a hash, replacing the previous hash of the id if there is one.
+
+        :param hash_value: Instance of DHash or DHashRecord, a string starting
+                           with "0x" or "0b", or an integer.
+
+        :param id: The id or path of the image.
+
+        :return: None
+
+        :rtype: NoneType
+
+        :raises ValueError: If the hash does not have bits_in_hash bits.
+        """
+        hash_int = coerce_hash(hash_value, self.bits_in_hash)[0]
+        self._append(_ADD, hash_int, id)
+
+    def delete(self, id: str) -> None:
+        """
+        Delete the hash of an id, if the index has one.
+
+        :param id: The id or path of the image.
+
+        :return: None
+
+        :rtype: NoneType
+        """
+        self._append(_DELETE, 0, id)
+
+    @property
+    def log_records(self) -> int:
+        """
+        Number of records in the log, the work the next compaction folds in.
+        """
+        return self._log_records
+
+    def __iter__(self) -> Iterator[Tuple[str, int]]:
+        """
+        Iterate over the (id, hash_int) pairs of the index.
+        """
+        with self._lock:
+            state = self._state
+            dead = set(state.dead)
+            added = list(state.added.items())
+        base = state.base
+        for i in range(len(base)):
+            id = str(base.id(i))
+            if id not in dead:
+                yield id, base.hash_int(i)
+        for id, hash_int in added:
+            yield id, hash_int
+
+    def query(self, hash_value: object, max_distance: int) -> List[Tuple[int, str]]:
+        """
+        Find all the ids whose hash is within max_distance of hash_value.
+
+        :param hash_value: The query hash.
+
+        :param max_distance: Maximum hamming distance, inclusive.
+
+        :return: List of (distance, id) tuples sorted by distance.
+
+        :rtype: list
+        """
+        hash_int = coerce_hash(hash_value, self.bits_in_hash)[0]
+        with self._lock:
+            state = self._state
+            dead = set(state.dead)
+            results = state.added_index.query(hash_int, max_distance)
+        results.extend(
+            (distance, str(id))
+            for distance, id in state.base.query(hash_int, max_distance)
+            if id not in dead
+        )
+        results.sort(key=lambda result: result[0])
+        return results
+
+    def nearest(self, hash_value: object, k: int = 1) -> List[Tuple[int, str]]:
+        """
+        Find the k ids whose hashes are closest to hash_value.
+
+        :param hash_value: The query hash.
+
+        :param k: Number of ids to return.
+
+        :return: List of at most k (distance, id) tuples sorted by distance.
+
+        :rtype: list
+        """
+        hash_int = coerce_hash(hash_value, self.bits_in_hash)[0]
+        if k < 1:
+            return []
+        with self._lock:
+            state = self._state
+            dead = set(state.dead)
+            results = state.added_index.nearest(hash_int, k)
+        # the dead are skipped while the base is scanned by distance
+        base = state.base.nearest(hash_int, k, exclude=dead)
+        results.extend((distance, str(id)) for distance, id in base)
+        return heapq.nsmallest(k, results, key=lambda result: result[0])
+
+    def compact(self, background: bool = False) -> Optional[threading.Thread]:
+        """
+        Write a new base segment holding the current hashes and start an
+        empty log.
+
+        The new base is written from a snapshot while add(), delete() and the
+        queries keep working. The writes made meanwhile are then moved to
+        the new log and the new generation is made current by replacing the
+        CURRENT file, which is atomic: a crash at any point leaves either
+        the old or the new generation, complete.
+
+        :param background: If True compact in a new thread and return it.
+
+        :return: The compaction thread if background is True, else None.
+
+        :rtype: threading.Thread or NoneType
+
+        :raises RuntimeError: If a compaction is already running.
+        """
+        with self._lock:
+            if self._compacting:
+                raise RuntimeError("A compaction is already running.")
+            self._compacting = True
+        if not background:
+            self._compact()
+            return None
+        thread = threading.Thread(target=self._compact, name="dhashpy-compact")
+        thread.start()
+        return thread
+
+    def _compact(self) -> None:
+        try:
+            with self._lock:
+                log = self._log
+                if log is None:
+                    raise ValueError("PersistentIndex is closed.")
+                state = self._state
+                dead = set(state.dead)
+                added = list(state.added.items())
+                snapshot_end = log.tell()
+            generation = self.generation + 1
+
+            path = self._path("base", generation)
+            self._write_base(path + ".tmp", state.base, dead, added)
+            with open(path + ".tmp", "rb") as f:
+                os.fsync(f.fileno())
+            os.replace(path + ".tmp", path)
+
+            with self._lock:
+                # the writes made during the compaction go to the new log
+                log.seek(snapshot_end)
+                tail = log.read()
+                self._create_log(generation, self.bits_in_hash, tail)
+                _write_atomic(
+                    os.path.join(self.directory, _CURRENT), b"%d" % generation
+                )
+                # queries still running keep the old base mapped until they
+                # are done, it is not closed explicitly
+                self._open(generation)
+            self._remove_stale(generation)
+        finally:
+            self._compacting = False
+
+    def _write_base(
+        self, path: str, base: HashStore, dead: Set[str], added: List[Tuple[str, int]]
+    ) -> None:
+        """
+        Write the live hashes of the base and the added hashes to a new store
+        file. With NumPy the mapped words of the live base hashes and the
+        packed added hashes are each written in one block.
+        """
+        with HashStoreWriter(path, self.bits_in_hash, True) as writer:
+            numpy = vectorized.numpy
+            if numpy is None or base._words is None:
+                for i in range(len(base)):
+                    id = str(base.id(i))
+                    if id not in dead:
+                        writer.add(base.hash_int(i), id)
+                for id, hash_int in added:
+                    writer.add(hash_int, id)
+                return
+            ids = [str(id) for id in base._id_list()]
+            words = base._words
+            if dead:
+                alive = numpy.fromiter(
+                    (id not in dead for id in ids), dtype=bool, count=len(ids)
+                )
+                words = words[alive]
+                ids = [id for id in ids if id not in dead]
+            writer.add_words(words, ids)
+            writer.add_words(
+                pack_words([hash_int for _, hash_int in added], self.bits_in_hash),
+                [id for id, _ in added],
+            )
+
+    def close(self) -> None:
+        """
+        Flush and close the log.
+        """
+        with self._lock:
+            if self._log is not None:
+                self._log.flush()
+                os.fsync(self._log.fileno())
+                self._log.close()
+                self._log = None
+
+    def __enter__(self) -> "PersistentIndex":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
@@ -0,0 +1,212 @@
+"""
+Streaming directory scanner that overlaps reading the files with hashing.
+"""
+
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+import fnmatch
+import os
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from .batch import HashResult
+from .dHash import DHash, DHashRecord
+
+IMAGE_PATTERNS = (
+    "*.jpg",
+    "*.jpeg",
+    "*.png",
+    "*.gif",
+    "*.webp",
+    "*.bmp",
+    "*.tif",
+    "*.tiff",
+)
+
+
+def iter_files(
+    root: str,
+    patterns: Iterable[str] = IMAGE_PATTERNS,
+    on_error: Optional[Callable[[HashResult], None]] = None,
+) -> Iterator[str]:
+    """
+    Recursively list the files under root whose name matches any of the
+    patterns, with os.scandir. Symbolic links to directories are not
+    followed.
+
+    :param root: The directory to scan.
+
+    :param patterns: fnmatch patterns, matched case-insensitively against the
+                     file names.
+
+    :param on_error: Called with a HashResult for every directory or entry
+                     that can not be read, which is then skipped.
+
+    :return: Iterator of file paths.
+
+    :rtype: Iterator[str]
+    """
+    patterns = [pattern.lower() for pattern in patterns]
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file() and any(
+                            fnmatch.fnmatchcase(entry.name.lower(), pattern)
+                            for pattern in patterns
+                        ):
+                            yield entry.path
+                    except OSError as e:
+                        if on_error is not None:
+                            on_error(HashResult(entry.path, None, e))
+        except OSError as e:
+            if on_error is not None:
+                on_error(HashResult(directory, None, e))
+
+
+def _read(path: str) -> Tuple[str, Optional[bytes], Optional[BaseException]]:
+    try:
+        with open(path, "rb") as f:
+            return path, f.read(), None
+    except OSError as e:
+        return path, None, e
+
+
+def _hash_data(path: str, data: bytes, options: Dict[str, Any]) -> HashResult:
+    try:
+        record = DHash.from_bytes(data, path=path, **options).to_record()
+        return HashResult(path, record, None)
+    except Exception as e:
+        return HashResult(path, None, e)
+
+
+def scan(
+    root: str,
+    patterns: Iterable[str] = IMAGE_PATTERNS,
+    height: int = 8,
+    workers: Optional[int] = None,
+    io_workers: int = 8,
+    fast: bool = False,
+    max_pending: Optional[int] = None,
+    on_error: Optional[Callable[[HashResult], None]] = None,
+) -> Iterator[Tuple[str, DHashRecord]]:
+    """
+    Hash every image under a directory, lazily.
+
+    The files are listed with os.scandir and read on a pool of I/O threads,
+    while a pool of worker processes decodes and hashes the bytes already
+    read. Reading and hashing overlap, which matters on network filesystems.
+    At most max_pending files are read or being hashed at once, so memory
+    stays bounded however large the tree is.
+
+    Files that can not be read or decoded are skipped, and reported to
+    on_error as a HashResult with the exception in HashResult.error.
+
+    :param root: The directory to scan.
+
+    :param patterns: fnmatch patterns of the file names to hash, matched
+                     case-insensitively. Defaults to the common image
+                     extensions.
+
+    :param height: The height used for hashing, see DHash.__init__.
+
+    :param workers: Number of hashing processes, defaults to os.cpu_count().
+                    If 0 the files are hashed in the calling thread.
+
+    :param io_workers: Number of threads reading the files.
+
+    :param fast: Use the fast mode, see DHash.__init__.
+
+    :param max_pending: Maximum number of files in flight, defaults to four
+                        per worker plus the number of I/O threads.
+
+    :param on_error: Called with a HashResult for every skipped path.
+
+    :return: Iterator of (path, DHashRecord) tuples, in completion order.
+
+    :rtype: Iterator[tuple]
+
+    :raises ValueError: If workers is negative or io_workers is less than 1.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers < 0:
+        raise ValueError("workers must be a non-negative integer.")
+    if io_workers < 1:
+        raise ValueError("io_workers must be at least 1.")
+    if max_pending is None:
+        max_pending = 4 * max(workers, 1) + io_workers
+    files = iter_files(root, patterns, on_error)
+    options = {"height": height, "fast": fast}
+    return _scan(files, options, workers, io_workers, max_pending, on_error)
+
+
+def _scan(
+    files: Iterator[str],
+    options: Dict[str, Any],
+    workers: int,
+    io_workers: int,
+    max_pending: int,
+    on_error: Optional[Callable[[HashResult], None]],
+) -> Iterator[Tuple[str, DHashRecord]]:
+    io_pool = ThreadPoolExecutor(io_workers)
+    cpu_pool = ProcessPoolExecutor(workers) if workers else None
+    reads: Set[Future] = set()
+    hashes: Set[Future] = set()
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(reads) + len(hashes) < max_pending:
+                path = next(files, None)
+                if path is None:
+                    exhausted = True
+                    break
+                reads.add(io_pool.submit(_read, path))
+            if not reads and not hashes:
+                return
+
+            done, _ = wait(reads | hashes, return_when=FIRST_COMPLETED)
+            results = []
+            for future in done:
+                if future in hashes:
+                    hashes.discard(future)
+                    results.append(future.result())
+                    continue
+                reads.discard(future)
+                path, data, error = future.result()
+                if data is None:
+                    results.append(HashResult(path, None, error))
+                elif cpu_pool is None:
+                    results.append(_hash_data(path, data, options))
+                else:
+                    hashes.add(cpu_pool.submit(_hash_data, path, data, options))
+
+            for result in results:
+                if result.record is not None:
+                    yield result.path, result.record
+                elif on_error is not None:
+                    on_error(result)
+    finally:
+        for future in reads | hashes:
+            future.cancel()
+        io_pool.shutdown()
+        if cpu_pool is not None:
+            cpu_pool.shutdown()
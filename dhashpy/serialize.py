@@ -0,0 +1,131 @@
+"""
+Bulk conversion between hashes and one contiguous buffer of hash bits, for
+sending many hashes between processes or storing them in one blob.
+"""
+
+from typing import Iterable, List, Optional, Union
+
+from . import vectorized
+from .hashes import DHashRecord
+from .index import coerce_hash
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+def hash_size(height: int) -> int:
+    """
+    Number of bytes of one hash in the buffers of pack_hashes(), and of
+    DHash.to_bytes().
+
+    :param height: The height used when computing the hashes.
+
+    :return: (height^2 + 7) // 8
+
+    :rtype: int
+    """
+    return (height * height + 7) // 8
+
+
+def pack_hashes(hashes: Iterable[object], bits_in_hash: Optional[int] = None) -> bytes:
+    """
+    Concatenate the to_bytes() form of every hash into one buffer.
+
+    Only the hash bits are kept, every hash takes (bits_in_hash + 7) // 8
+    bytes, 8 bytes for the default height. The paths are not kept, pass
+    them to unpack_hashes() if they are needed.
+
+    :param hashes: Iterable of DHash, DHashRecord, "0x"/"0b" strings or
+                   integers, all of the same number of bits.
+
+    :param bits_in_hash: Number of bits of the hashes, required if the first
+                         hash is a hexadecimal string or an integer.
+
+    :return: The packed hashes, in iteration order.
+
+    :rtype: bytes
+
+    :raises ValueError: If the hashes have different numbers of bits, or the
+                        number of bits is unknown.
+    """
+    values: List[int] = []
+    for hash_value in hashes:
+        hash_int, bits_in_hash = coerce_hash(hash_value, bits_in_hash)
+        values.append(hash_int)
+    if not values:
+        return b""
+    if bits_in_hash is None:
+        raise ValueError(
+            "bits_in_hash is unknown, pass it or add a DHash, "
+            "DHashRecord or binary string first."
+        )
+    size = (bits_in_hash + 7) // 8
+    numpy = vectorized.numpy
+    if numpy is not None and size in (1, 2, 4, 8):
+        return numpy.array(values, dtype=">u%d" % size).tobytes()
+    return b"".join([hash_int.to_bytes(size, "big") for hash_int in values])
+
+
+def unpack_hashes(
+    data: Buffer, height: int = 8, paths: Optional[Iterable[Optional[str]]] = None
+) -> List[DHashRecord]:
+    """
+    Read the hashes packed by pack_hashes().
+
+    :param data: The packed hashes.
+
+    :param height: The height used when computing the hashes.
+
+    :param paths: Optional paths of the hashes, in the same order.
+
+    :return: A DHashRecord for every hash of the buffer.
+
+    :rtype: list
+
+    :raises ValueError: If the size of data is not a multiple of the size of
+                        one hash, or there are not as many paths as hashes.
+    """
+    values = unpack_ints(data, height)
+    if paths is None:
+        return [DHashRecord(hash_int, height) for hash_int in values]
+    path_list = list(paths)
+    if len(path_list) != len(values):
+        raise ValueError("Got %d paths for %d hashes." % (len(path_list), len(values)))
+    return [
+        DHashRecord(hash_int, height, path) for hash_int, path in zip(values, path_list)
+    ]
+
+
+def unpack_ints(data: Buffer, height: int = 8) -> List[int]:
+    """
+    Read the hashes packed by pack_hashes() as integers, without building
+    records.
+
+    :param data: The packed hashes.
+
+    :param height: The height used when computing the hashes.
+
+    :return: The hash_int of every hash of the buffer.
+
+    :rtype: list
+
+    :raises ValueError: If the size of data is not a multiple of the size of
+                        one hash, or a hash has more than height^2 bits.
+    """
+    view = memoryview(data).cast("B")
+    size = hash_size(height)
+    if len(view) % size:
+        raise ValueError(
+            "%d bytes is not a whole number of %d bytes hashes." % (len(view), size)
+        )
+    numpy = vectorized.numpy
+    if numpy is not None and size in (1, 2, 4, 8):
+        values: List[int] = numpy.frombuffer(view, dtype=">u%d" % size).tolist()
+    else:
+        values = [
+            int.from_bytes(view[offset : offset + size], "big")
+            for offset in range(0, len(view), size)
+        ]
+    bits = height * height
+    if bits % 8 and any(hash_int >> bits for hash_int in values):
+        raise ValueError("A hash has more than %d bits." % bits)
+    return values
@@ -0,0 +1,237 @@
+"""
+HashStore held in shared memory, for processes serving queries on the same
+hashes without a copy each.
+"""
+
+import struct
+import sys
+from typing import Iterable, List, Optional, TYPE_CHECKING
+
+from .index import coerce_hash
+from .store import (
+    _FLAG_IDS,
+    _HEADER,
+    FORMAT_VERSION,
+    MAGIC,
+    HashStore,
+    record_size,
+)
+
+if TYPE_CHECKING:  # pragma: no cover
+    # new in Python 3.8, imported where a segment is created or attached so
+    # that dhashpy still imports on older versions
+    from multiprocessing import shared_memory
+
+
+def _tracker_running() -> bool:
+    from multiprocessing import resource_tracker
+
+    # the resource tracker of a process started by multiprocessing is shared
+    # with its parent
+    tracker = getattr(resource_tracker, "_resource_tracker", None)
+    return getattr(tracker, "_fd", None) is not None
+
+
+def _open_untracked(name: str) -> "shared_memory.SharedMemory":
+    """
+    Attach to a segment without the resource tracker unlinking it when this
+    process exits.
+    """
+    from multiprocessing import resource_tracker, shared_memory
+
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, track=False)  # type: ignore
+    shared_tracker = _tracker_running()
+    shm = shared_memory.SharedMemory(name)
+    if not shared_tracker:
+        # a tracker of our own would unlink the segment at exit
+        resource_tracker.unregister(shm._name, "shared_memory")  # type: ignore
+    return shm
+
+
+class SharedHashStore(HashStore):
+    """
+    SharedHashStore class
+    ======================
+    A HashStore whose hashes and ids live in a named shared memory segment.
+    A loader process creates the segment with SharedHashStore.create(),
+    every other process attaches to it by name with SharedHashStore.attach()
+    and queries it read-only, with the same API as HashStore: distances(),
+    query(), nearest(), hash_int() and id(). The segment holds the HashStore
+    file format. Requires Python 3.8 or newer.
+
+    - SharedHashStore.create(hashes, ids, bits_in_hash, name) : Create and
+      fill a segment, the creating process owns it.
+
+    - SharedHashStore.attach(name) : Attach to an existing segment.
+
+    - SharedHashStore.detach() : Release the segment in this process, the
+      other processes keep it. Same as close().
+
+    - SharedHashStore.unlink() : Destroy the segment once every process has
+      detached, call it once, from the owner.
+    """
+
+    def __init__(self, shm: "shared_memory.SharedMemory", owner: bool) -> None:
+        """
+        Use SharedHashStore.create() or SharedHashStore.attach().
+
+        :param shm: The shared memory segment holding the store.
+
+        :param owner: True in the process that created the segment.
+
+        :return: None
+
+        :rtype: NoneType
+
+        :raises ValueError: If the segment does not hold a HashStore.
+        """
+        self.shm = shm
+        self.owner = owner
+        self._detached = False
+        try:
+            self._load(shm.buf, "Shared memory '%s'" % shm.name)
+        except Exception:
+            shm.close()
+            raise
+
+    @property
+    def name(self) -> str:
+        """
+        The name other processes attach with.
+        """
+        return self.shm.name
+
+    @classmethod
+    def create(
+        cls,
+        hashes: Iterable[object],
+        ids: Optional[Iterable[str]] = None,
+        bits_in_hash: Optional[int] = None,
+        name: Optional[str] = None,
+    ) -> "SharedHashStore":
+        """
+        Create a shared memory segment holding the hashes and attach to it.
+
+        The segment is tracked by this process: it is unlinked when this
+        process exits without calling unlink(), even if other processes are
+        still attached.
+
+        :param hashes: Iterable of DHash, DHashRecord, "0x"/"0b" strings or
+                       integers, all of the same number of bits.
+
+        :param ids: Optional iterable of ids or paths, same length as hashes.
+
+        :param bits_in_hash: Number of bits of the hashes, required if the
+                             first hash is a hexadecimal string or an integer.
+
+        :param name: Name of the segment, a random name if None.
+
+        :return: The attached store, owner of the segment.
+
+        :rtype: SharedHashStore
+
+        :raises FileExistsError: If a segment with this name already exists.
+
+        :raises ImportError: Before Python 3.8.
+        """
+        from multiprocessing import shared_memory
+
+        values: List[int] = []
+        for hash_value in hashes:
+            hash_int, bits_in_hash = coerce_hash(hash_value, bits_in_hash)
+            values.append(hash_int)
+        if bits_in_hash is None:
+            if values:
+                raise ValueError(
+                    "bits_in_hash is unknown, pass it or add a DHash, "
+                    "DHashRecord or binary string first."
+                )
+            bits_in_hash = 0
+        encoded = None if ids is None else [id.encode("utf-8") for id in ids]
+        if encoded is not None and len(encoded) != len(values):
+            raise ValueError("ids must have the same length as hashes.")
+
+        size = record_size(bits_in_hash)
+        ids_offset = _HEADER.size + size * len(values)
+        total = ids_offset
+        if encoded is not None:
+            total += 8 * (len(values) + 1) + sum(len(id) for id in encoded)
+
+        shm = shared_memory.SharedMemory(name, create=True, size=max(total, 1))
+        try:
+            buffer: memoryview = shm.buf  # type: ignore[assignment]
+            offset = _HEADER.size
+            for hash_int in values:
+                buffer[offset : offset + size] = hash_int.to_bytes(size, "little")
+                offset += size
+            if encoded is not None:
+                blob = ids_offset + 8 * (len(values) + 1)
+                end = 0
+                struct.pack_into("<Q", buffer, ids_offset, 0)
+                for i, id in enumerate(encoded):
+                    buffer[blob + end : blob + end + len(id)] = id
+                    end += len(id)
+                    struct.pack_into("<Q", buffer, ids_offset + 8 * (i + 1), end)
+            _HEADER.pack_into(
+                buffer,
+                0,
+                MAGIC,
+                FORMAT_VERSION,
+                _FLAG_IDS if encoded is not None else 0,
+                bits_in_hash,
+                len(values),
+                ids_offset if encoded is not None else 0,
+            )
+            del buffer
+        except BaseException:
+            shm.close()
+            shm.unlink()
+            raise
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> "SharedHashStore":
+        """
+        Attach to a segment created by SharedHashStore.create(), in any
+        process of the machine.
+
+        Attaching does not make this process responsible for the segment,
+        it is not unlinked when this process exits.
+
+        :param name: The name of the segment, SharedHashStore.name.
+
+        :return: The attached store.
+
+        :rtype: SharedHashStore
+
+        :raises FileNotFoundError: If there is no segment with this name.
+
+        :raises ImportError: Before Python 3.8.
+        """
+        return cls(_open_untracked(name), owner=False)
+
+    def detach(self) -> None:
+        """
+        Release the segment in this process. The store can not be queried
+        afterwards, the segment stays available to the other processes.
+        """
+        if self._detached:
+            return
+        self._detached = True
+        # the NumPy view must go before the buffer can be released
+        self._words = None
+        self.shm.close()
+
+    def close(self) -> None:
+        """
+        Same as detach().
+        """
+        self.detach()
+
+    def unlink(self) -> None:
+        """
+        Destroy the segment. Processes still attached keep their mapping
+        until they detach, no process can attach anymore.
+        """
+        self.shm.unlink()
@@ -0,0 +1,569 @@
+"""
+Memory-mapped binary store of packed hashes, with a vectorized linear scan.
+
+File format, all integers little-endian:
+
+- Header, 32 bytes: magic b"DHST", format version (uint16), flags (uint16,
+  bit 0 set if the file has an id table), bits_in_hash (uint32), count
+  (uint64), offset of the id table (uint64), 4 bytes of padding.
+
+- count records of 8 * ceil(bits_in_hash / 64) bytes, each record is the
+  hash as a little-endian integer. Records are aligned to 8 bytes so the
+  array can be viewed as uint64 words.
+
+- Optional id table: count + 1 uint64 offsets into the id blob that
+  follows them, and the blob of UTF-8 encoded ids.
+"""
+
+import array
+from itertools import accumulate, chain, zip_longest
+import mmap
+import os
+import struct
+import sys
+from typing import (
+    Any,
+    BinaryIO,
+    Container,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from . import vectorized
+from .index import coerce_hash
+from .utils import popcount
+
+MAGIC = b"DHST"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<4sHHIQQ4x")
+_FLAG_IDS = 1
+
+# Number of records XOR-ed at once by the vectorized scan, bounds the size of
+# the temporary arrays.
+SCAN_CHUNK = 1 << 20
+
+
+def record_size(bits_in_hash: int) -> int:
+    """
+    Size in bytes of a stored hash, a whole number of 64 bits words.
+
+    :param bits_in_hash: Number of bits in the hash.
+
+    :return: Size of a record in bytes.
+
+    :rtype: int
+    """
+    return 8 * ((bits_in_hash + 63) // 64)
+
+
+def _split_words(hash_int: int, words: int) -> List[int]:
+    return [(hash_int >> (64 * i)) & 0xFFFFFFFFFFFFFFFF for i in range(words)]
+
+
+def popcount_words(words: Any) -> Any:
+    """
+    Popcount of every element of a uint64 NumPy array.
+
+    Uses numpy.bitwise_count (NumPy 2.0+) and a byte lookup table on older
+    versions.
+
+    :param words: NumPy array of uint64.
+
+    :return: NumPy array of uint8, same shape as words.
+    """
+    numpy = vectorized.numpy
+    if hasattr(numpy, "bitwise_count"):
+        return numpy.bitwise_count(words)
+    table = numpy.array([bin(i).count("1") for i in range(256)], dtype=numpy.uint8)
+    as_bytes = numpy.ascontiguousarray(words).view(numpy.uint8)
+    counts = table[as_bytes].reshape(words.shape + (8,))
+    return counts.sum(axis=-1, dtype=numpy.uint8)
+
+
+def word_distances(words: Any, hash_int: int) -> Any:
+    """
+    Hamming distance from hash_int to every row of an array of hashes split
+    in uint64 words, least significant word first. The rows are XOR-ed
+    SCAN_CHUNK at a time to bound the temporary arrays.
+
+    :param words: NumPy array of uint64, of shape (count, words).
+
+    :param hash_int: The query hash as an integer.
+
+    :return: NumPy array of uint16 distances.
+    """
+    numpy = vectorized.numpy
+    query = numpy.array(_split_words(hash_int, words.shape[1]), dtype=numpy.uint64)
+    result = numpy.empty(len(words), dtype=numpy.uint16)
+    for start in range(0, len(words), SCAN_CHUNK):
+        chunk = words[start : start + SCAN_CHUNK]
+        counts = popcount_words(numpy.bitwise_xor(chunk, query))
+        result[start : start + len(chunk)] = counts.sum(axis=1, dtype=numpy.uint16)
+    return result
+
+
+class HashStoreWriter(object):
+    """
+    HashStoreWriter class
+    ======================
+    Writes a HashStore file, one hash at a time so that very large sets do
+    not have to be held in memory, or a whole NumPy array of packed hashes
+    at once with add_words(). The count in the header is written when
+    the writer is closed, use it as a context manager. If the with block
+    raises, the file is removed instead, so that a partial store is never
+    mistaken for a complete one.
+    """
+
+    def __init__(
+        self, path: str, bits_in_hash: Optional[int] = None, with_ids: bool = False
+    ) -> None:
+        """
+
+        :param path: Path of the store file, overwritten if it exists.
+
+        :param bits_in_hash: Number of bits of the hashes. If None it is taken
+                             from the first hash, which must then be a DHash,
+                             DHashRecord or binary string.
+
+        :param with_ids: If True every hash must be added with an id, stored
+                         in the id table.
+
+        :return: None
+
+        :rtype: NoneType
+        """
+        self.path = path
+        self.bits_in_hash = bits_in_hash
+        self.with_ids = with_ids
+        self.count = 0
+        self._file: BinaryIO = open(path, "wb")
+        self._file.write(b"\0" * _HEADER.size)
+        self._ids: Optional[BinaryIO] = None
+        self._id_offsets = array.array("Q", [0])
+        if with_ids:
+            self._ids = open(path + ".ids.tmp", "w+b")
+
+    def add(self, hash_value: object, id: Optional[str] = None) -> None:
+        """
+        Append a hash to the store.
+
+        :param hash_value: Instance of DHash or DHashRecord, a string starting
+                           with "0x" or "0b", or an integer.
+
+        :param id: The id or path of the hash, required if the writer was
+                   created with with_ids.
+
+        :return: None
+
+        :rtype: NoneType
+
+        :raises ValueError: If the hash does not have bits_in_hash bits, or
+                            the id is missing.
+        """
+        hash_int, bits = coerce_hash(hash_value, self.bits_in_hash)
+        if bits is None:
+            raise ValueError(
+                "bits_in_hash is unknown, pass it to HashStoreWriter or add a "
+                "DHash, DHashRecord or binary string first."
+            )
+        self.bits_in_hash = bits
+        self._file.write(hash_int.to_bytes(record_size(bits), "little"))
+        if self._ids is not None:
+            if id is None:
+                raise ValueError("Store has an id table, id is required.")
+            self._ids.write(id.encode("utf-8"))
+            self._id_offsets.append(self._ids.tell())
+        self.count += 1
+
+    def add_words(self, words: Any, ids: Optional[Iterable[str]] = None) -> None:
+        """
+        Append hashes packed in uint64 words, in a single write.
+
+        :param words: NumPy array of the hashes split in uint64 words, least
+                      significant word first, as returned by pack_words(),
+                      of shape (count,) for hashes of up to 64 bits or
+                      (count, words).
+
+        :param ids: The ids of the hashes, required if the writer was
+                    created with with_ids.
+
+        :return: None
+
+        :rtype: NoneType
+
+        :raises ValueError: If bits_in_hash is unknown, the words do not fit
+                            it, or the ids are missing or not as many as the
+                            hashes.
+        """
+        numpy = vectorized.numpy
+        if self.bits_in_hash is None:
+            raise ValueError("bits_in_hash is required to add packed words.")
+        per_hash = record_size(self.bits_in_hash) // 8
+        rows = numpy.ascontiguousarray(words, dtype="<u8")
+        if rows.ndim == 1:
+            rows = rows.reshape(-1, 1)
+        if rows.ndim != 2 or rows.shape[1] != per_hash:
+            raise ValueError(
+                "Hashes of %d bits are packed in %d words, got shape %s."
+                % (self.bits_in_hash, per_hash, numpy.shape(words))
+            )
+        encoded: List[bytes] = []
+        if self._ids is not None:
+            if ids is None:
+                raise ValueError("Store has an id table, ids are required.")
+            encoded = [id.encode("utf-8") for id in ids]
+            if len(encoded) != len(rows):
+                raise ValueError("ids must have the same length as hashes.")
+        self._file.write(rows.tobytes())
+        if self._ids is not None:
+            self._ids.write(b"".join(encoded))
+            ends = accumulate(chain([self._id_offsets[-1]], map(len, encoded)))
+            next(ends)
+            self._id_offsets.extend(ends)
+        self.count += len(rows)
+
+    def close(self) -> None:
+        """
+        Write the id table and the header and close the file.
+        """
+        if self._file.closed:
+            return
+        ids_offset = 0
+        if self._ids is not None:
+            ids_offset = self._file.tell()
+            self._id_offsets.tofile(self._file)
+            self._ids.seek(0)
+            while True:
+                block = self._ids.read(1 << 20)
+                if not block:
+                    break
+                self._file.write(block)
+            self._ids.close()
+            os.remove(self._ids.name)
+        self._file.seek(0)
+        self._file.write(
+            _HEADER.pack(
+                MAGIC,
+                FORMAT_VERSION,
+                _FLAG_IDS if self.with_ids else 0,
+                self.bits_in_hash or 0,
+                self.count,
+                ids_offset,
+            )
+        )
+        self._file.close()
+
+    def __enter__(self) -> "HashStoreWriter":
+        return self
+
+    def abort(self) -> None:
+        """
+        Close and remove the unfinished file, without writing its header.
+        """
+        if self._file.closed:
+            return
+        self._file.close()
+        os.remove(self.path)
+        if self._ids is not None:
+            self._ids.close()
+            os.remove(self._ids.name)
+
+    def __exit__(self, exc_type: Any, *exc_info: Any) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class HashStore(object):
+    """
+    HashStore class
+    ================
+    Read only, memory-mapped view of a file written by HashStoreWriter or
+    HashStore.build. Opening a store only reads the header, the hashes are
+    paged in by the operating system when they are scanned.
+
+    With NumPy installed the scans XOR the query with the mapped array of
+    hashes and popcount the result, without copying the array. Without
+    NumPy the scans loop over the records in python.
+
+    - HashStore.build(path, hashes, ids, bits_in_hash) : Write a store file.
+
+    - HashStore.distances(hash) : Distance from the hash to every stored hash.
+
+    - HashStore.query(hash, max_distance) : All ids within max_distance.
+
+    - HashStore.nearest(hash, k, exclude) : The k ids closest to the hash,
+      skipping the excluded ids.
+
+    - HashStore.hash_int(i), HashStore.id(i) : The i-th hash and id.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+
+        :param path: Path of the store file.
+
+        :return: None
+
+        :rtype: NoneType
+
+        :raises ValueError: If the file is not a HashStore file.
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._load(buffer, "'%s'" % path)
+
+    def _load(self, buffer: Any, name: str) -> None:
+        """
+        Read the header of a store held in buffer, an mmap or a memoryview,
+        and view its records without copying them.
+        """
+        self._buffer = buffer
+        header = bytes(buffer[: _HEADER.size])
+        if len(header) < _HEADER.size:
+            raise ValueError("%s is not a HashStore file." % name)
+        magic, version, flags, bits, count, ids_offset = _HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError("%s is not a HashStore file." % name)
+        if version != FORMAT_VERSION:
+            raise ValueError("Unsupported HashStore format version %d." % version)
+        self.bits_in_hash: int = bits
+        self.count: int = count
+        self.has_ids = bool(flags & _FLAG_IDS)
+        self.record_size = record_size(bits)
+        self._ids_offset = ids_offset
+        self._words: Any = None
+        if vectorized.numpy is not None:
+            self._words = vectorized.numpy.frombuffer(
+                buffer,
+                dtype="<u8",
+                count=count * self.record_size // 8,
+                offset=_HEADER.size,
+            ).reshape(count, self.record_size // 8)
+
+    @staticmethod
+    def build(
+        path: str,
+        hashes: Iterable[object],
+        ids: Optional[Iterable[str]] = None,
+        bits_in_hash: Optional[int] = None,
+    ) -> "HashStore":
+        """
+        Write a store file from an iterable of hashes and open it.
+
+        :param path: Path of the store file, overwritten if it exists.
+
+        :param hashes: Iterable of DHash, DHashRecord, "0x"/"0b" strings or
+                       integers, all of the same number of bits, or a NumPy
+                       array of packed words as returned by pack_words(),
+                       written in one block.
+
+        :param ids: Optional iterable of ids or paths, same length as hashes.
+
+        :param bits_in_hash: Number of bits of the hashes, required if the
+                             first hash is a hexadecimal string or an integer,
+                             or the hashes are packed words.
+
+        :return: The opened store.
+
+        :rtype: HashStore
+
+        :raises ValueError: If there are not as many ids as hashes, no file is
+                            written then.
+        """
+        with HashStoreWriter(path, bits_in_hash, with_ids=ids is not None) as writer:
+            if hasattr(hashes, "dtype"):
+                writer.add_words(hashes, ids)
+            elif ids is None:
+                for hash_value in hashes:
+                    writer.add(hash_value)
+            else:
+                missing = object()
+                for hash_value, id in zip_longest(hashes, ids, fillvalue=missing):
+                    if hash_value is missing or id is missing:
+                        raise ValueError("ids must have the same length as hashes.")
+                    writer.add(hash_value, id)  # type: ignore[arg-type]
+        return HashStore(path)
+
+    def close(self) -> None:
+        """
+        Unmap the file.
+        """
+        self._words = None
+        self._buffer.close()
+
+    def __enter__(self) -> "HashStore":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        """
+        Number of stored hashes.
+        """
+        return self.count
+
+    def __iter__(self) -> Iterator[int]:
+        """
+        Iterate over the stored hashes as integers.
+        """
+        for i in range(self.count):
+            yield self.hash_int(i)
+
+    def hash_int(self, i: int) -> int:
+        """
+        The i-th stored hash as an integer.
+        """
+        if not 0 <= i < self.count:
+            raise IndexError("HashStore index out of range.")
+        start = _HEADER.size + i * self.record_size
+        return int.from_bytes(self._buffer[start : start + self.record_size], "little")
+
+    def id(self, i: int) -> Union[str, int]:
+        """
+        The id of the i-th stored hash, or i if the store has no id table.
+        """
+        if not 0 <= i < self.count:
+            raise IndexError("HashStore index out of range.")
+        if not self.has_ids:
+            return i
+        start, end = struct.unpack_from("<QQ", self._buffer, self._ids_offset + 8 * i)
+        blob = self._ids_offset + 8 * (self.count + 1)
+        return bytes(self._buffer[blob + start : blob + end]).decode("utf-8")
+
+    def _id_list(self) -> List[Union[str, int]]:
+        """
+        All the ids, read in one pass over the id table.
+        """
+        if not self.has_ids:
+            return list(range(self.count))
+        blob = self._ids_offset + 8 * (self.count + 1)
+        offsets = array.array("Q")
+        offsets.frombytes(bytes(self._buffer[self._ids_offset : blob]))
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        data = bytes(self._buffer[blob : blob + offsets[-1]])
+        return [
+            data[start:end].decode("utf-8") for start, end in zip(offsets, offsets[1:])
+        ]
+
+    def _query_int(self, hash_value: object) -> int:
+        return coerce_hash(hash_value, self.bits_in_hash)[0]
+
+    def distances(self, hash_value: object) -> Any:
+        """
+        Hamming distance from hash_value to every stored hash.
+
+        :param hash_value: Instance of DHash or DHashRecord, a string starting
+                           with "0x" or "0b", or an integer.
+
+        :return: NumPy array of uint16 distances in store order, or an
+                 array.array("H") if NumPy is not installed.
+        """
+        hash_int = self._query_int(hash_value)
+        if self._words is None:
+            return array.array("H", (popcount(hash_int ^ h) for h in self))
+        return word_distances(self._words, hash_int)
+
+    def query(
+        self, hash_value: object, max_distance: int
+    ) -> List[Tuple[int, Union[str, int]]]:
+        """
+        Find all the stored hashes within max_distance of hash_value.
+
+        :param hash_value: The query hash.
+
+        :param max_distance: Maximum hamming distance, inclusive.
+
+        :return: List of (distance, id) tuples sorted by distance. The id is
+                 the position in the store if the store has no id table.
+
+        :rtype: list
+        """
+        distances = self.distances(hash_value)
+        if self._words is None:
+            matches = [i for i, d in enumerate(distances) if d <= max_distance]
+        else:
+            matches = vectorized.numpy.flatnonzero(distances <= max_distance).tolist()
+        results = [(int(distances[i]), self.id(i)) for i in matches]
+        results.sort(key=lambda result: result[0])
+        return results
+
+    def nearest(
+        self,
+        hash_value: object,
+        k: int = 1,
+        exclude: Optional[Container[Union[str, int]]] = None,
+    ) -> List[Tuple[int, Union[str, int]]]:
+        """
+        Find the k stored hashes closest to hash_value.
+
+        :param hash_value: The query hash.
+
+        :param k: Number of results.
+
+        :param exclude: Optional container of ids to skip, such as deleted
+                        ids. The hashes are visited by increasing distance
+                        and the excluded ones passed over, so that k others
+                        are still returned.
+
+        :return: List of at most k (distance, id) tuples sorted by distance.
+
+        :rtype: list
+        """
+        distances = self.distances(hash_value)
+        k = min(k, self.count)
+        if k < 1:
+            return []
+        if exclude:
+            return self._nearest_excluding(distances, k, exclude)
+        if self._words is None:
+            order = sorted(range(self.count), key=distances.__getitem__)[:k]
+        else:
+            numpy = vectorized.numpy
+            order = numpy.argpartition(distances, k - 1)[:k].tolist()
+        results = [(int(distances[i]), self.id(i)) for i in order]
+        results.sort(key=lambda result: result[0])
+        return results
+
+    def _nearest_excluding(
+        self, distances: Any, k: int, exclude: Container[Union[str, int]]
+    ) -> List[Tuple[int, Union[str, int]]]:
+        results: List[Tuple[int, Union[str, int]]] = []
+        if self._words is None:
+            for i in sorted(range(self.count), key=distances.__getitem__):
+                id = self.id(i)
+                if id not in exclude:
+                    results.append((distances[i], id))
+                    if len(results) == k:
+                        break
+            return results
+
+        numpy = vectorized.numpy
+        # number of hashes within every distance
+        within = numpy.cumsum(numpy.bincount(distances))
+        radius = -1
+        while len(results) < k and radius + 1 < len(within):
+            seen = int(within[radius]) if radius >= 0 else 0
+            # the smallest radius holding enough hashes to complete the
+            # results, all the hashes closer than it are needed
+            edge = int(numpy.searchsorted(within, seen + k - len(results)))
+            edge = min(edge, len(within) - 1)
+            inner = numpy.flatnonzero((distances > radius) & (distances < edge))
+            ring = numpy.flatnonzero(distances == edge)
+            for i in chain(inner.tolist(), ring.tolist()):
+                id = self.id(i)
+                if id not in exclude:
+                    results.append((int(distances[i]), id))
+                    if len(results) == k:
+                        break
+            radius = edge
+        results.sort(key=lambda result: result[0])
+        return results
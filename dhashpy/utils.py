@@ -0,0 +1,99 @@
+"""
+Helper functions for working with integer-backed hash values.
+
+None of the functions in this module need Pillow, they only operate on the
+hash values.
+"""
+
+from typing import Optional, Tuple
+
+
+def popcount(value: int) -> int:
+    """
+    Count the number of set bits in a non-negative integer.
+
+    Uses int.bit_count() where available (Python 3.10+) and falls back to
+    counting the "1" characters of the binary representation on older Pythons.
+
+    :param value: A non-negative integer.
+
+    :return: Number of bits set to 1 in value.
+
+    :rtype: int
+    """
+    try:
+        return value.bit_count()  # type: ignore[attr-defined]
+    except AttributeError:
+        return bin(value).count("1")
+
+
+def hamming_distance_int(int_a: int, int_b: int) -> int:
+    """
+    Hamming distance between two integer hash values.
+
+    :param int_a: Integer hash value.
+
+    :param int_b: Integer hash value.
+
+    :return: Number of bit positions that differ between int_a and int_b.
+
+    :rtype: int
+    """
+    return popcount(int_a ^ int_b)
+
+
+def int2bin(value: int, bits_in_hash: int) -> str:
+    """
+    Binary string representation of an integer hash value, prefixed with "0b"
+    and zero padded to bits_in_hash bits.
+
+    :param value: Integer hash value.
+
+    :param bits_in_hash: Number of bits in the hash.
+
+    :return: Binary string prefixed with "0b".
+
+    :rtype: str
+    """
+    return "0b" + format(value, "0%db" % bits_in_hash)
+
+
+def int2hex(value: int) -> str:
+    """
+    Hexadecimal string representation of an integer hash value, prefixed
+    with "0x". Same as the output of DHash.bin2hex, no padding is added.
+
+    :param value: Integer hash value.
+
+    :return: Hexadecimal string prefixed with "0x".
+
+    :rtype: str
+    """
+    return hex(value)
+
+
+def parse_hash_string(hash_string: str) -> Tuple[int, Optional[int]]:
+    """
+    Parse a hash string prefixed with "0x" or "0b" to an integer.
+
+    :param hash_string: Hexadecimal string prefixed with "0x" or binary string
+                        prefixed with "0b".
+
+    :return: A tuple of the integer value and the number of bits in the hash.
+             The number of bits is only known for binary strings, for
+             hexadecimal strings it is None.
+
+    :rtype: tuple
+
+    :raises TypeError: If the string is not prefixed with "0x" or "0b".
+
+    :raises ValueError: If the string is not a valid hexadecimal or binary value.
+    """
+    prefix = hash_string[:2].lower()
+    if prefix == "0x":
+        return int(hash_string, 16), None
+    if prefix == "0b":
+        return int(hash_string, 2), len(hash_string) - 2
+    raise TypeError(
+        "Hash string must start with either '0x' for hexadecimal or '0b' for binary."
+    )
@@ -0,0 +1,119 @@
+"""
+Several hash sizes and gradient directions from a single decode.
+"""
+
+from contextlib import contextmanager
+from typing import (
+    BinaryIO,
+    Dict,
+    Iterable,
+    Iterator,
+    Optional,
+    Tuple,
+    TYPE_CHECKING,
+    Union,
+)
+
+from .dHash import DHash, DHashRecord, _bytes_file
+
+if TYPE_CHECKING:  # pragma: no cover
+    from PIL import Image
+
+DIRECTIONS = ("row", "column")
+
+Source = Union[str, bytes, bytearray, memoryview, BinaryIO, "Image.Image"]
+
+
+@contextmanager
+def _opened(source: Source) -> Iterator["Image.Image"]:
+    """
+    The image of source, closed on exit if it was opened here. An image
+    of the caller is used as it is and left open.
+    """
+    from PIL import Image
+
+    if isinstance(source, Image.Image):
+        yield source
+        return
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = _bytes_file(source)
+    with Image.open(source) as image:
+        yield image
+
+
+def hash_variants(
+    source: Source,
+    heights: Iterable[int] = (8,),
+    directions: Iterable[str] = ("row",),
+    fast: bool = False,
+    path: Optional[str] = None,
+) -> Dict[Tuple[str, int], DHashRecord]:
+    """
+    Hash an image at several heights and gradient directions, decoding and
+    converting it to grayscale only once. Every variant is resized from the
+    shared grayscale image.
+
+    The "row" variants are the hashes DHash computes, equal to
+    DHash(path, height) unless fast is True. The "column" variants compare
+    every pixel with the pixel below it instead of the pixel on its right:
+    the image is resized to height + 1 rows of height pixels, and the bits
+    are ordered column by column, top to bottom. Only compare variants of the same
+    direction and height with each other.
+
+    :param source: Path of the image, encoded image as bytes, bytearray or
+                   memoryview, binary file object or PIL.Image.Image.
+
+    :param heights: The heights to hash at, see DHash.__init__.
+
+    :param directions: Any of "row" and "column".
+
+    :param fast: Use the fast mode, see DHash.__init__. The image is reduced
+                 once, for the largest height.
+
+    :param path: Path kept in the records, defaults to source if it is a
+                 path.
+
+    :return: Dict mapping (direction, height) to the DHashRecord of the
+             variant.
+
+    :rtype: dict
+
+    :raises ValueError: If a direction is unknown or no height is given.
+    """
+    heights = sorted(set(heights))
+    directions = list(dict.fromkeys(directions))
+    for direction in directions:
+        if direction not in DIRECTIONS:
+            raise ValueError(
+                "Unknown direction '%s', expected one of %s."
+                % (direction, ", ".join(DIRECTIONS))
+            )
+    if not heights or not directions:
+        raise ValueError("At least one height and one direction are required.")
+    if path is None and isinstance(source, str):
+        path = source
+
+    from PIL import Image
+
+    with _opened(source) as image:
+        if fast:
+            largest = heights[-1] + 1
+            # draft() would change the image of the caller in place
+            draft = image is not source
+            image = DHash._fast_reduce(image, largest, largest, draft)
+        gray = image.convert("L")
+
+    records = {}
+    for height in heights:
+        if "row" in directions:
+            resized = gray.resize((height + 1, height), Image.LANCZOS)
+            records["row", height] = DHashRecord(
+                DHash._image_to_int(resized), height, path
+            )
+        if "column" in directions:
+            resized = gray.resize((height, height + 1), Image.LANCZOS)
+            transposed = resized.transpose(Image.TRANSPOSE)
+            records["column", height] = DHashRecord(
+                DHash._image_to_int(transposed), height, path
+            )
+    return records
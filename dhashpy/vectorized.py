@@ -0,0 +1,115 @@
+"""
+NumPy implementation of the bit extraction of the dHash algorithm.
+
+NumPy is an optional dependency, numpy is None if it is not installed and
+the pure python loop in DHash is used instead. It is imported the first
+time vectorized.numpy is read, so that importing dhashpy does not pay for
+it.
+"""
+
+import sys
+from typing import Any, List
+
+# set by _numpy(), the module or None
+numpy: Any
+
+
+def _numpy() -> Any:
+    """
+    NumPy, imported on first use, or None if it is not installed.
+    """
+    try:
+        return globals()["numpy"]
+    except KeyError:
+        pass
+    try:
+        import numpy as module
+    except ImportError:  # pragma: no cover
+        module = None  # type: ignore[assignment]
+    globals()["numpy"] = module
+    return module
+
+
+def __getattr__(name: str) -> Any:
+    if name == "numpy":
+        return _numpy()
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+if sys.version_info < (3, 7):  # pragma: no cover
+    # module __getattr__ is new in Python 3.7
+    _numpy()
+
+
+def _require_numpy() -> Any:
+    numpy = _numpy()
+    if numpy is None:
+        raise ImportError("NumPy is required, install it with 'pip install numpy'.")
+    return numpy
+
+
+def _check_shape(height: int, width: int) -> None:
+    if width != height + 1:
+        raise ValueError(
+            "Resized image must be (height, height + 1), got (%d, %d)."
+            % (height, width)
+        )
+
+
+def _packed_to_int(packed: Any, bits_in_hash: int) -> int:
+    # np.packbits pads the last byte with zeros on the right, shift them out.
+    return int.from_bytes(packed.tobytes(), "big") >> (-bits_in_hash % 8)
+
+
+def hash_array(pixels: Any) -> int:
+    """
+    Compute the hash bits of one resized grayscale image.
+
+    :param pixels: Array like of shape (height, height + 1), the L mode
+                   pixel values of the resized image. A PIL image can be
+                   passed through numpy.asarray().
+
+    :return: The hash as an integer, same as DHash.hash_int.
+
+    :rtype: int
+
+    :raises ValueError: If the shape is not (height, height + 1).
+
+    :raises ImportError: If NumPy is not installed.
+    """
+    numpy = _require_numpy()
+    pixels = numpy.asarray(pixels)
+    if pixels.ndim != 2:
+        raise ValueError("Expected a 2 dimensional array, got %d." % pixels.ndim)
+    height, width = pixels.shape
+    _check_shape(height, width)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return _packed_to_int(numpy.packbits(bits), height * height)
+
+
+def hash_array_batch(stack: Any) -> List[int]:
+    """
+    Compute the hash bits of a batch of resized grayscale images at once.
+
+    :param stack: Array like of shape (N, height, height + 1), the L mode
+                  pixel values of N resized images.
+
+    :return: List of N hashes as integers, in the order of the stack.
+
+    :rtype: list
+
+    :raises ValueError: If the shape is not (N, height, height + 1).
+
+    :raises ImportError: If NumPy is not installed.
+    """
+    numpy = _require_numpy()
+    stack = numpy.asarray(stack)
+    if stack.ndim != 3:
+        raise ValueError("Expected a 3 dimensional array, got %d." % stack.ndim)
+    count, height, width = stack.shape
+    _check_shape(height, width)
+    bits = (stack[:, :, 1:] > stack[:, :, :-1]).reshape(count, height * height)
+    packed = numpy.packbits(bits, axis=1)
+    if height == 8:
+        return packed.view(">u8").ravel().tolist()
+    return [_packed_to_int(row, height * height) for row in packed]
@@ -28,6 +28,8 @@ setup(
         "compare images",
     ],
     install_requires=["Pillow"],
+    extras_require={"numpy": ["numpy"]},
+    entry_points={"console_scripts": ["dhashpy = dhashpy.cli:main"]},
     python_requires=">=3.6",
     classifiers=[
         "Development Status :: 5 - Production/Stable",
@@ -0,0 +1,15 @@
+import pytest
+
+from .images import make_image
+
+
+@pytest.fixture
+def image_file(tmp_path):
+    """Factory fixture, saves a synthetic image and returns its path."""
+
+    def _image_file(name="image.png", **kwargs):
+        path = str(tmp_path / name)
+        make_image(**kwargs).save(path)
+        return path
+
+    return _image_file
@@ -0,0 +1,61 @@
+"""
+Synthetic images shared by the tests and the benchmarks, without pytest.
+"""
+
+import io
+import random
+import struct
+
+from PIL import Image, ImageDraw
+
+
+def make_image(width=320, height=240, seed=0, mode="RGB"):
+    """
+    Deterministic synthetic image, a gradient with random shapes. RGBA
+    images get a gradient alpha channel and P images an adaptive palette.
+    """
+    rng = random.Random(seed)
+    image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        x1 = min(width, x0 + rng.randrange(width // 8, width // 2))
+        y1 = min(height, y0 + rng.randrange(height // 8, height // 2))
+        fill = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        if rng.random() < 0.5:
+            draw.rectangle((x0, y0, x1, y1), fill=fill)
+        else:
+            draw.ellipse((x0, y0, x1, y1), fill=fill)
+    if mode == "RGBA":
+        image.putalpha(Image.linear_gradient("L").resize((width, height)))
+        return image
+    if mode == "P":
+        return image.quantize(256)
+    return image.convert(mode)
+
+
+def make_camera_jpeg(image, thumbnail_size=(160, 120), byte_order="<"):
+    """
+    Encode image as a JPEG with an EXIF thumbnail of thumbnail_size, like
+    camera JPEGs. The thumbnail is resized from image, without letterbox.
+    """
+    thumbnail = io.BytesIO()
+    image.resize(thumbnail_size, Image.LANCZOS).save(thumbnail, "JPEG")
+    thumbnail = thumbnail.getvalue()
+    # TIFF header, an empty IFD0, then IFD1 with the compression, offset and
+    # length of the JPEG thumbnail
+    ifd1 = 8 + 6
+    offset = ifd1 + 2 + 3 * 12 + 4
+    tiff = (
+        (b"II*\x00" if byte_order == "<" else b"MM\x00*")
+        + struct.pack(byte_order + "IHI", 8, 0, ifd1)
+        + struct.pack(byte_order + "H", 3)
+        + struct.pack(byte_order + "HHIHH", 0x0103, 3, 1, 6, 0)
+        + struct.pack(byte_order + "HHII", 0x0201, 4, 1, offset)
+        + struct.pack(byte_order + "HHII", 0x0202, 4, 1, len(thumbnail))
+        + struct.pack(byte_order + "I", 0)
+        + thumbnail
+    )
+    data = io.BytesIO()
+    image.save(data, "JPEG", exif=b"Exif\x00\x00" + tiff)
+    return data.getvalue()
@@ -0,0 +1,89 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+
+from dhashpy import DHash, HashCache, ahash, ahash_stream
+
+
+def run(coroutine):
+    # run() needs Python 3.7
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+
+def test_ahash(image_file):
+    path = image_file(seed=1)
+
+    async def main():
+        with ProcessPoolExecutor(1) as executor:
+            in_process = await DHash.ahash(path, height=4, executor=executor)
+        return await DHash.ahash(path), in_process
+
+    dhash, in_process = run(main())
+    assert dhash == DHash(path)
+    assert in_process == DHash(path, height=4)
+
+
+def test_ahash_stream(image_file, tmp_path):
+    paths = [image_file("%d.png" % seed, seed=seed) for seed in range(6)]
+    missing = str(tmp_path / "missing.png")
+    consumed = []
+
+    async def source():
+        for path in paths + [missing]:
+            consumed.append(path)
+            yield path
+
+    async def main():
+        results = []
+        async for result in DHash.ahash_stream(source(), concurrency=2):
+            # backpressure, the source is read at most concurrency ahead
+            assert len(consumed) <= len(results) + 2
+            results.append(result)
+        return results
+
+    results = run(main())
+    assert sorted(result.path for result in results) == sorted(paths + [missing])
+    for result in results:
+        if result.path == missing:
+            assert isinstance(result.error, FileNotFoundError)
+        else:
+            assert result.record == DHash(result.path)
+
+    async def first_only():
+        with ThreadPoolExecutor(1) as executor:
+            stream = ahash_stream(paths, concurrency=3, executor=executor)
+            async for result in stream:
+                await stream.aclose()
+                return result
+
+    assert run(first_only()).ok
+
+    with pytest.raises(ValueError):
+        ahash_stream(paths, concurrency=0)
+
+
+def test_cache_in_default_executor(image_file, tmp_path):
+    paths = [image_file("%d.png" % seed, seed=seed) for seed in range(6)]
+    cache = HashCache(str(tmp_path / "cache.sqlite"))
+    # the connection of this thread, the executor threads open their own
+    cache.put(paths[0], DHash(paths[0]).hash_int)
+
+    async def main():
+        dhash = await ahash(paths[1], cache=cache)
+        results = [
+            result async for result in ahash_stream(paths, concurrency=3, cache=cache)
+        ]
+        return dhash, results
+
+    dhash, results = run(main())
+    assert dhash == DHash(paths[1])
+    assert all(result.ok for result in results)
+    assert all(result.record == DHash(result.path) for result in results)
+    assert len(cache) == 6
+    cache.close()
@@ -0,0 +1,44 @@
+import pytest
+
+from dhashpy import DHash, HashResult, hash_many
+
+
+def test_hash_many(image_file, tmp_path):
+    paths = [image_file("%d.png" % seed, seed=seed) for seed in range(6)]
+    missing = str(tmp_path / "missing.png")
+    not_an_image = str(tmp_path / "not_an_image.png")
+    with open(not_an_image, "w") as f:
+        f.write("not an image")
+    inputs = paths[:3] + [missing] + paths[3:] + [not_an_image]
+
+    results = list(DHash.hash_many(inputs, workers=2, chunksize=2))
+    assert [result.path for result in results] == inputs
+    assert all(isinstance(result, HashResult) for result in results)
+
+    failed = {result.path: result for result in results if not result.ok}
+    assert set(failed) == {missing, not_an_image}
+    assert isinstance(failed[missing].error, FileNotFoundError)
+    assert failed[missing].record is None
+
+    for result in results:
+        if result.ok:
+            assert result.record == DHash(result.path)
+
+    unordered = list(
+        hash_many(inputs, height=4, workers=2, chunksize=1, ordered=False, fast=True)
+    )
+    assert sorted(result.path for result in unordered) == sorted(inputs)
+    for result in unordered:
+        if result.ok:
+            assert result.record.bits_in_hash == 16
+
+    serial = list(hash_many(iter(paths), workers=0))
+    assert [result.record.hash_int for result in serial] == [
+        result.record.hash_int for result in results if result.ok
+    ]
+
+    with pytest.raises(ValueError):
+        hash_many(paths, chunksize=0)
+
+    with pytest.raises(ValueError):
+        hash_many(paths, workers=-1)
@@ -0,0 +1,67 @@
+import importlib.util
+import json
+import os
+
+from .images import make_camera_jpeg, make_image
+
+BENCHMARKS = os.path.join(os.path.dirname(os.path.dirname(__file__)), "benchmarks")
+BENCH = os.path.join(BENCHMARKS, "bench.py")
+
+
+def load_bench(path=BENCH):
+    name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_quick_run_and_compare(tmp_path, capsys):
+    bench = load_bench()
+    output = str(tmp_path / "results.json")
+    argv = ["--quick", "--repeat", "1", "--min-time", "0", "-o", output]
+    assert bench.main(argv) == 0
+    with open(output) as f:
+        results = json.load(f)
+
+    assert results["schema"] == bench.SCHEMA_VERSION
+    assert results["environment"]["dhashpy"]
+    names = {(r["group"], r["name"]) for r in results["results"]}
+    for stage in ("decode", "grayscale", "resize", "bits", "dhash", "dhash_fast"):
+        assert ("image", stage) in names
+    for comparison in ("sub", "hamming_distance", "hex2bin", "one_to_many"):
+        assert ("compare", comparison) in names
+    assert ("startup", "import") in names
+    formats = {(r["format"], r["mode"]) for r in results["results"] if "format" in r}
+    assert ("PNG", "P") in formats and ("WEBP", "RGBA") in formats
+    assert all(r["min"] > 0 and r["number"] >= 1 for r in results["results"])
+
+    capsys.readouterr()
+    assert bench.main(argv + ["--compare", output]) == 0
+    assert "current / baseline" in capsys.readouterr().err
+
+
+def test_thumbnails(tmp_path):
+    thumbnails = load_bench(os.path.join(BENCHMARKS, "thumbnails.py"))
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    for seed in range(3):
+        data = make_camera_jpeg(make_image(1600, 1200, seed=seed))
+        (corpus / ("%d.jpg" % seed)).write_bytes(data)
+    make_image(seed=3).save(str(corpus / "plain.jpg"))
+    (corpus / "broken.jpg").write_bytes(b"not an image")
+
+    output = str(tmp_path / "thumbnails.json")
+    assert thumbnails.main([str(corpus), "--threshold", "4", "-o", output]) == 0
+    with open(output) as f:
+        results = json.load(f)
+    assert results["sources"] == {
+        "images": 5,
+        "thumbnail": 3,
+        "image": 1,
+        "errors": 1,
+    }
+    assert results["agreement"]["compared"] == 3
+    assert results["agreement"]["within_4"] == 1.0
+    assert results["disagree"] == []
+    assert results["time"]["speedup"] > 0
@@ -0,0 +1,109 @@
+import io
+import multiprocessing
+import os
+import time
+
+from PIL import Image
+import pytest
+
+from dhashpy import Budget, DHash, budget, hash_many
+from dhashpy.batch import _hash_one
+
+from .images import make_image
+
+fork_only = pytest.mark.skipif(
+    multiprocessing.get_start_method() != "fork",
+    reason="the patched worker function is only inherited by forked workers",
+)
+
+
+def save(directory, name, image, format="PNG"):
+    path = os.path.join(str(directory), name)
+    image.save(path, format)
+    return path
+
+
+def test_check():
+    image = make_image(400, 300)
+    data = io.BytesIO()
+    image.save(data, "PNG")
+    data = data.getvalue()
+
+    assert DHash.from_bytes(data, budget=Budget(max_pixels=120000)) == (
+        DHash.from_bytes(data)
+    )
+    with pytest.raises(Image.DecompressionBombError):
+        DHash.from_bytes(data, budget=Budget(max_pixels=119999))
+    # RGB is stored in 4 bytes per pixel
+    assert budget.decoded_size(Image.open(io.BytesIO(data))) == 480000
+    DHash.from_bytes(data, budget=Budget(max_decoded_bytes=480000))
+    with pytest.raises(Image.DecompressionBombError):
+        DHash.from_bytes(data, budget=Budget(max_decoded_bytes=479999))
+    assert budget.decoded_size(image.convert("L")) == 120000
+
+
+def test_hash_many_max_pixels(tmp_path):
+    small = save(tmp_path, "small.png", make_image(80, 60))
+    large = save(tmp_path, "large.png", make_image(800, 600))
+    limits = Budget(max_pixels=10000)
+    for workers in (0, 2):
+        results = list(hash_many([small, large, small], workers=workers, budget=limits))
+        assert [result.ok for result in results] == [True, False, True]
+        assert isinstance(results[1].error, Image.DecompressionBombError)
+
+
+def test_memory_budget(tmp_path):
+    if budget.resource is None:
+        pytest.skip("resource.setrlimit is not available")
+    small = save(tmp_path, "small.png", make_image(80, 60))
+    # 144 MB decoded, from a small file
+    huge = save(tmp_path, "huge.png", Image.new("RGB", (6000, 6000), (9, 9, 9)))
+    paths = [small, huge, small, huge, small]
+    results = list(hash_many(paths, workers=1, budget=Budget(max_memory=32 << 20)))
+    assert [result.path for result in results] == paths
+    assert [result.ok for result in results] == [True, False, True, False, True]
+    assert isinstance(results[1].error, MemoryError)
+    assert results[2].record == DHash(small)
+
+
+def slow_or_crash(path, options):
+    name = os.path.basename(path)
+    if name == "slow.png":
+        time.sleep(30)
+    if name == "crash.png":
+        os._exit(3)
+    return _hash_one(path, options)
+
+
+@fork_only
+def test_timeout_and_crash(tmp_path, monkeypatch):
+    monkeypatch.setattr(budget, "_hash_one", slow_or_crash)
+    paths = []
+    for i in range(6):
+        paths.append(save(tmp_path, "%d.png" % i, make_image(seed=i)))
+    paths.insert(2, save(tmp_path, "slow.png", make_image()))
+    paths.insert(4, save(tmp_path, "crash.png", make_image()))
+
+    start = time.monotonic()
+    results = list(hash_many(paths, workers=2, budget=Budget(timeout=1)))
+    assert time.monotonic() - start < 10
+    assert [result.path for result in results] == paths
+    errors = {result.path: result.error for result in results if not result.ok}
+    assert set(errors) == {paths[2], paths[4]}
+    assert isinstance(errors[paths[2]], TimeoutError)
+    assert "code 3" in str(errors[paths[4]])
+    for result in results:
+        if result.ok:
+            assert result.record == DHash(result.path)
+
+    unordered = list(
+        hash_many(paths, workers=3, ordered=False, budget=Budget(timeout=1))
+    )
+    assert sorted(result.path for result in unordered) == sorted(paths)
+    assert sum(not result.ok for result in unordered) == 2
+
+
+def test_errors(tmp_path):
+    with pytest.raises(ValueError):
+        list(hash_many([], workers=0, budget=Budget(timeout=1)))
+    assert list(hash_many([], workers=2, budget=Budget(timeout=1))) == []
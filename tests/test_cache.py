@@ -0,0 +1,107 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import pickle
+
+import pytest
+
+from dhashpy import DHash, HashCache
+
+
+def test_cache(image_file, tmp_path):
+    cache = HashCache(str(tmp_path / "cache.sqlite"))
+    path = image_file(seed=1)
+
+    computed = DHash(path, cache=cache)
+    assert computed.image is not None
+    assert len(cache) == 1
+    cached = DHash(path, cache=cache)
+    assert cached.image is None
+    assert cached.hash_int == computed.hash_int
+    assert cache.get(path) == computed.hash_int
+
+    # every height and mode has its own entry
+    assert cache.get(path, height=4) is None
+    assert cache.get(path, fast=True) is None
+    assert DHash(path, height=4, cache=cache).image is not None
+    assert DHash(path, fast=True, cache=cache).image is not None
+    assert len(cache) == 3
+
+    # a changed file is a miss
+    changed = DHash(image_file(seed=2))  # overwrites the file at path
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert cache.get(path) is None
+    recomputed = DHash(path, cache=cache)
+    assert recomputed.image is not None
+    assert recomputed == changed
+    assert DHash(path, cache=cache).image is None
+
+    assert cache.invalidate(path) == 3
+    assert cache.get(path) is None
+    assert len(cache) == 0
+
+    # the cache can be used again after it is closed
+    with cache:
+        cache.put(path, 0xFF)
+    assert cache.get(path) == 0xFF
+    cache.clear()
+    assert len(cache) == 0
+
+    with pytest.raises(FileNotFoundError):
+        cache.get(str(tmp_path / "missing.png"))
+
+
+def test_eviction(image_file, tmp_path):
+    cache = HashCache(str(tmp_path / "cache.sqlite"), max_entries=2)
+    paths = [image_file("%d.png" % seed, seed=seed) for seed in range(3)]
+    cache.put(paths[0], 0)
+    cache.put(paths[1], 1)
+    assert cache.get(paths[0]) == 0
+    cache.put(paths[2], 2)
+    assert len(cache) == 2
+    # paths[1] is the least recently used
+    assert cache.get(paths[1]) is None
+    assert cache.get(paths[0]) == 0
+    assert cache.get(paths[2]) == 2
+
+    with pytest.raises(ValueError):
+        HashCache(str(tmp_path / "other.sqlite"), max_entries=0)
+
+
+def test_threads(image_file, tmp_path):
+    cache = HashCache(str(tmp_path / "cache.sqlite"))
+    paths = [image_file("%d.png" % seed, seed=seed) for seed in range(8)]
+
+    def put_get(i):
+        cache.put(paths[i], i)
+        return cache.get(paths[i])
+
+    # every thread opens its own connection
+    with ThreadPoolExecutor(4) as executor:
+        assert list(executor.map(put_get, range(8))) == list(range(8))
+    assert len(cache) == 8
+    cache.close()
+
+
+def test_eviction_in_workers(image_file, tmp_path):
+    # a worker gets a new HashCache for every chunk, shorter than the
+    # eviction step of 5 puts
+    cache = HashCache(str(tmp_path / "cache.sqlite"), max_entries=500)
+    paths = [image_file("%d.png" % i, width=16, height=12, seed=i) for i in range(600)]
+    results = list(DHash.hash_many(paths, workers=2, chunksize=4, cache=cache))
+    assert all(result.ok for result in results)
+    assert len(cache) <= 505
+
+
+def test_cache_in_batch(image_file, tmp_path):
+    cache = HashCache(str(tmp_path / "cache.sqlite"))
+    paths = [image_file("%d.png" % seed, seed=seed) for seed in range(4)]
+    first = list(DHash.hash_many(paths, workers=2, chunksize=1, cache=cache))
+    assert len(cache) == 4
+    second = list(DHash.hash_many(paths, workers=2, cache=cache))
+    assert [r.record.hash_int for r in first] == [r.record.hash_int for r in second]
+    assert all(cache.get(path) == DHash(path).hash_int for path in paths)
+
+    copy = pickle.loads(pickle.dumps(cache))
+    assert copy.path == cache.path
+    assert copy.get(paths[0]) == first[0].record.hash_int
@@ -0,0 +1,96 @@
+import json
+import os
+
+import pytest
+
+from dhashpy import DHash
+from dhashpy.cli import load_hashes, main
+
+from .images import make_image
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "images"
+    (root / "sub").mkdir(parents=True)
+    paths = []
+    for seed in range(3):
+        path = str(root / ("%d.png" % seed))
+        make_image(seed=seed).save(path)
+        paths.append(path)
+    # a near duplicate of 0.png
+    duplicate = str(root / "sub" / "0_small.jpg")
+    make_image(seed=0).resize((160, 120)).save(duplicate)
+    paths.append(duplicate)
+    return str(root), paths
+
+
+@pytest.mark.parametrize("extension", ["jsonl", "csv", "dhst"])
+def test_hash_query_dupes(tree, tmp_path, capsys, extension):
+    root, paths = tree
+    output = str(tmp_path / ("hashes." + extension))
+    assert main(["hash", root, "-o", output, "--workers", "2"]) == 0
+    assert "4 files, 0 errors" in capsys.readouterr().err
+
+    stored = dict(load_hashes(output))
+    assert set(stored) == set(paths)
+    for path, record in stored.items():
+        assert record == DHash(path)
+
+    query = DHash(paths[1]).hash_hex
+    assert main(["query", query, output]) == 0
+    assert capsys.readouterr().out == "0\t%s\n" % paths[1]
+    assert main(["query", paths[2], output, "-k", "2"]) == 0
+    assert capsys.readouterr().out.splitlines()[0] == "0\t%s" % paths[2]
+
+    assert main(["dupes", output, "-t", "4"]) == 0
+    clusters = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [sorted(cluster["paths"]) for cluster in clusters] == [
+        sorted([paths[0], paths[3]])
+    ]
+
+
+def test_resume(tree, tmp_path, capsys):
+    root, paths = tree
+    output = str(tmp_path / "hashes.csv")
+    assert main(["hash", paths[0], "-o", output, "--workers", "0"]) == 0
+    broken = os.path.join(root, "broken.png")
+    with open(broken, "w") as f:
+        f.write("not an image")
+    assert main(["hash", root, "-o", output, "--resume", "--workers", "0"]) == 1
+    err = capsys.readouterr().err
+    assert "4 files, 1 errors" in err
+    assert "broken.png" in err
+    assert sorted(path for path, _ in load_hashes(output)) == sorted(paths)
+
+    binary = str(tmp_path / "hashes.dhst")
+    assert main(["hash", root, "-o", binary, "--resume"]) == 2
+
+
+@pytest.mark.parametrize("extension", ["jsonl", "csv"])
+def test_resume_torn_line(tree, tmp_path, extension):
+    root, paths = tree
+    output = str(tmp_path / ("hashes." + extension))
+    assert main(["hash", paths[0], paths[1], "-o", output, "--workers", "0"]) == 0
+    # a run killed in the middle of writing its last line
+    with open(output, "rb") as f:
+        data = f.read()
+    with open(output, "wb") as f:
+        f.write(data[:-12])
+    if extension == "jsonl":
+        assert len(load_hashes(output)) == 1
+
+    assert main(["hash", root, "-o", output, "--resume", "--workers", "0"]) == 0
+    assert sorted(path for path, _ in load_hashes(output)) == sorted(paths)
+    with open(output) as f:
+        assert f.read().endswith("\n")
+
+
+def test_budget(tree, tmp_path, capsys):
+    root, paths = tree
+    output = str(tmp_path / "hashes.jsonl")
+    # the 320x240 images fail, the 160x120 duplicate is hashed
+    assert main(["hash", root, "-o", output, "--max-pixels", "20000"]) == 1
+    err = capsys.readouterr().err
+    assert "4 files, 3 errors" in err
+    assert [path for path, _ in load_hashes(output)] == [paths[3]]
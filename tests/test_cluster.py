@@ -0,0 +1,66 @@
+import random
+
+import pytest
+
+from dhashpy import DHashRecord, cluster
+
+
+def random_hashes(count, bits=64, seed=0):
+    rng = random.Random(seed)
+    base = [rng.getrandbits(bits) for _ in range(count // 4)]
+    hashes = list(base)
+    while len(hashes) < count:
+        value = rng.choice(base)
+        for _ in range(rng.randrange(6)):
+            value ^= 1 << rng.randrange(bits)
+        hashes.append(value)
+    rng.shuffle(hashes)
+    return hashes
+
+
+def brute_force(hashes, max_distance):
+    parent = list(range(len(hashes)))
+
+    def find(i):
+        while parent[i] != i:
+            i = parent[i]
+        return i
+
+    for i in range(len(hashes)):
+        for j in range(i + 1, len(hashes)):
+            if bin(hashes[i] ^ hashes[j]).count("1") <= max_distance:
+                parent[max(find(i), find(j))] = min(find(i), find(j))
+    clusters = {}
+    for i in range(len(hashes)):
+        clusters.setdefault(find(i), []).append(i)
+    return sorted(members for members in clusters.values() if len(members) > 1)
+
+
+@pytest.mark.parametrize("max_distance", [0, 1, 3, 6])
+def test_cluster_matches_brute_force(max_distance):
+    hashes = random_hashes(300)
+    result = cluster(hashes, max_distance, bits_in_hash=64, workers=0)
+    assert sorted(result.clusters) == brute_force(hashes, max_distance)
+    all_pairs = len(hashes) * (len(hashes) - 1) // 2
+    assert result.comparisons <= result.candidates < all_pairs
+    if max_distance == 0:
+        assert result.comparisons == 0
+
+
+def test_cluster_workers_and_inputs():
+    hashes = random_hashes(200, bits=81, seed=1)
+    records = [DHashRecord(value, height=9) for value in hashes]
+    serial = cluster(records, 4, workers=0)
+    parallel = cluster(records, 4, workers=2)
+    assert parallel.clusters == serial.clusters
+    assert serial.clusters == brute_force(hashes, 4)
+
+    singletons = cluster(records, 4, workers=0, min_size=1)
+    assert sum(len(members) for members in singletons.clusters) == len(hashes)
+
+    assert cluster([0b0, 0b1, 0b11], 2, bits_in_hash=2).clusters == [[0, 1, 2]]
+    assert cluster([], 3).clusters == []
+    with pytest.raises(ValueError):
+        cluster([1, 2], 1)
+    with pytest.raises(ValueError):
+        cluster([1, 2], -1, bits_in_hash=64)
@@ -0,0 +1,63 @@
+import array
+import random
+
+import pytest
+
+from dhashpy import DHashRecord, distances, pack_words, vectorized, within
+
+
+def distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+@pytest.fixture(params=["numpy", "python"])
+def mode(request, monkeypatch):
+    if request.param == "python":
+        monkeypatch.setattr(vectorized, "numpy", None)
+    elif vectorized.numpy is None:
+        pytest.skip("NumPy is not installed")
+    return request.param
+
+
+@pytest.mark.parametrize("height", [4, 8, 9, 16])
+def test_distances_and_within(mode, height):
+    bits = height * height
+    rng = random.Random(height)
+    hashes = [rng.getrandbits(bits) for _ in range(500)]
+    query = DHashRecord(hashes[3] ^ 0b1011, height)
+    expected = [distance(query.hash_int, h) for h in hashes]
+
+    records = [DHashRecord(h, height) for h in hashes]
+    hex_strings = [record.hash_hex for record in records]
+    inputs = [hashes, hex_strings, records, [record.hash for record in records]]
+    if mode == "numpy":
+        inputs.append(pack_words(hex_strings, bits))
+    for candidates in inputs:
+        result = distances(query, candidates)
+        assert list(result) == expected
+        assert len(result) == len(hashes)
+
+    assert list(distances(query.hash_hex, hex_strings, bits)) == expected
+    close = within(query, hex_strings, 3)
+    assert list(close) == [i for i, d in enumerate(expected) if d <= 3]
+    assert 3 in list(close)
+
+    with pytest.raises(ValueError):
+        distances(query, [1 << bits])
+
+
+def test_arrays(mode):
+    hashes = array.array("Q", [0, 0xFF, 0xFFFFFFFFFFFFFFFF])
+    assert list(distances(0x0F, hashes, 64)) == [4, 4, 60]
+    assert list(within("0x0f", hashes, 4, 64)) == [0, 1]
+    assert list(distances(0, [], 64)) == []
+    if mode == "numpy":
+        numpy = vectorized.numpy
+        words = numpy.array([0, 0xFF], dtype=numpy.uint64)
+        assert distances(0x0F, words, 64).dtype == numpy.uint16
+        assert within(0, words, 0).tolist() == [0]
+        with pytest.raises(ValueError):
+            distances(1 << 64, words)
+    else:
+        with pytest.raises(ImportError):
+            pack_words([1], 64)
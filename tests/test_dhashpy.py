@@ -1,6 +1,6 @@
 import pytest
 import os
-from dhashpy import DHash
+from dhashpy import DHash, DHashRecord
 import urllib.request
 
 
@@ -81,3 +81,123 @@ def test_all():
 
     with pytest.raises(ValueError):
         DHash.bin2hex("10101")
+
+
+def test_int_backed_hash(image_file):
+    dhash = DHash(image_file(seed=1))
+    assert isinstance(dhash.hash_int, int)
+    assert dhash.hash == "0b" + format(dhash.hash_int, "064b")
+    assert dhash.hash_hex == hex(dhash.hash_int)
+    assert DHash.hex2bin(dhash.hash_hex, 64) == dhash.hash
+    assert (dhash - dhash.hash) == 0
+    assert (dhash - dhash.hash_hex.upper().replace("0X", "0x")) == 0
+
+    flipped = dhash.hash_int ^ 0b1011
+    assert (dhash - hex(flipped)) == 3
+    assert (dhash - ("0b" + format(flipped, "064b"))) == 3
+    assert DHash.hamming_distance(dhash.hash, "0b" + format(flipped, "064b")) == 3
+    assert DHash.hamming_distance("abcd", "abce") == 1
+
+    # more bits than the hash can hold
+    with pytest.raises(ValueError):
+        dhash - hex(1 << 64)
+
+    with pytest.raises(ValueError):
+        dhash - DHash(image_file(seed=1), height=4)
+
+
+def test_record(image_file):
+    path = image_file(seed=2)
+    dhash = DHash(path, height=5)
+    record = dhash.to_record()
+    assert isinstance(record, DHashRecord)
+    assert not hasattr(record, "__dict__")
+    assert not hasattr(record, "image")
+    assert record == dhash
+    assert dhash == record
+    assert (record - dhash.hash_hex) == 0
+    assert record.hash == dhash.hash
+    assert record.bits_in_hash == 25
+    assert record.width == 6
+    assert record.path == path
+    assert len(record) == 27
+    assert "DHashRecord" in repr(record)
+    assert str(record) == dhash.hash
+
+    with pytest.raises(ValueError):
+        DHashRecord(1 << 64)
+
+    with pytest.raises(ValueError):
+        DHashRecord(-1)
+
+
+def test_fast_mode(image_file):
+    # Documented bound of the fast mode, at most 2 of 64 bits differ from the
+    # exact mode on this corpus.
+    distances = []
+    for seed in range(12):
+        path = image_file(
+            "fast_%d.%s" % (seed, "jpg" if seed % 2 else "png"),
+            width=2048,
+            height=1536,
+            seed=seed,
+        )
+        exact = DHash(path)
+        fast = DHash(path, fast=True)
+        assert fast.fast and not exact.fast
+        assert fast.image.size == (9, 8)
+        distances.append(exact - fast)
+    assert max(distances) <= 2
+    assert sum(distances) <= len(distances)
+
+    # palette images are converted to grayscale before the reduce
+    path = image_file("fast_p.png", width=2048, height=1536, seed=20, mode="P")
+    assert (DHash(path) - DHash(path, fast=True)) <= 2
+
+    # small images are not reduced at all and give the exact hash
+    path = image_file("fast_small.png", width=64, height=48, seed=3, mode="P")
+    assert DHash(path, fast=True) == DHash(path)
+
+
+def test_fast_mode_keeps_caller_image(image_file):
+    from PIL import Image
+
+    path = image_file("fast_large.jpg", width=2048, height=1536, seed=21)
+    with Image.open(path) as image:
+        fast = DHash.from_image(image, fast=True)
+        # draft() is not used on images of the caller
+        assert (image.mode, image.size) == ("RGB", (2048, 1536))
+    # decoded at full size and reduced, like fast mode PNG images
+    assert fast - DHash(path) <= 4
+
+
+def test_in_memory_inputs(image_file):
+    from PIL import Image
+
+    path = image_file("memory.jpg", seed=6)
+    expected = DHash(path, height=6)
+    with open(path, "rb") as f:
+        data = f.read()
+
+    assert DHash.from_bytes(data, height=6) == expected
+    assert DHash.from_bytes(bytearray(data), height=6) == expected
+    assert DHash.from_bytes(memoryview(data), height=6, path="blob").path == "blob"
+    assert DHash.from_bytes(memoryview(data), height=6) == expected
+    assert DHash.from_bytes(data, height=6).path is None
+    with open(path, "rb") as f:
+        from_file = DHash.from_file(f, height=6)
+    assert from_file == expected
+    assert from_file.path == path
+
+    with Image.open(path) as image:
+        assert DHash.from_image(image, height=6) == expected
+        assert image.mode == "RGB"
+        assert DHash(image=image, height=6) == expected
+        assert DHash.from_image(image.convert("L"), height=6) == expected
+
+    numpy = pytest.importorskip("numpy")
+    with Image.open(path) as image:
+        assert DHash.from_array(numpy.asarray(image), height=6) == expected
+
+    with pytest.raises(FileNotFoundError):
+        DHash()
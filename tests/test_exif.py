@@ -0,0 +1,76 @@
+import io
+import pickle
+
+from PIL import Image
+import pytest
+
+from dhashpy import DHash, HashCache
+from dhashpy.exif import exif_thumbnail, open_thumbnail
+
+from .images import make_camera_jpeg, make_image
+
+
+@pytest.mark.parametrize("byte_order", ["<", ">"])
+def test_exif_thumbnail(byte_order):
+    data = make_camera_jpeg(make_image(1600, 1200, seed=1), byte_order=byte_order)
+    image = Image.open(io.BytesIO(data))
+    thumbnail = exif_thumbnail(image)
+    assert thumbnail[:2] == b"\xff\xd8"
+    assert Image.open(io.BytesIO(thumbnail)).size == (160, 120)
+    assert open_thumbnail(image, 9, 8).size == (160, 120)
+    # not decoded
+    assert image.tile
+
+    # too small for a 32 x 32 hash
+    assert open_thumbnail(image, 33, 32) is None
+    assert exif_thumbnail(make_image()) is None
+
+
+def test_thumbnail_agrees():
+    for seed in range(8):
+        image = make_image(1600, 1200, seed=seed)
+        data = make_camera_jpeg(image)
+        exact = DHash.from_bytes(data)
+        fast = DHash.from_bytes(data, thumbnail=True)
+        assert exact.source == "image"
+        assert fast.source == "thumbnail"
+        assert fast - exact <= 4
+        assert fast.image.size == (9, 8)
+
+
+def test_fallback(tmp_path):
+    # letterboxed, 3:2 image with a 4:3 thumbnail
+    data = make_camera_jpeg(make_image(1500, 1000, seed=2))
+    dhash = DHash.from_bytes(data, thumbnail=True)
+    assert dhash.source == "image"
+    assert dhash == DHash.from_bytes(data)
+
+    # no EXIF data, or a broken thumbnail
+    plain = io.BytesIO()
+    make_image(seed=3).save(plain, "JPEG")
+    assert DHash.from_bytes(plain.getvalue(), thumbnail=True).source == "image"
+    data = make_camera_jpeg(make_image(1600, 1200, seed=3))
+    thumbnail = exif_thumbnail(Image.open(io.BytesIO(data)))
+    start = data.index(thumbnail) + 2
+    broken = data[:start] + bytes(38) + data[start + 38 :]
+    assert DHash.from_bytes(broken, thumbnail=True).source == "image"
+
+    png = tmp_path / "a.png"
+    make_image().save(str(png))
+    assert DHash(str(png), thumbnail=True).source == "image"
+
+
+def test_cache_and_pickle(tmp_path):
+    path = str(tmp_path / "camera.jpg")
+    with open(path, "wb") as f:
+        f.write(make_camera_jpeg(make_image(1600, 1200, seed=4)))
+    cache = HashCache(str(tmp_path / "cache.sqlite"))
+
+    fast = DHash(path, cache=cache, thumbnail=True)
+    assert fast.source == "thumbnail"
+    assert pickle.loads(pickle.dumps(fast)).source == "thumbnail"
+    # the thumbnail hash is not cached
+    assert DHash(path, cache=cache).source == "image"
+    cached = DHash(path, cache=cache, thumbnail=True)
+    assert cached.source == "cache"
+    assert cached == DHash(path)
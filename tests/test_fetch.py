@@ -0,0 +1,221 @@
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import io
+from socketserver import ThreadingMixIn
+import threading
+import time
+from urllib.error import HTTPError
+
+import pytest
+
+from dhashpy import DHash, URLHasher
+from dhashpy.fetch import _JpegScans
+
+from .images import make_image
+
+
+def encode(image, format="JPEG", **options):
+    buffer = io.BytesIO()
+    image.save(buffer, format, **options)
+    return buffer.getvalue()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(self.path)
+        route = server.routes.get(self.path)
+        if route is None:
+            return self._send(404, b"missing")
+        if "delay" in route:
+            time.sleep(route["delay"])
+        failures = route.get("failures", 0)
+        if failures:
+            route["failures"] = failures - 1
+            return self._send(503, b"busy")
+        if "location" in route:
+            return self._send(302, b"", {"Location": route["location"]})
+        self._send(200, route["body"])
+        if route.get("drop"):
+            # close without telling the client, like an idle timeout
+            self.close_connection = True
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    # http.server.ThreadingHTTPServer is new in Python 3.7
+    daemon_threads = True
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.routes = {}
+    httpd.requests = []
+    httpd.connections = 0
+    httpd.url = "http://127.0.0.1:%d" % httpd.server_address[1]
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_hash_and_keep_alive(server):
+    images = {}
+    for i in range(6):
+        format = "PNG" if i % 2 else "JPEG"
+        data = encode(make_image(seed=i), format)
+        server.routes["/%d.img" % i] = {"body": data}
+        images["/%d.img" % i] = DHash.from_bytes(data)
+
+    with URLHasher(concurrency=1, backoff=0) as hasher:
+        for path, expected in images.items():
+            dhash = hasher.hash(server.url + path)
+            assert dhash == expected
+            assert dhash.path == server.url + path
+        assert hasher.connections == 1
+        assert hasher.requests == 6
+    assert server.connections == 1
+
+
+def test_hash_many(server):
+    urls = []
+    expected = {}
+    for i in range(12):
+        data = encode(make_image(seed=i))
+        server.routes["/%d.jpg" % i] = {"body": data, "delay": 0.01 * (i % 3)}
+        urls.append(server.url + "/%d.jpg" % i)
+        expected[urls[-1]] = DHash.from_bytes(data).hash_int
+    urls.append(server.url + "/missing.jpg")
+
+    with URLHasher(concurrency=4, per_host=2, backoff=0) as hasher:
+        results = list(hasher.hash_many(urls))
+        assert [result.path for result in results] == urls
+        assert hasher.connections <= 2
+        unordered = list(hasher.hash_many(urls, ordered=False))
+    assert sorted(result.path for result in unordered) == sorted(urls)
+    for result in results[:-1]:
+        assert result.ok
+        assert result.record.hash_int == expected[result.path]
+    assert isinstance(results[-1].error, HTTPError)
+    assert results[-1].error.code == 404
+
+
+def test_retries_and_redirects(server):
+    data = encode(make_image(seed=3))
+    server.routes["/flaky.jpg"] = {"body": data, "failures": 2}
+    server.routes["/old.jpg"] = {"location": "/flaky.jpg"}
+
+    with URLHasher(retries=2, backoff=0) as hasher:
+        dhash = hasher.hash(server.url + "/old.jpg")
+        assert hasher.retried == 2
+    assert dhash == DHash.from_bytes(data)
+    assert dhash.path == server.url + "/old.jpg"
+
+    server.routes["/flaky.jpg"]["failures"] = 3
+    with URLHasher(retries=1, backoff=0) as hasher:
+        with pytest.raises(HTTPError) as info:
+            hasher.hash(server.url + "/flaky.jpg")
+    assert info.value.code == 503
+
+    server.requests.clear()
+    with URLHasher(retries=3, backoff=0) as hasher:
+        with pytest.raises(HTTPError):
+            hasher.hash(server.url + "/missing.jpg")
+    assert len(server.requests) == 1
+
+
+def test_timeout(server):
+    server.routes["/slow.jpg"] = {"body": encode(make_image()), "delay": 1}
+    with URLHasher(timeout=0.1, retries=1, backoff=0) as hasher:
+        with pytest.raises(OSError):
+            hasher.hash(server.url + "/slow.jpg")
+        assert hasher.retried == 1
+
+
+def test_stale_connection(server):
+    data = encode(make_image(seed=5))
+    server.routes["/drop.jpg"] = {"body": data, "drop": True}
+    with URLHasher(retries=0) as hasher:
+        for _ in range(3):
+            assert hasher.hash(server.url + "/drop.jpg") == DHash.from_bytes(data)
+        assert hasher.retried == 0
+
+
+def test_errors(server):
+    server.routes["/text"] = {"body": b"not an image"}
+    with URLHasher(retries=2, backoff=0) as hasher:
+        with pytest.raises(OSError):
+            hasher.hash(server.url + "/text")
+        assert hasher.retried == 0
+        with pytest.raises(ValueError):
+            hasher.hash("ftp://example.com/a.jpg")
+    server.routes["/big.png"] = {"body": encode(make_image(), "PNG")}
+    with URLHasher(max_bytes=1000) as hasher:
+        with pytest.raises(ValueError):
+            hasher.hash(server.url + "/big.png")
+    with pytest.raises(ValueError):
+        URLHasher(concurrency=0)
+
+
+def test_progressive_partial_read(server):
+    progressive = encode(make_image(1600, 1200, seed=0), progressive=True, quality=90)
+    baseline = encode(make_image(1600, 1200, seed=0), quality=90)
+    small = encode(make_image(seed=0), progressive=True)
+    server.routes["/progressive.jpg"] = {"body": progressive}
+    server.routes["/baseline.jpg"] = {"body": baseline}
+    server.routes["/small.jpg"] = {"body": small}
+
+    with URLHasher(progressive_scans=1) as hasher:
+        dhash = hasher.hash(server.url + "/progressive.jpg")
+        assert hasher.partial_reads == 1
+        assert hasher.bytes_read < len(progressive) / 2
+        assert dhash - DHash.from_bytes(progressive) <= 3
+
+        before = hasher.bytes_read
+        assert hasher.hash(server.url + "/baseline.jpg") == DHash.from_bytes(baseline)
+        assert hasher.hash(server.url + "/small.jpg") == DHash.from_bytes(small)
+        assert hasher.partial_reads == 1
+        assert hasher.bytes_read - before == len(baseline) + len(small)
+
+    with URLHasher() as hasher:
+        assert hasher.hash(server.url + "/progressive.jpg") == DHash.from_bytes(
+            progressive
+        )
+        assert hasher.partial_reads == 0
+
+
+def test_jpeg_scans_incremental():
+    data = encode(make_image(1600, 1200, seed=1), progressive=True)
+    whole = _JpegScans(2, 0, 0).feed(bytearray(data))
+    assert whole is not None and data[whole] == 0xFF
+    # fed a few bytes at a time, the cut is found at the same offset
+    scans = _JpegScans(2, 0, 0)
+    buffer = bytearray()
+    for start in range(0, len(data), 997):
+        buffer += data[start : start + 997]
+        end = scans.feed(buffer)
+        if end is not None:
+            break
+    assert end == whole
+    assert _JpegScans(1, 0, 0).feed(bytearray(encode(make_image()))) is None
+    assert _JpegScans(1, 0, 0).feed(bytearray(b"\x89PNG....")) is None
@@ -0,0 +1,110 @@
+import io
+
+import pytest
+from PIL import Image
+
+from dhashpy import DHash, DHashRecord, iter_frames, sequence_signature
+
+from .images import make_image
+
+
+def save_sequence(images, format, **kwargs):
+    buffer = io.BytesIO()
+    images[0].save(buffer, format, save_all=True, append_images=images[1:], **kwargs)
+    return buffer.getvalue()
+
+
+def frame(seed, number):
+    # the encoders merge identical frames, mark each frame with a small dot
+    image = make_image(seed=seed)
+    image.putpixel((number, 0), (255, 0, 0))
+    return image
+
+
+@pytest.fixture
+def scenes():
+    # three scenes of 4, 3 and 5 frames
+    counts = {1: 4, 2: 3, 3: 5}
+    return [frame(seed, i) for seed, count in counts.items() for i in range(count)]
+
+
+@pytest.mark.parametrize("format", ["GIF", "TIFF", "WEBP"])
+def test_iter_frames(scenes, format):
+    data = save_sequence(scenes, format, duration=100, lossless=True)
+    frames = list(iter_frames(data))
+    assert [frame.position for frame in frames] == list(range(12))
+
+    image = Image.open(io.BytesIO(data))
+    image.seek(5)
+    assert frames[5].record == DHash.from_image(image.copy())
+
+    unique = list(iter_frames(data, skip_distance=2))
+    assert [frame.position for frame in unique] == [0, 4, 7]
+    assert [frame.position for frame in iter_frames(data, every=5)] == [0, 5, 10]
+    assert [frame.position for frame in iter_frames(data, every=3, max_frames=2)] == [
+        0,
+        3,
+    ]
+
+
+def test_iter_frames_path_and_single_frame(image_file, scenes):
+    path = image_file("single.png")
+    (frame,) = iter_frames(path, height=9)
+    assert frame.position == 0
+    assert frame.record == DHash(path, height=9)
+    assert frame.record.path == path
+
+    with pytest.raises(ValueError):
+        iter_frames(path, every=0)
+    with pytest.raises(ValueError):
+        iter_frames(path, max_frames=0)
+
+
+def test_iter_frames_closes_files(tmp_path, monkeypatch, scenes):
+    path = str(tmp_path / "animated.gif")
+    with open(path, "wb") as f:
+        f.write(save_sequence(scenes, "GIF"))
+    files = []
+    open_image = Image.open
+
+    def spy(*args, **kwargs):
+        image = open_image(*args, **kwargs)
+        files.append(image.fp)
+        return image
+
+    monkeypatch.setattr(Image, "open", spy)
+    assert len(list(iter_frames(path))) == len(scenes)
+    frames = iter_frames(path)
+    next(frames)
+    assert not files[-1].closed
+    frames.close()
+    list(iter_frames(path, max_frames=2))
+    assert len(files) == 3
+    assert all(f.closed for f in files)
+
+    # an image of the caller is left open
+    with open_image(path) as caller:
+        file = caller.fp
+        assert len(list(iter_frames(caller))) == len(scenes)
+        assert not file.closed
+
+
+def test_sequence_signature(scenes):
+    data = save_sequence(scenes, "TIFF")
+    signature = sequence_signature(iter_frames(data))
+    # the majority of the 12 frames, no scene is more than half of them
+    records = [frame.record for frame in iter_frames(data)]
+    for bit in range(64):
+        votes = sum(record.hash_int >> bit & 1 for record in records)
+        assert (signature.hash_int >> bit & 1) == (votes > 6)
+
+    # reordered or resampled copies of the sequence match
+    reversed_data = save_sequence(scenes[::-1], "TIFF")
+    assert sequence_signature(iter_frames(reversed_data)) == signature
+    same = DHashRecord(0xF0F0, 4)
+    assert sequence_signature([same, same]) == same
+
+    with pytest.raises(ValueError):
+        sequence_signature([])
+    with pytest.raises(ValueError):
+        sequence_signature([same, DHashRecord(1, 8)])
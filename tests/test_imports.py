@@ -0,0 +1,118 @@
+import importlib
+import json
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Bound on the cumulative import time of dhashpy, a few times what it takes
+# without NumPy, Pillow and the other modules imported on first use.
+IMPORT_SECONDS = 0.2
+
+# Must not be imported by "import dhashpy".
+HEAVY_MODULES = (
+    "PIL",
+    "numpy",
+    "sqlite3",
+    "asyncio",
+    "http.client",
+    "ssl",
+    "concurrent.futures.process",
+    "multiprocessing.shared_memory",
+)
+
+IMPORT_ONLY = """
+import json, sys
+import dhashpy
+print(json.dumps(sorted(sys.modules)))
+"""
+
+COMPARE_ONLY = """
+import json, sys
+import dhashpy
+from dhashpy import DHash, DHashIndex, DHashRecord, MultiIndex, distances
+
+a, b = "0x6403abcdcd8f8f0e", "0x6403abcdcd8f8f0f"
+results = {
+    "hamming_distance": DHash.hamming_distance(
+        DHash.hex2bin(a, 64), dhashpy.hex2bin(b, 64)
+    ),
+    "bin2hex": DHash.bin2hex(dhashpy.hex2bin(a, 64)),
+    "record": DHashRecord(int(a, 16)) - b,
+    "index": DHashIndex([int(a, 16)], 64).query(b, 1),
+    "distances": distances(a, [b], 64).tolist(),
+    "multiindex": MultiIndex([a], 64).query(b, 1),
+    "unpacked": dhashpy.unpack_hashes(dhashpy.pack_hashes([a], 64))[0].hash_hex,
+}
+results["pil_before"] = sorted(m for m in sys.modules if m.split(".")[0] == "PIL")
+DHash(sys.argv[1])
+results["pil_after"] = "PIL.Image" in sys.modules
+print(json.dumps(results))
+"""
+
+
+def run_python(*args):
+    # -c puts the working directory, the checkout, first in sys.path
+    return subprocess.run(
+        [sys.executable] + list(args),
+        cwd=ROOT,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+
+
+def test_compare_without_pillow(image_file):
+    results = json.loads(run_python("-c", COMPARE_ONLY, image_file()).stdout)
+    assert results == {
+        "hamming_distance": 1,
+        "bin2hex": "0x6403abcdcd8f8f0e",
+        "record": 1,
+        "index": [[1, 0x6403ABCDCD8F8F0E]],
+        "distances": [1],
+        "multiindex": [[1, 0]],
+        "unpacked": "0x6403abcdcd8f8f0e",
+        "pil_before": [],
+        "pil_after": True,
+    }
+
+
+@pytest.mark.skipif(
+    sys.version_info < (3, 7),
+    reason="module __getattr__ is 3.7+, dhashpy imports every module on 3.6",
+)
+def test_import_is_light():
+    modules = json.loads(run_python("-c", IMPORT_ONLY).stdout)
+    assert "dhashpy" in modules
+    assert [module for module in HEAVY_MODULES if module in modules] == []
+    assert not [module for module in modules if module.split(".")[0] == "PIL"]
+
+
+def test_lazy_names():
+    import dhashpy
+
+    for name, module in dhashpy._LAZY.items():
+        assert name in dir(dhashpy)
+        value = getattr(importlib.import_module(module, "dhashpy"), name)
+        assert getattr(dhashpy, name) is value
+    with pytest.raises(AttributeError):
+        dhashpy.missing
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason="-X importtime is 3.7+")
+def test_import_time():
+    stderr = run_python("-X", "importtime", "-c", "import dhashpy").stderr
+    # "import time: self [us] | cumulative | imported package"
+    times = {}
+    for line in stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)", line)
+        if match:
+            times[match.group(4)] = int(match.group(2))
+    assert "dhashpy" in times
+    assert not [module for module in times if module.split(".")[0] == "PIL"]
+    assert times["dhashpy"] < IMPORT_SECONDS * 1e6
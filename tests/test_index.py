@@ -0,0 +1,115 @@
+import random
+
+import pytest
+
+from dhashpy import DHash, DHashIndex, DHashRecord
+
+
+def random_hashes(count, bits=64, seed=0):
+    rng = random.Random(seed)
+    base = [rng.getrandbits(bits) for _ in range(count // 4)]
+    # near duplicates of the base hashes
+    hashes = list(base)
+    while len(hashes) < count:
+        value = rng.choice(base)
+        for _ in range(rng.randrange(6)):
+            value ^= 1 << rng.randrange(bits)
+        hashes.append(value)
+    return hashes
+
+
+def distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+def test_query_and_nearest():
+    hashes = random_hashes(400)
+    index = DHashIndex(bits_in_hash=64)
+    for i, value in enumerate(hashes):
+        index.add(value, i)
+    assert len(index) == 400
+
+    rng = random.Random(1)
+    for query in rng.sample(hashes, 20) + [rng.getrandbits(64) for _ in range(5)]:
+        for max_distance in (0, 3, 10):
+            expected = sorted(
+                (distance(query, value), i)
+                for i, value in enumerate(hashes)
+                if distance(query, value) <= max_distance
+            )
+            assert sorted(index.query(query, max_distance)) == expected
+
+        nearest = index.nearest(query, k=5)
+        brute = sorted(distance(query, value) for value in hashes)[:5]
+        assert [d for d, _ in nearest] == brute
+        assert all(distance(query, hashes[i]) == d for d, i in nearest)
+
+    assert index.nearest(hashes[0], k=0) == []
+    assert DHashIndex().nearest(0) == []
+    assert DHashIndex().query(0, 5) == []
+
+
+def test_remove():
+    index = DHashIndex(bits_in_hash=16)
+    index.add(0x00FF, "a")
+    index.add(0x00FF, "b")
+    index.add(0x0FFF, "c")
+    assert 0x00FF in index
+    index.remove(0x00FF, "a")
+    assert index.query(0x00FF, 0) == [(0, "b")]
+    index.remove("0x00ff")
+    assert 0x00FF not in index
+    assert len(index) == 1
+    # removed nodes still route the queries
+    assert index.query(0x00FF, 4) == [(4, "c")]
+    assert sorted(index) == [(0x0FFF, "c")]
+
+    with pytest.raises(KeyError):
+        index.remove(0x00FF)
+    with pytest.raises(KeyError):
+        index.remove(0x0FFF, "x")
+
+
+def test_inputs(image_file):
+    dhash = DHash(image_file(seed=5))
+    record = dhash.to_record()
+    index = DHashIndex([dhash])
+    assert index.bits_in_hash == 64
+    index.add(dhash.hash_hex, "hex")
+    index.add(dhash.hash, "bin")
+    index.add(record)
+    values = [value for _, value in index.query(record, 0)]
+    assert values[0] is dhash
+    assert set(values[1:3]) == {"hex", "bin"}
+    assert values[3] is record
+    assert index.nearest(dhash.hash_hex)[0][0] == 0
+
+    with pytest.raises(ValueError):
+        index.add(DHash(image_file(seed=5), height=4))
+    with pytest.raises(ValueError):
+        index.add("0b0101")
+    with pytest.raises(ValueError):
+        index.query(1 << 64, 2)
+    with pytest.raises(ValueError):
+        index.add(-1)
+    with pytest.raises(TypeError):
+        index.add(1.5)
+    with pytest.raises(TypeError):
+        index.add("abcd")
+
+    # bits are taken from the first hash that tells them
+    index = DHashIndex([0xFFFF])
+    assert index.bits_in_hash is None
+    with pytest.raises(ValueError):
+        index.add(DHashRecord(0, height=2))
+    index.add(DHashRecord(0, height=4))
+    assert index.bits_in_hash == 16
+
+    # queries check the bits, they do not fix them
+    index = DHashIndex()
+    assert index.query("0b0101", 1) == []
+    assert index.nearest(DHashRecord(0, height=2)) == []
+    assert "0b01" not in index
+    assert index.bits_in_hash is None
+    index.add(DHashRecord(0, height=4))
+    assert index.bits_in_hash == 16
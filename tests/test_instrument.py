@@ -0,0 +1,82 @@
+import io
+import json
+import os
+
+import pytest
+from PIL import UnidentifiedImageError
+
+from dhashpy import DHash, HashCache, HashStats, add_hook, remove_hook
+from dhashpy.instrument import STAGES
+
+from .images import make_image
+
+
+def test_hook_event(image_file):
+    path = image_file("image.png", width=200, height=100, mode="RGBA")
+    events = []
+    dhash = DHash(path, hook=events.append)
+    assert dhash == DHash(path)
+
+    (event,) = events
+    assert event.path == path
+    assert event.format == "PNG"
+    assert event.mode == "RGBA"
+    assert event.size == (200, 100)
+    assert event.pixels == 20000
+    assert event.bytes == os.path.getsize(path)
+    assert list(event.stages) == list(STAGES)
+    assert event.total == pytest.approx(sum(event.stages.values()))
+    assert event.error is None and not event.cached
+    assert "PNG" in repr(event)
+
+    buffer = io.BytesIO()
+    make_image(seed=3).save(buffer, "JPEG")
+    DHash.from_bytes(buffer.getvalue(), fast=True, hook=events.append)
+    assert events[-1].format == "JPEG"
+    assert events[-1].bytes == len(buffer.getvalue())
+    DHash.from_image(make_image(mode="P"), hook=events.append)
+    assert events[-1].format is None and events[-1].mode == "P"
+    assert events[-1].bytes is None
+
+
+def test_global_hook_and_stats(image_file, tmp_path):
+    stats = HashStats(flag_pixels=50000, flag_seconds=None)
+    add_hook(stats)
+    try:
+        small = image_file("small.png", width=100, height=100)
+        large = image_file("large.jpg", width=400, height=300)
+        DHash(small)
+        DHash(large)
+        with pytest.raises(UnidentifiedImageError):
+            DHash.from_bytes(b"not an image", path="broken")
+        with pytest.raises(FileNotFoundError):
+            DHash(str(tmp_path / "missing.png"))
+
+        cache = HashCache(str(tmp_path / "cache.sqlite"))
+        DHash(small, cache=cache)
+        DHash(small, cache=cache)
+        cache.close()
+    finally:
+        remove_hook(stats)
+    DHash(small)
+
+    result = stats.as_dict()
+    json.dumps(result)
+    assert result["count"] == 6
+    assert result["errors"] == 2
+    assert result["error_types"] == {
+        "UnidentifiedImageError": 1,
+        "FileNotFoundError": 1,
+    }
+    assert result["cached"] == 1
+    assert result["formats"] == {"PNG": 2, "JPEG": 1}
+    assert result["modes"] == {"RGB": 3}
+    assert result["max_pixels"] == 120000
+    assert result["bytes_read"] == 2 * os.path.getsize(small) + os.path.getsize(large)
+    assert result["flagged"] == [[large, "120000 pixels"]]
+    assert all(result["stage_seconds"][stage] > 0 for stage in STAGES)
+
+    stats.reset()
+    assert stats.as_dict()["count"] == 0
+    with pytest.raises(ValueError):
+        remove_hook(stats)
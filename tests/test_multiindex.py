@@ -0,0 +1,118 @@
+import random
+
+import pytest
+
+from dhashpy import DHash, MultiIndex, pack_hashes, pack_words, vectorized
+from dhashpy.multiindex import default_substrings
+
+from .images import make_image
+
+
+def distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+@pytest.fixture(autouse=True)
+def require_numpy():
+    if vectorized.numpy is None:
+        pytest.skip("NumPy is not installed")
+
+
+def near_hashes(bits, count, seed):
+    # clusters of hashes a few bits apart, so that the queries find some
+    rng = random.Random(seed)
+    hashes = []
+    for _ in range(count // 10):
+        center = rng.getrandbits(bits)
+        hashes.append(center)
+        for _ in range(9):
+            flips = rng.sample(range(bits), rng.randint(1, min(bits, 10)))
+            hashes.append(center ^ sum(1 << bit for bit in flips))
+    return hashes
+
+
+@pytest.mark.parametrize("height", [3, 8, 9, 16])
+@pytest.mark.parametrize("substrings", [None, 5])
+def test_query(height, substrings):
+    bits = height * height
+    hashes = near_hashes(bits, 2000, height)
+    ids = ["image_%d.jpg" % i for i in range(len(hashes))]
+    index = MultiIndex(hashes, bits, ids=ids, substrings=substrings)
+    assert len(index) == 2000
+    assert index.hash_int(7) == hashes[7]
+    assert index.id(7) == "image_7.jpg"
+    assert sum(length for _, length in index.substrings) == bits
+    assert all(length <= 64 for _, length in index.substrings)
+
+    for query in (hashes[0], hashes[55] ^ 0b101, hashes[1000] ^ (1 << (bits - 1))):
+        for max_distance in (0, 1, 4, 8, bits):
+            expected = sorted(
+                (distance(query, h), ids[i])
+                for i, h in enumerate(hashes)
+                if distance(query, h) <= max_distance
+            )
+            assert sorted(index.query(query, max_distance)) == expected
+            result = index.search(query, max_distance)
+            assert list(result.distances) == sorted(result.distances)
+            assert len(result.positions) <= result.verified <= result.candidates
+            assert result.verified <= len(index)
+
+
+def test_counts():
+    bits = 64
+    rng = random.Random(1)
+    hashes = [rng.getrandbits(bits) for _ in range(20000)]
+    index = MultiIndex(pack_words(hashes, bits), bits)
+    assert len(index.substrings) == default_substrings(bits, 20000) == 4
+
+    result = index.search(hashes[3] ^ 0b111, 6)
+    assert list(result.positions) == [3]
+    assert list(result.distances) == [3]
+    assert 0 < result.probes < len(index)
+    # far fewer hashes verified than a linear scan
+    assert result.verified < len(index) // 100
+
+    # more lookups than hashes, every hash is scanned
+    result = index.search(hashes[3], 40)
+    assert result.probes == 0
+    assert result.verified == result.candidates == len(index)
+
+
+@pytest.mark.parametrize("height", [3, 8, 9])
+def test_from_packed(height):
+    dhashes = [DHash.from_image(make_image(seed=seed), height) for seed in range(30)]
+    paths = ["%d.png" % seed for seed in range(30)]
+    index = MultiIndex.from_packed(pack_hashes(dhashes), height, ids=paths)
+    assert index.bits_in_hash == height * height
+    assert [index.hash_int(i) for i in range(30)] == [d.hash_int for d in dhashes]
+    assert index.query(dhashes[4], 0)[0] == (0, "4.png")
+
+
+def test_errors():
+    with pytest.raises(ValueError):
+        MultiIndex([1, 2, 3])
+    with pytest.raises(ValueError):
+        MultiIndex(pack_words([1, 2, 3], 64))
+    with pytest.raises(ValueError):
+        MultiIndex([1, 2, 3], 64, ids=["a"])
+    with pytest.raises(ValueError):
+        # 256 bits in 3 substrings of more than 64 bits
+        MultiIndex([1, 2, 3], 256, substrings=3)
+    with pytest.raises(ValueError):
+        MultiIndex.from_packed(b"\x00" * 9, 8)
+
+    index = MultiIndex([], 64)
+    assert index.query(0, 4) == []
+    index = MultiIndex([1, 2, 3], 64)
+    with pytest.raises(ValueError):
+        index.query(1 << 64, 4)
+    with pytest.raises(ValueError):
+        index.search(1, -1)
+    with pytest.raises(IndexError):
+        index.hash_int(3)
+
+
+def test_requires_numpy(monkeypatch):
+    monkeypatch.setattr(vectorized, "numpy", None)
+    with pytest.raises(ImportError):
+        MultiIndex([1, 2, 3], 64)
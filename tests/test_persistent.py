@@ -0,0 +1,168 @@
+import os
+import random
+
+import pytest
+
+from dhashpy import DHashRecord, PersistentIndex, vectorized
+
+
+def distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+def brute_force(entries, query, max_distance):
+    return sorted(
+        (distance(query, h), id)
+        for id, h in entries.items()
+        if distance(query, h) <= max_distance
+    )
+
+
+def check(index, entries, rng):
+    assert dict(index) == entries
+    for _ in range(5):
+        query = rng.getrandbits(64)
+        assert sorted(index.query(query, 24)) == brute_force(entries, query, 24)
+        nearest = index.nearest(query, 5)
+        expected = sorted(distance(query, h) for h in entries.values())[:5]
+        assert [d for d, _ in nearest] == expected
+
+
+def test_add_delete_compact_reopen(tmp_path):
+    directory = str(tmp_path / "index")
+    rng = random.Random(0)
+    entries = {}
+    with PersistentIndex(directory, bits_in_hash=64) as index:
+        for i in range(300):
+            entries["img_%d" % i] = rng.getrandbits(64)
+            index.add(entries["img_%d" % i], "img_%d" % i)
+        index.delete("img_3")
+        del entries["img_3"]
+        index.delete("missing")
+        check(index, entries, rng)
+        assert index.log_records == 302
+
+        index.compact()
+        assert index.generation == 1 and index.log_records == 0
+        check(index, entries, rng)
+
+        # changes on top of the base, replacing and deleting base entries
+        entries["img_5"] = rng.getrandbits(64)
+        index.add(DHashRecord(entries["img_5"]), "img_5")
+        index.delete("img_6")
+        del entries["img_6"]
+        entries["new"] = entries["img_7"] ^ 1
+        index.add(hex(entries["new"]), "new")
+        check(index, entries, rng)
+        assert index.query(entries["img_7"], 1) == [(0, "img_7"), (1, "new")]
+
+    with PersistentIndex(directory) as index:
+        assert index.bits_in_hash == 64 and index.log_records == 3
+        check(index, entries, rng)
+        index.compact()
+    assert sorted(os.listdir(directory)) == [
+        "CURRENT",
+        "base-00000002.dhst",
+        "log-00000002.log",
+    ]
+    with PersistentIndex(directory) as index:
+        check(index, entries, rng)
+
+    with pytest.raises(ValueError):
+        PersistentIndex(directory, bits_in_hash=16)
+    with pytest.raises(ValueError):
+        PersistentIndex(str(tmp_path / "new"))
+
+
+def delete_closest_and_compact(directory):
+    """Check nearest() with deleted base entries, return the compacted base."""
+    rng = random.Random(1)
+    entries = {"img_%d" % i: rng.getrandbits(64) for i in range(500)}
+    with PersistentIndex(directory, bits_in_hash=64) as index:
+        for id, hash_int in entries.items():
+            index.add(hash_int, id)
+        index.compact()
+
+        # delete the base entries closest to the query
+        query = entries["img_0"]
+        closest = sorted(entries, key=lambda id: distance(query, entries[id]))
+        for id in closest[:100]:
+            index.delete(id)
+            del entries[id]
+        entries["new"] = query ^ 0b1111
+        index.add(entries["new"], "new")
+        expected = sorted(distance(query, h) for h in entries.values())[:10]
+        assert [d for d, _ in index.nearest(query, 10)] == expected
+        assert index.nearest(query, 1) == [(4, "new")]
+
+        index.compact()
+        check(index, entries, rng)
+    with open(os.path.join(directory, "base-00000002.dhst"), "rb") as f:
+        return f.read()
+
+
+def test_deleted_nearest_and_compaction(tmp_path, monkeypatch):
+    if vectorized.numpy is None:
+        pytest.skip("NumPy is not installed")
+    packed = delete_closest_and_compact(str(tmp_path / "numpy"))
+    monkeypatch.setattr(vectorized, "numpy", None)
+    looped = delete_closest_and_compact(str(tmp_path / "python"))
+    # the vectorized compaction writes the same file as the python loop
+    assert packed == looped
+
+
+def test_crash_recovery(tmp_path):
+    directory = str(tmp_path / "index")
+    with PersistentIndex(directory, bits_in_hash=16) as index:
+        index.add(0x00FF, "a")
+        index.add(0x0F0F, "b")
+    log = os.path.join(directory, "log-00000000.log")
+    size = os.path.getsize(log)
+
+    # a record cut short, as by a crash in the middle of a write
+    with open(log, "ab") as f:
+        f.write(b"\x01\x02\x03\x04\x01\x05\x00")
+    # an interrupted compaction
+    with open(os.path.join(directory, "base-00000001.dhst.tmp"), "wb") as f:
+        f.write(b"partial")
+
+    with PersistentIndex(directory) as index:
+        assert dict(index) == {"a": 0x00FF, "b": 0x0F0F}
+        assert os.path.getsize(log) == size
+        assert os.listdir(directory).count("base-00000001.dhst.tmp") == 0
+        index.add(0xFFFF, "c")
+    with PersistentIndex(directory) as index:
+        assert dict(index) == {"a": 0x00FF, "b": 0x0F0F, "c": 0xFFFF}
+
+    # a corrupted record and everything after it are dropped
+    with open(log, "r+b") as f:
+        f.seek(size - 1)
+        f.write(b"\xff")
+    with PersistentIndex(directory) as index:
+        assert dict(index) == {"a": 0x00FF}
+
+
+def test_background_compaction(tmp_path):
+    rng = random.Random(1)
+    entries = {"img_%d" % i: rng.getrandbits(64) for i in range(2000)}
+    index = PersistentIndex(str(tmp_path / "index"), bits_in_hash=64, sync=True)
+    for id, h in entries.items():
+        index.add(h, id)
+    thread = index.compact(background=True)
+    with pytest.raises(RuntimeError):
+        index.compact()
+    # writes and queries while the new base is written
+    for i in range(50):
+        entries["late_%d" % i] = rng.getrandbits(64)
+        index.add(entries["late_%d" % i], "late_%d" % i)
+        index.delete("img_%d" % i)
+        del entries["img_%d" % i]
+        assert index.query(entries["img_100"], 0) == [(0, "img_100")]
+    thread.join()
+    assert index.generation == 1
+    # the writes made after the snapshot stay in the new log
+    assert index.log_records <= 100
+    check(index, entries, rng)
+    index.close()
+    with pytest.raises(ValueError):
+        index.add(1, "closed")
@@ -0,0 +1,53 @@
+import os
+
+from dhashpy import DHash, scan
+from dhashpy.scanner import iter_files
+
+from .images import make_image
+
+
+def make_tree(root):
+    expected = {}
+    for i, name in enumerate(["a.png", "sub/b.jpg", "sub/deeper/c.PNG", "d.webp"]):
+        path = os.path.join(root, *name.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        make_image(seed=i).save(path, format="PNG" if name.endswith("PNG") else None)
+        expected[path] = DHash(path)
+    with open(os.path.join(root, "notes.txt"), "w") as f:
+        f.write("not an image")
+    broken = os.path.join(root, "sub", "broken.jpg")
+    with open(broken, "wb") as f:
+        f.write(b"not an image either")
+    return expected, broken
+
+
+def test_scan(tmp_path):
+    root = str(tmp_path)
+    expected, broken = make_tree(root)
+
+    for workers in (0, 2):
+        errors = []
+        results = dict(
+            scan(root, workers=workers, io_workers=2, on_error=errors.append)
+        )
+        assert set(results) == set(expected)
+        for path, record in results.items():
+            assert record == expected[path]
+            assert record.path == path
+        assert [error.path for error in errors] == [broken]
+        assert errors[0].error is not None
+
+    assert sorted(iter_files(root, ["*.txt"])) == [os.path.join(root, "notes.txt")]
+
+    errors = []
+    assert list(scan(os.path.join(root, "missing"), on_error=errors.append)) == []
+    assert isinstance(errors[0].error, FileNotFoundError)
+
+
+def test_scan_stops_early(tmp_path):
+    root = str(tmp_path)
+    make_tree(root)
+    results = scan(root, height=4, workers=1, io_workers=1, max_pending=1)
+    path, record = next(results)
+    assert record.bits_in_hash == 16
+    results.close()
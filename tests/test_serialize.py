@@ -0,0 +1,96 @@
+import pickle
+import random
+
+import pytest
+
+from dhashpy import DHash, DHashRecord, pack_hashes, unpack_hashes, vectorized
+from dhashpy.serialize import hash_size, unpack_ints
+
+from .images import make_image
+
+
+@pytest.fixture(params=["numpy", "python"])
+def mode(request, monkeypatch):
+    if request.param == "python":
+        monkeypatch.setattr(vectorized, "numpy", None)
+    elif vectorized.numpy is None:
+        pytest.skip("NumPy is not installed")
+    return request.param
+
+
+@pytest.mark.parametrize("height", [2, 4, 5, 8, 9, 16])
+def test_to_bytes_round_trip(height):
+    rng = random.Random(height)
+    for _ in range(50):
+        record = DHashRecord(rng.getrandbits(height * height), height, "a.jpg")
+        data = record.to_bytes()
+        assert len(data) == hash_size(height)
+        copy = DHashRecord.from_bytes(data, height, "a.jpg")
+        assert copy == record
+        assert copy.hash_int == record.hash_int
+    assert DHashRecord(1 << 63).to_bytes() == b"\x80" + b"\x00" * 7
+
+
+def test_from_bytes_errors():
+    with pytest.raises(ValueError):
+        DHashRecord.from_bytes(b"\x00" * 7)
+    with pytest.raises(ValueError):
+        # 25 bits hash in 4 bytes, the top 7 bits must be clear
+        DHashRecord.from_bytes(b"\xff" * 4, height=5)
+
+
+def test_pickle_dhash():
+    dhash = DHash.from_image(make_image(seed=1), path="one.png")
+    assert dhash.image is not None
+    copy = pickle.loads(pickle.dumps(dhash))
+    assert type(copy) is DHash
+    assert copy.image is None
+    assert copy.hash_int == dhash.hash_int
+    assert copy.height == dhash.height and copy.path == "one.png"
+    assert copy.fast is False
+    assert copy - dhash == 0
+    assert len(pickle.dumps(dhash)) < 150
+
+
+def test_pickle_record():
+    record = DHashRecord(12345, 8, "a/b.jpg")
+    data = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+    copy = pickle.loads(data)
+    assert (copy.hash_int, copy.height, copy.path) == (12345, 8, "a/b.jpg")
+    assert len(data) < 100
+
+
+@pytest.mark.parametrize("height", [4, 5, 8, 9, 16])
+def test_pack_unpack(mode, height):
+    bits = height * height
+    rng = random.Random(bits)
+    values = [rng.getrandbits(bits) for _ in range(300)]
+    records = [DHashRecord(value, height) for value in values]
+
+    data = pack_hashes(records)
+    assert len(data) == len(values) * hash_size(height)
+    assert data == b"".join(record.to_bytes() for record in records)
+    assert pack_hashes([record.hash_hex for record in records], bits) == data
+    assert pack_hashes(values, bits) == data
+
+    assert unpack_ints(data, height) == values
+    assert unpack_ints(memoryview(bytearray(data)), height) == values
+    paths = ["%d.png" % i for i in range(len(values))]
+    unpacked = unpack_hashes(data, height, paths)
+    assert [record.hash_int for record in unpacked] == values
+    assert [record.path for record in unpacked] == paths
+
+
+def test_pack_errors(mode):
+    assert pack_hashes([]) == b""
+    assert unpack_hashes(b"") == []
+    with pytest.raises(ValueError):
+        pack_hashes([1, 2])
+    with pytest.raises(ValueError):
+        pack_hashes([DHashRecord(1, 8), DHashRecord(1, 4)])
+    with pytest.raises(ValueError):
+        unpack_hashes(b"\x00" * 9)
+    with pytest.raises(ValueError):
+        unpack_hashes(b"\x00" * 16, paths=["only one"])
+    with pytest.raises(ValueError):
+        unpack_hashes(b"\xff" * 8, height=5)
@@ -0,0 +1,96 @@
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+
+import pytest
+
+from dhashpy import HashStore, SharedHashStore, vectorized
+
+pytestmark = pytest.mark.skipif(
+    sys.version_info < (3, 8), reason="multiprocessing.shared_memory is 3.8+"
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def random_hashes(count, bits=64, seed=0):
+    rng = random.Random(seed)
+    return [rng.getrandbits(bits) for _ in range(count)]
+
+
+def worker_query(name, query, max_distance):
+    store = SharedHashStore.attach(name)
+    try:
+        return os.getpid(), store.query(query, max_distance), store.nearest(query, 3)
+    finally:
+        store.detach()
+
+
+@pytest.mark.parametrize("bits", [64, 81])
+def test_create_attach_query(tmp_path, bits):
+    hashes = random_hashes(1000, bits)
+    ids = ["image_%d.jpg" % i for i in range(len(hashes))]
+    shared = SharedHashStore.create(hashes, ids, bits_in_hash=bits)
+    try:
+        local = HashStore.build(str(tmp_path / "local.dhst"), hashes, ids, bits)
+        assert len(shared) == 1000 and shared.owner
+        assert shared.bits_in_hash == bits
+        assert list(shared) == hashes
+        assert shared.id(10) == "image_10.jpg"
+        query = hashes[42] ^ 0b111
+        assert shared.query(query, 5) == local.query(query, 5)
+        assert list(shared.distances(query)) == list(local.distances(query))
+
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(3) as pool:
+            results = pool.starmap(
+                worker_query, [(shared.name, query, 5)] * 6, chunksize=1
+            )
+        assert {result[1][0] for result in results} == {(3, "image_42.jpg")}
+        assert all(result[2] == local.nearest(query, 3) for result in results)
+        local.close()
+
+        # an unrelated process attaches by name, its exit keeps the segment
+        code = (
+            "import sys; sys.path.insert(0, %r); from dhashpy import SharedHashStore;"
+            "s = SharedHashStore.attach(%r); print(s.query(%d, 3)[0][1]); s.detach()"
+            % (ROOT, shared.name, query)
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            check=True,
+        )
+        assert output.stdout.strip() == "image_42.jpg"
+        assert output.stderr == ""
+        attached = SharedHashStore.attach(shared.name)
+        assert not attached.owner and attached.hash_int(5) == hashes[5]
+        attached.detach()
+        attached.detach()
+    finally:
+        shared.detach()
+        shared.unlink()
+    with pytest.raises(FileNotFoundError):
+        SharedHashStore.attach(shared.name)
+
+
+def test_python_scan_and_errors(monkeypatch):
+    monkeypatch.setattr(vectorized, "numpy", None)
+    with SharedHashStore.create(["0x0f", "0xff"], bits_in_hash=8) as shared:
+        assert not shared.has_ids
+        assert shared.query(0, 4) == [(4, 0)]
+        assert list(shared.distances(0xFF)) == [4, 0]
+        shared.unlink()
+
+    with pytest.raises(ValueError):
+        SharedHashStore.create([1, 2])
+    with pytest.raises(ValueError):
+        SharedHashStore.create([1, 2], ["a"], bits_in_hash=8)
+    empty = SharedHashStore.create([], bits_in_hash=64)
+    assert len(empty) == 0 and empty.nearest(0) == []
+    empty.close()
+    empty.unlink()
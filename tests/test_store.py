@@ -0,0 +1,158 @@
+import os
+import random
+
+import pytest
+
+from dhashpy import DHash, HashStore, HashStoreWriter, pack_words, vectorized
+
+
+def distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+@pytest.fixture(params=["numpy", "python"])
+def scan_mode(request, monkeypatch):
+    if request.param == "python":
+        monkeypatch.setattr(vectorized, "numpy", None)
+    elif vectorized.numpy is None:
+        pytest.skip("NumPy is not installed")
+    return request.param
+
+
+@pytest.mark.parametrize("height", [3, 8, 9, 16])
+def test_store(tmp_path, scan_mode, height):
+    bits = height * height
+    rng = random.Random(height)
+    hashes = [rng.getrandbits(bits) for _ in range(300)]
+    ids = ["image_%d.jpg" % i for i in range(len(hashes))]
+    path = str(tmp_path / "hashes.dhst")
+
+    with HashStore.build(path, hashes, ids, bits_in_hash=bits) as store:
+        assert len(store) == 300
+        assert store.bits_in_hash == bits
+        assert store.has_ids
+        assert list(store) == hashes
+        assert store.id(7) == "image_7.jpg"
+
+        query = hashes[5] ^ 0b101
+        assert list(store.distances(query)) == [distance(query, h) for h in hashes]
+        for max_distance in (0, 2, bits // 2):
+            expected = sorted(
+                (distance(query, h), ids[i])
+                for i, h in enumerate(hashes)
+                if distance(query, h) <= max_distance
+            )
+            assert sorted(store.query(query, max_distance)) == expected
+        assert (2, "image_5.jpg") in store.query(query, 2)
+        nearest = store.nearest(query, k=4)
+        assert [d for d, _ in nearest] == sorted(distance(query, h) for h in hashes)[:4]
+        assert store.nearest(query, k=0) == []
+        assert len(store.nearest(query, k=1000)) == 300
+
+        with pytest.raises(ValueError):
+            store.distances(1 << bits)
+        with pytest.raises(IndexError):
+            store.hash_int(300)
+
+
+def test_writer(tmp_path, image_file):
+    dhashes = [DHash(image_file("%d.png" % seed, seed=seed)) for seed in range(3)]
+    path = str(tmp_path / "hashes.dhst")
+    with HashStoreWriter(path) as writer:
+        writer.add(dhashes[0])
+        writer.add(dhashes[1].hash_hex)
+        writer.add(dhashes[2].hash)
+        with pytest.raises(ValueError):
+            writer.add(DHash(dhashes[0].path, height=4))
+
+    with HashStore(path) as store:
+        assert not store.has_ids
+        assert list(store) == [dhash.hash_int for dhash in dhashes]
+        assert store.query(dhashes[1], 0) == [(0, 1)]
+        assert store.id(2) == 2
+
+    # the number of bits must be known before the first integer hash
+    with pytest.raises(ValueError):
+        with HashStoreWriter(str(tmp_path / "other.dhst")) as writer:
+            writer.add(0xFF)
+
+    with pytest.raises(ValueError):
+        with HashStoreWriter(str(tmp_path / "ids.dhst"), 64, with_ids=True) as writer:
+            writer.add(0xFF)
+    # a failed with block leaves no file that looks complete
+    assert not os.path.exists(str(tmp_path / "ids.dhst"))
+    assert not os.path.exists(str(tmp_path / "ids.dhst.ids.tmp"))
+
+    for ids in (["a"], ["a", "b", "c"]):
+        with pytest.raises(ValueError):
+            HashStore.build(str(tmp_path / "short.dhst"), [1, 2], ids, 64)
+        assert not os.path.exists(str(tmp_path / "short.dhst"))
+
+    empty = HashStore.build(str(tmp_path / "empty.dhst"), [], bits_in_hash=64)
+    assert len(empty) == 0
+    assert empty.query(0, 64) == []
+    assert empty.nearest(0) == []
+    empty.close()
+
+    not_a_store = tmp_path / "not_a_store"
+    not_a_store.write_bytes(b"x" * 64)
+    with pytest.raises(ValueError):
+        HashStore(str(not_a_store))
+
+
+@pytest.mark.parametrize("height", [3, 8, 9])
+def test_nearest_exclude(tmp_path, scan_mode, height):
+    bits = height * height
+    rng = random.Random(height)
+    hashes = [rng.getrandbits(bits) for _ in range(200)]
+    # ties at every distance
+    hashes += hashes[:50]
+    ids = ["image_%d.jpg" % i for i in range(len(hashes))]
+    path = str(tmp_path / "hashes.dhst")
+    with HashStore.build(path, hashes, ids, bits_in_hash=bits) as store:
+        query = hashes[5] ^ 0b11
+        by_distance = sorted((distance(query, h), ids[i]) for i, h in enumerate(hashes))
+        # the closest ids are excluded, the next ones take their place
+        for skipped in (1, 3, 40, 240):
+            exclude = {id for _, id in by_distance[:skipped]}
+            for k in (1, 5, 30):
+                nearest = store.nearest(query, k, exclude=exclude)
+                expected = [d for d, id in by_distance if id not in exclude][:k]
+                assert [d for d, _ in nearest] == expected
+                assert not exclude & {id for _, id in nearest}
+        everything = set(ids)
+        assert store.nearest(query, 5, exclude=everything) == []
+
+
+def test_add_words(tmp_path):
+    if vectorized.numpy is None:
+        pytest.skip("NumPy is not installed")
+    for bits in (9, 64, 81, 256):
+        rng = random.Random(bits)
+        hashes = [rng.getrandbits(bits) for _ in range(50)]
+        ids = ["é_%d" % i for i in range(50)]
+        one_by_one = str(tmp_path / "one_by_one.dhst")
+        packed = str(tmp_path / "packed.dhst")
+        HashStore.build(one_by_one, hashes, ids, bits).close()
+        words = pack_words(hashes, bits)
+        with HashStoreWriter(packed, bits, with_ids=True) as writer:
+            writer.add_words(words[:20], ids[:20])
+            writer.add_words(words[20:], ids[20:])
+        with open(one_by_one, "rb") as a, open(packed, "rb") as b:
+            assert a.read() == b.read()
+        with HashStore.build(packed, words, ids, bits) as store:
+            assert list(store) == hashes
+            assert store._id_list() == ids
+
+    words = pack_words([1, 2], 64)
+    with pytest.raises(ValueError):
+        # bits_in_hash is unknown
+        HashStore.build(str(tmp_path / "error.dhst"), words)
+    with pytest.raises(ValueError):
+        HashStore.build(str(tmp_path / "error.dhst"), words, bits_in_hash=128)
+    with pytest.raises(ValueError):
+        HashStore.build(str(tmp_path / "error.dhst"), words, ["a"], 64)
+    with pytest.raises(ValueError):
+        with HashStoreWriter(str(tmp_path / "error.dhst"), 64, True) as writer:
+            writer.add_words(words)
+    assert not os.path.exists(str(tmp_path / "error.dhst"))
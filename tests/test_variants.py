@@ -0,0 +1,78 @@
+import io
+
+import pytest
+from PIL import Image
+
+from dhashpy import DHash, hash_variants
+
+from .images import make_image
+
+
+def test_variants_match_dhash(image_file):
+    path = image_file("image.jpg", width=640, height=480, seed=4)
+    variants = hash_variants(path, heights=(16, 8), directions=("row", "column"))
+    assert sorted(variants) == [("column", 8), ("column", 16), ("row", 8), ("row", 16)]
+    for height in (8, 16):
+        assert variants["row", height] == DHash(path, height)
+        assert variants["row", height].path == path
+        assert variants["column", height].bits_in_hash == height * height
+
+    # the column hash is the row hash of the transposed image
+    transposed = Image.open(path).transpose(Image.TRANSPOSE)
+    assert variants["column", 8].hash_int == DHash.from_image(transposed).hash_int
+    assert variants["column", 8] != variants["row", 8]
+
+
+def test_variants_sources_and_fast(image_file):
+    image = make_image(800, 600, seed=5)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG")
+    data = buffer.getvalue()
+
+    expected = hash_variants(image, heights=(8,))
+    assert hash_variants(data, path="a.jpg")["row", 8].path == "a.jpg"
+    assert hash_variants(bytearray(data))["row", 8] - expected["row", 8] <= 2
+    assert hash_variants(io.BytesIO(data))["row", 8] - expected["row", 8] <= 2
+    fast = DHash.hash_variants(data, heights=(8, 16), fast=True)
+    assert fast["row", 8] - DHash.from_bytes(data, fast=True) <= 2
+
+    with pytest.raises(ValueError):
+        hash_variants(image, directions=("diagonal",))
+    with pytest.raises(ValueError):
+        hash_variants(image, heights=())
+
+
+def test_fast_keeps_caller_image(image_file):
+    path = image_file("large.jpg", width=2048, height=1536, seed=21)
+    with Image.open(path) as image:
+        fast = hash_variants(image, heights=(8,), fast=True)
+        # draft() is not used on images of the caller
+        assert (image.mode, image.size) == ("RGB", (2048, 1536))
+    # decoded at full size and reduced, like fast mode PNG images
+    assert fast["row", 8] - DHash(path) <= 4
+
+
+@pytest.mark.parametrize("fast", [False, True])
+def test_closes_opened_files(tmp_path, monkeypatch, fast):
+    # load() leaves the file of a multi-frame image open
+    path = str(tmp_path / "animated.gif")
+    frames = [make_image(seed=seed).convert("P") for seed in (22, 23)]
+    frames[0].save(path, save_all=True, append_images=frames[1:])
+    files = []
+    open_image = Image.open
+
+    def spy(*args, **kwargs):
+        image = open_image(*args, **kwargs)
+        files.append(image.fp)
+        return image
+
+    monkeypatch.setattr(Image, "open", spy)
+    hash_variants(path, heights=(8, 16), fast=fast)
+    assert len(files) == 1
+    assert files[0].closed
+
+    # an image of the caller is left open
+    with open_image(path) as caller:
+        file = caller.fp
+        hash_variants(caller, fast=fast)
+        assert not file.closed
@@ -0,0 +1,39 @@
+import pytest
+
+from dhashpy import DHash, hash_array, hash_array_batch
+
+numpy = pytest.importorskip("numpy")
+
+
+@pytest.mark.parametrize("height", [2, 3, 5, 8, 9, 16, 32])
+def test_hash_array(height):
+    rng = numpy.random.default_rng(height)
+    stack = rng.integers(0, 256, (5, height, height + 1), dtype=numpy.uint8)
+    expected = [
+        DHash._pixels_to_int(pixels.tobytes(), height + 1, height) for pixels in stack
+    ]
+    assert [hash_array(pixels) for pixels in stack] == expected
+    assert hash_array_batch(stack) == expected
+    assert all(isinstance(value, int) for value in hash_array_batch(stack))
+    assert hash_array_batch(stack[:0]) == []
+
+
+def test_hash_array_matches_dhash(image_file):
+    path = image_file(seed=4)
+    for height in (4, 8, 11):
+        dhash = DHash(path, height)
+        assert hash_array(numpy.asarray(dhash.image)) == dhash.hash_int
+        assert dhash.hash_int == DHash._pixels_to_int(
+            dhash.image.tobytes(), dhash.width, dhash.height
+        )
+
+
+def test_hash_array_errors():
+    with pytest.raises(ValueError):
+        hash_array(numpy.zeros((8, 8), dtype=numpy.uint8))
+    with pytest.raises(ValueError):
+        hash_array(numpy.zeros((2, 8, 9), dtype=numpy.uint8))
+    with pytest.raises(ValueError):
+        hash_array_batch(numpy.zeros((8, 9), dtype=numpy.uint8))
+    with pytest.raises(ValueError):
+        hash_array_batch(numpy.zeros((2, 8, 8), dtype=numpy.uint8))